@@ -1,7 +1,25 @@
 import cv2
-import tempfile
+import os
+import time
 import streamlit as st
-from ultralytics import YOLO
+from contextlib import nullcontext
+
+from vision import backends
+from vision.cascade import CascadeModel, EscalationPolicy
+from vision.counter import LineCounter
+from vision.decode import VideoReader, probe
+from vision.display import DisplayPublisher, Throttle
+from vision.events import EventQuery, EventStore, source_key
+from vision.export import CODECS, render_video
+from vision.metrics import Profiler
+from vision.pipeline import FramePipeline
+from vision.preprocess import Preprocessor, roi_around_line
+from vision.stride import StrideScheduler, StridedTracker
+from vision.streams import InferenceServer, Stream
+from vision.trackcache import TrackCacheWriter, cache_key, open_cache
+from vision.tracking import BatchTracker
+from vision.uploads import save_upload
+from vision.warmup import Preloader, warm_tracker, warm_up
 
 # 1. Cấu hình trang - Chuyển sang layout "centered" để giao diện gọn gàng hơn
 st.set_page_config(page_title="YOLOv8 Car Counter", layout="centered")
@@ -12,25 +30,130 @@ st.markdown("---")
 # 2. Sidebar chỉ giữ lại các thông số cấu hình phụ
 st.sidebar.header("Configuration")
 confidence = st.sidebar.slider("Confidence Threshold", 0.0, 1.0, 0.5)
+mode = st.sidebar.radio("Mode", ["Live preview", "Analyze file (batched)"])
+line_pct = st.sidebar.slider("Line position (% of height)", 10, 90, 60)
+# Tracking không phụ thuộc vị trí vạch -> dời vạch rồi chạy lại thì đếm thẳng từ cache
+use_track_cache = st.sidebar.checkbox("Reuse cached tracks (re-count without the model)", value=True)
+# Chế độ offline: detect N frame trong một lần gọi model, không hiển thị từng frame
+batch_size = st.sidebar.slider("Batch size", 1, 32, 8) if mode == "Analyze file (batched)" else 1
+# Kích thước ảnh đưa vào model + chỉ xử lý dải đường quanh vạch đếm (bỏ trời, vỉa hè)
+imgsz = st.sidebar.select_slider("Inference size (imgsz)", options=[320, 416, 480, 640, 800, 960, 1280], value=640)
+crop_roi = st.sidebar.checkbox("Only process the road strip around the line", value=False)
+roi_margin = st.sidebar.slider("Strip half-height (% of frame)", 10, 50, 25, disabled=not crop_roi)
+# Chạy detector thưa hơn, các frame ở giữa dùng box ngoại suy theo vận tốc track
+stride_options = {"Every frame": 1, "Every 2nd frame": 2, "Every 3rd frame": 3, "Every 4th frame": 4, "Adaptive (motion)": None}
+stride_option = st.sidebar.selectbox("Detector stride", list(stride_options))
+backend = st.sidebar.selectbox("Inference backend", ["pytorch", "auto", "onnx", "openvino"])
+# Cascade: yolov8n chạy mọi frame, yolov8m chỉ kiểm tra lại frame / vùng chưa chắc chắn
+cascade_options = {"yolov8m only": None, "Cascade n → m (full frame)": "frame", "Cascade n → m (crops)": "crop"}
+cascade_mode = cascade_options[st.sidebar.selectbox("Model", list(cascade_options))]
+# Giới hạn số frame/giây đẩy lên trình duyệt, model vẫn xử lý đủ mọi frame
+display_fps = st.sidebar.slider("Display FPS", 1, 30, 15)
+# p50/p95 từng tầng; bật export để ghi metrics/vehicles.jsonl + metrics/vehicles.prom (Prometheus)
+export_metrics = st.sidebar.checkbox("Export metrics to metrics/", value=False)
+# Ghi từng lượt xe qua vạch vào SQLite để xem lại số đếm theo giờ / ngày sau khi phiên kết thúc
+record_events = st.sidebar.checkbox("Record crossings to events/events.db", value=False)
+EVENTS_DB = os.path.join("events", "events.db")
+# Xuất video có chú thích: vẽ lại từ track đã cache, encoder chạy trên thread nền
+with st.sidebar.expander("Video export"):
+    export_codec = st.selectbox("Codec", list(CODECS))
+    export_bitrate = st.slider("Bitrate (Mbit/s)", 1, 20, 4)
 st_count_sidebar = st.sidebar.empty() # Chỗ hiển thị số lượng bên tay trái nếu cần
 
 # Load Model
+def read_model(purpose, backend, imgsz, batch=1, weights='yolov8m.pt'):
+    # Chế độ batch cần model riêng: `model.track` gắn callback tracker vào model,
+    # sau đó `model.predict` trên cùng model cũng sẽ bị tracking theo.
+    # ONNX / OpenVINO được export một lần (theo imgsz, batch) và cache trên đĩa.
+    model, actual_backend = backends.load_model(weights, backend, imgsz, batch=batch)
+    # Predict thử trên ảnh đen đúng imgsz / batch: frame thật đầu tiên không phải gánh cold start
+    warm_up(model, imgsz, batch=batch)
+    return model, actual_backend
+
+def load_model(purpose, backend, imgsz, batch=1, weights='yolov8m.pt'):
+    # Load + warm-up trên thread nền của Preloader, mỗi bộ tham số một lần cho cả process
+    return preloader.get((purpose, backend, imgsz, batch, weights), read_model, purpose, backend, imgsz, batch, weights)
+
+def make_model(purpose, backend, imgsz, batch=1, line=None, load=load_model):
+    # Cascade: mỗi chế độ một cặp model riêng (không gọi chung một model từ 2 thread)
+    if cascade_mode is None:
+        return load(purpose, backend, imgsz, batch)
+    small, actual = load(f"{purpose}-{cascade_mode}", backend, imgsz, batch, 'yolov8n.pt')
+    large, _ = load(f"{purpose}-{cascade_mode}", backend, imgsz, batch, 'yolov8m.pt')
+    return CascadeModel(small, large, EscalationPolicy(line=line, mode=cascade_mode)), actual
+
+def load_server(backend, imgsz, max_batch=8, cascade_mode=None):
+    # Một model + một thread inference dùng chung cho mọi phiên: frame của các
+    # phiên đang chạy được gom lô, còn tracker (ID, số đếm) thì mỗi phiên một bộ riêng.
+    # Với cascade, vạch đếm của từng phiên đi kèm mỗi frame gửi lên server.
+    # Đã chạy trên thread của Preloader -> load thẳng (không chờ một job khác của chính thread đó)
+    model, actual_backend = make_model("live", backend, imgsz, batch=max_batch, load=read_model)
+    warm_tracker()  # import module tracker của ultralytics trước khi phiên đầu tiên tạo tracker
+    return InferenceServer(model, max_batch=max_batch), actual_backend
+
+def close_server(entry):
+    # Mục bị bỏ khỏi Preloader: (server hoặc model, backend); model batch không cần đóng
+    if isinstance(entry[0], InferenceServer):
+        entry[0].close()
+
 @st.cache_resource
-def load_model():
-    return YOLO('yolov8m.pt')
+def get_preloader():
+    # Dùng chung cả process: import torch / ultralytics + load + warm-up model
+    # trên thread nền ngay lần chạy đầu, trang web hiển thị ngay không phải chờ.
+    # Chỉ giữ 3 mục gần nhất (server live + cặp model batch của cascade), server
+    # của cấu hình cũ được đóng khi không còn phiên nào dùng
+    return Preloader(max_entries=3, on_evict=close_server)
+
+preloader = get_preloader()
+server_key = ("live", backend, imgsz, cascade_mode)
+server_job = preloader.preload(server_key, load_server, backend, imgsz, cascade_mode=cascade_mode)
+if not server_job.done():
+    st.sidebar.caption("Loading and warming up the model in the background...")
+elif server_job.exception() is not None:
+    # Start sẽ thử load lại
+    st.sidebar.error(f"Model failed to load: {server_job.exception()}")
+else:
+    st.sidebar.caption(f"Backend in use: {server_job.result()[1]}")
+    if backends.fallback_reason(server_job.result()[0].model):
+        st.sidebar.warning(backends.fallback_reason(server_job.result()[0].model))
+
+def get_server():
+    # Chỉ chờ model khi thật sự cần (bấm Start / Export); đã load xong thì trả về ngay.
+    # Lease: phiên khác đổi cấu hình không đóng server khi phiên này còn dùng
+    return preloader.use(server_key, load_server, backend, imgsz, cascade_mode=cascade_mode)
+
+def draw_overlay(frame, boxes, ids, line_counter, pre, count):
+    # Dùng chung cho khung hình live và video xuất ra
+    if boxes is not None:
+        for box, obj_id in zip(boxes, ids):
+            cx = int((box[0] + box[2]) / 2)
+            cy = int((box[1] + box[3]) / 2)
 
-model = load_model()
+            # Vẽ tâm và ID
+            cv2.circle(frame, (cx, cy), 4, (0, 255, 0), -1)
+            cv2.putText(frame, f"ID: {obj_id}", (cx, cy - 10), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+    # Vẽ vạch kẻ và hiển thị số lượng
+    line_counter.draw(frame)
+    pre.draw(frame)
+    cv2.putText(frame, f"Count: {count}", (50, 80), 
+                cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3)
 
 # 3. Khu vực chính: Upload file nằm ngay giữa
 uploaded_file = st.file_uploader("📤 Drag and drop your video here", type=['mp4', 'avi', 'mov'])
 
 if uploaded_file is not None:
-    # Lưu file upload vào temp
-    tfile = tempfile.NamedTemporaryFile(delete=False)
-    tfile.write(uploaded_file.read())
-    video_path = tfile.name
+    # Ghi file upload ra đĩa theo từng chunk (trùng nội dung thì dùng lại file cũ)
+    video_path = save_upload(uploaded_file)
 
-    cap = cv2.VideoCapture(video_path)
+    # Chỉ phân tích một khoảng của bản ghi dài: seek tới keyframe gần nhất thay vì đọc từ đầu
+    duration = round(probe(video_path)["duration"], 1)
+    window = st.slider("Analyze window (seconds)", 0.0, max(duration, 0.1), (0.0, max(duration, 0.1)), step=0.5)
+    start_s = window[0] or None
+    end_s = window[1] if window[1] < duration else None
+    # Frame đọc vào vòng buffer dùng lại; chế độ batch giữ cả lô frame cùng lúc nên cần đủ buffer
+    cap = VideoReader(video_path, start=start_s, end=end_s, buffers=max(16, batch_size + 2))
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     
@@ -41,51 +164,203 @@ if uploaded_file is not None:
     with col2:
         st_frame = st.empty() # Video sẽ hiển thị ở đây
         start_btn = st.button("🚀 Start Counting", use_container_width=True)
-    
+        export_btn = st.button("🎬 Export annotated video", use_container_width=True)
+
+    line_y = int(height * line_pct / 100)
+    roi = roi_around_line(line_y, width, height, roi_margin / 100) if crop_roi else None
+    pre = Preprocessor(imgsz, roi)
+    # Đếm khi tâm xe cắt qua vạch giữa 2 frame liên tiếp (không bỏ sót xe chạy nhanh)
+    line_counter = LineCounter([(0, line_y), (width, line_y)])
+    # Vạch đếm theo tỉ lệ của ảnh đưa vào model (dải ROI nếu có) cho cascade
+    y1, y2 = (pre.roi[1], pre.roi[3]) if pre.roi else (0, height)
+    model_line = [(0, (line_y - y1) / max(y2 - y1, 1)), (1, (line_y - y1) / max(y2 - y1, 1))]
+
+    def track_cache_id():
+        # Khóa cache gồm mọi thứ ảnh hưởng tới box / ID (không gồm vị trí vạch đếm)
+        stride_key = 1 if mode == "Analyze file (batched)" else (stride_options[stride_option] or "adaptive")
+        model_key, extra = "yolov8m.pt", {}
+        if cascade_mode is not None:
+            # Cascade phụ thuộc cả vị trí vạch (frame gần vạch được kiểm tra lại bằng model lớn)
+            model_key, extra = "yolov8n.pt>yolov8m.pt", {"cascade": EscalationPolicy(line=model_line, mode=cascade_mode).key()}
+        return cache_key(
+            video_path, model_key, backend=actual_backend, imgsz=imgsz, conf=confidence,
+            classes=[2, 5, 7], roi=pre.roi, tracker="bytetrack.yaml", stride=stride_key, window=[start_s, end_s], **extra,
+        )
+
+    if export_btn:
+        # Chỉ giải mã + vẽ + encode, không chạy model -> không tranh CPU với phiên đếm live
+        cap.release()
+        with get_server() as (_, actual_backend):  # backend thực tế nằm trong khóa cache
+            cached = open_cache(track_cache_id())
+        if cached is None:
+            st.warning("No cached tracks for these settings yet. Run Start Counting once with 'Reuse cached tracks' enabled, then export.")
+        else:
+            out_path = os.path.join("output", f"{os.path.splitext(uploaded_file.name)[0]}_annotated.mp4")
+            progress_bar = st.progress(0)
+
+            def draw(frame, tracks, idx):
+                boxes, ids = (tracks.xyxy, tracks.ids) if len(tracks.ids) else (None, None)
+                if boxes is not None:
+                    line_counter.update(boxes, ids, idx)
+                draw_overlay(frame, boxes, ids, line_counter, pre, line_counter.count)
+                return frame
+
+            t0 = time.perf_counter()
+            stats = render_video(video_path, cached.__getitem__, out_path, draw, start=start_s, end=end_s,
+                                 progress=progress_bar.progress, codec=export_codec, bitrate=export_bitrate * 1e6)
+            progress_bar.progress(1.0)
+            st.success(f"✅ Exported {stats['written']} frames to {out_path} in {time.perf_counter() - t0:.1f}s ({stats['codec']})")
+            with open(out_path, "rb") as f:
+                st.download_button("⬇️ Download", f, file_name=os.path.basename(out_path), mime="video/mp4")
+
     if start_btn:
-        line_y = int(height * 0.6)
-        counter = 0
-        counted_ids = set()
-
-        while cap.isOpened():
-            success, frame = cap.read()
-            if not success:
-                st.success("✅ Video processing completed!")
-                break
-
-            # Tracking
-            results = model.track(frame, persist=True, conf=confidence, classes=[2, 5, 7], tracker="bytetrack.yaml")
-
-            if results[0].boxes.id is not None:
-                boxes = results[0].boxes.xyxy.cpu().numpy()
-                ids = results[0].boxes.id.cpu().numpy().astype(int)
-
-                for box, obj_id in zip(boxes, ids):
-                    cx = int((box[0] + box[2]) / 2)
-                    cy = int((box[1] + box[3]) / 2)
-
-                    # Vẽ tâm và ID
-                    cv2.circle(frame, (cx, cy), 4, (0, 255, 0), -1)
-                    cv2.putText(frame, f"ID: {obj_id}", (cx, cy - 10), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-                    # Logic đếm
-                    if line_y - 10 < cy < line_y + 10:
-                        if obj_id not in counted_ids:
-                            counter += 1
-                            counted_ids.add(obj_id)
-
-            # Vẽ vạch kẻ và hiển thị số lượng
-            cv2.line(frame, (0, line_y), (width, line_y), (0, 0, 255), 3)
-            cv2.putText(frame, f"Count: {counter}", (50, 80), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3)
-
-            # Cập nhật số liệu đồng thời ở cả main UI và sidebar
-            st_count_sidebar.metric("Total Vehicles", counter)
-
-            # Hiển thị frame
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            # Dùng use_container_width=True để nó vừa khít với độ rộng của col2
-            st_frame.image(frame, channels="RGB", use_container_width=True)
-
-        cap.release()
\ No newline at end of file
+        if stride_options[stride_option] is None:
+            scheduler = StrideScheduler(adaptive=True, max_stride=4)
+        else:
+            scheduler = StrideScheduler(stride=stride_options[stride_option])
+        profiler = Profiler()
+        # Thời gian còn phải chờ model (0 nếu đã preload xong) -> time-to-first-frame
+        started_at = time.perf_counter()
+        server_lease = get_server()
+        server, actual_backend = server_lease.value
+        profiler.gauge("model_wait_s", round(time.perf_counter() - started_at, 3))
+        stream = Stream("vehicles", server, conf=confidence, classes=[2, 5, 7], preprocessor=pre, profiler=profiler, line=model_line if cascade_mode else None)
+        strided = StridedTracker(stream.track, scheduler)
+
+        cache_id = track_cache_id()
+        cached = open_cache(cache_id) if use_track_cache else None
+        if cached is not None:
+            st.info(f"Using cached tracks ({len(cached)} frames) - the model is not run.")
+        writer = None
+        writer_ctx = TrackCacheWriter(cache_id, video=os.path.basename(video_path)) if use_track_cache and cached is None else nullcontext()
+
+        # Video upload không có giờ ghi hình: thời điểm sự kiện = lúc bấm Start + vị trí trong video
+        run_started = time.time()
+        video_fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        # Chạy lại cùng file thì thay sự kiện cũ app này ghi cho file đó (tên file upload lưu theo hash nội dung)
+        events_source = source_key("app-vehicles", uploaded_file.name, os.path.splitext(os.path.basename(video_path))[0])
+        events_ctx = EventStore(EVENTS_DB, source=events_source, replace=True) if record_events else nullcontext()
+        events = None
+
+        def count_line(tracks, idx):
+            crossed, directions = line_counter.update(tracks.xyxy, tracks.ids, idx)
+            if events is not None:
+                events.add_crossings(run_started + idx / video_fps, tracks, crossed, directions, zone="line")
+
+        # Tầng infer: tracking + logic đếm, chạy trên thread riêng cho MỌI frame
+        def infer(frame, idx):
+            if cached is not None:
+                tracks = cached[idx]
+            else:
+                tracks, _ = strided.step(frame, idx)
+                if writer is not None:
+                    writer.add(idx, tracks)
+
+            boxes, ids = None, None
+            if len(tracks.ids):
+                boxes, ids = tracks.xyxy, tracks.ids
+                with profiler.stage("count"):
+                    count_line(tracks, idx)
+
+            return boxes, ids, line_counter.count
+
+        st_profile = st.sidebar.expander("Profiling (p50 / p95)", expanded=True).empty()
+
+        startup = {}
+
+        def first_frame():
+            # Từ lúc bấm Start tới frame đầu tiên được xử lý / hiển thị (gồm cả thời gian chờ model)
+            if not startup:
+                startup["time_to_first_frame_s"] = round(time.perf_counter() - started_at, 3)
+                profiler.gauge("time_to_first_frame_s", startup["time_to_first_frame_s"])
+                st.sidebar.expander("Startup").json({**startup, **preloader.stats()})
+
+        def report_metrics():
+            profiler.gauge("active_tracks", len(line_counter.store))
+            profiler.gauge("vehicles_total", line_counter.count)
+            st_profile.dataframe(profiler.table(), hide_index=True)
+            if export_metrics:
+                profiler.write_jsonl("metrics/vehicles.jsonl", app="vehicles", backend=actual_backend, imgsz=imgsz)
+                profiler.write_prometheus("metrics/vehicles.prom", labels={"app": "vehicles"})
+
+        if mode == "Analyze file (batched)":
+            # Detect theo lô, ByteTrack ghép ID tuần tự -> số đếm giống chế độ live
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            progress_bar = st.progress(0)
+            if cached is not None:
+                # Không cần giải mã video lẫn chạy model: đếm lại trên box đã cache
+                cap.release()
+                tracks_iter = iter(cached)
+            else:
+                batch_model = make_model("batch", backend, imgsz, batch_size, line=model_line)[0]
+                tracker = BatchTracker(batch_model, batch_size=batch_size, preprocessor=pre, conf=confidence, classes=[2, 5, 7])
+                tracks_iter = ((idx, tracks) for idx, _, tracks in tracker.iter_video(cap))
+            t0 = time.perf_counter()
+            frame_count = 0
+            with server_lease, writer_ctx as writer, events_ctx as events:
+                for idx, tracks in tracks_iter:
+                    if writer is not None:
+                        writer.add(idx, tracks)
+                    with profiler.stage("count"):
+                        count_line(tracks, idx)
+                    if frame_count == 0:
+                        first_frame()
+                    frame_count += 1
+                    if frame_count % batch_size == 0 and total_frames > 0:
+                        progress_bar.progress(min(frame_count / total_frames, 1.0))
+                        st_count_sidebar.metric("Total Vehicles", line_counter.count)
+                    if frame_count % 240 == 0:
+                        report_metrics()
+            elapsed = time.perf_counter() - t0
+            report_metrics()
+
+            progress_bar.progress(1.0)
+            st_count_sidebar.metric("Total Vehicles", line_counter.count)
+            st.metric("Throughput (frames/s)", round(frame_count / elapsed, 2) if elapsed > 0 else 0.0)
+            if cached is None and isinstance(batch_model, CascadeModel):
+                # Tỉ lệ frame phải chạy thêm model lớn và lý do
+                st.json(batch_model.stats())
+        else:
+            st_pipeline_stats = st.sidebar.empty()
+            publisher = DisplayPublisher(st_frame, fps=display_fps)
+
+            def pipeline_stats():
+                stats = {**pipeline.snapshot(), "display": publisher.stats(), "tracks": line_counter.store.stats(), "detect_ratio": round(strided.detect_ratio, 3)}
+                if isinstance(server.model, CascadeModel):
+                    # Server dùng chung: thống kê gồm cả frame của các phiên khác
+                    stats["cascade"] = server.model.stats()
+                return stats
+
+            # Tầng render/publish: vẽ + đẩy lên trình duyệt, frame cũ sẽ bị bỏ qua nếu UI chậm
+            # Độ sâu hàng đợi + thời gian từng tầng: mỗi giây một lần
+            stats_throttle = Throttle(1.0)
+            # Track của lần chạy này được ghi vào cache khi chạy hết video
+            with server_lease, writer_ctx as writer, events_ctx as events:
+                with FramePipeline(cap, infer, profiler=profiler) as pipeline:
+                    for idx, frame, (boxes, ids, counter) in pipeline:
+                        # Số đếm chỉ render lại khi thay đổi
+                        publisher.metric(st_count_sidebar, "Total Vehicles", counter)
+
+                        # Chưa tới lượt hiển thị -> bỏ qua cả bước vẽ
+                        if publisher.due():
+                            with profiler.stage("draw"):
+                                draw_overlay(frame, boxes, ids, line_counter, pre, counter)
+
+                            # Thu nhỏ + nén JPEG rồi mới gửi, ảnh vừa khít độ rộng của col2
+                            with profiler.stage("publish"):
+                                publisher.publish(frame)
+                            first_frame()
+
+                        if stats_throttle.due():
+                            st_pipeline_stats.json(pipeline_stats())
+                            report_metrics()
+
+            report_metrics()
+            st_pipeline_stats.json(pipeline_stats())
+        if record_events:
+            # Đọc lại từ DB (bảng cộng dồn theo phút), không phụ thuộc trạng thái trong bộ nhớ
+            with st.expander("Event history (per minute)"):
+                query = EventQuery(EVENTS_DB)
+                st.dataframe(query.counts("1m", sources=[events_source], by=("cls", "direction")), hide_index=True)
+                query.close()
+        st.success("✅ Video processing completed!")
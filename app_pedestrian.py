@@ -1,27 +1,33 @@
 import cv2
-import tempfile
-import numpy as np
+import os
+import time
 import streamlit as st
-from collections import deque
-from ultralytics import YOLO
+from contextlib import nullcontext
+
+from vision import backends
+from vision.analytics import OccupancyHeatmap, ZoneAnalytics, parse_zones
+from vision.counter import HitCounter, LineCounter, anchor_points
+from vision.decode import VideoReader, probe
+from vision.display import DisplayPublisher, Throttle
+from vision.events import EventStore, source_key
+from vision.export import CODECS, render_video
+from vision.metrics import Profiler
+from vision.overlay import OverlayRenderer
+from vision.pipeline import FramePipeline
+from vision.preprocess import Preprocessor
+from vision.stride import StrideScheduler, StridedTracker
+from vision.streams import InferenceServer, Stream
+from vision.trackcache import TrackCacheWriter, cache_key, open_cache
+from vision.tracks import TrackStore
+from vision.uploads import save_upload
+from vision.warmup import Preloader, warm_tracker, warm_up
 
 # 1. Cấu hình trang
 st.set_page_config(page_title="AI Pedestrian Analysis", layout="wide")
 st.title("🚶 AI Pedestrian Counting")
 st.markdown("Hệ thống đếm người đi bộ trong video (Đã lọc nhiễu ID).")
 
-# 2. Load Model
-@st.cache_resource
-def load_model():
-    return YOLO('yolov8n.pt')
-
-try:
-    model = load_model()
-except Exception as e:
-    st.error(f"Lỗi tải model: {e}")
-    st.stop()
-
-# 3. Sidebar Cấu hình
+# 2. Sidebar Cấu hình
 st.sidebar.header("⚙️ Cấu hình")
 conf_threshold = st.sidebar.slider("Độ nhạy (Confidence)", 0.3, 1.0, 0.5)
 
@@ -32,89 +38,314 @@ min_hits = st.sidebar.slider(
     help="Một người phải xuất hiện liên tục trong N frame thì mới được tính. Giúp loại bỏ rác hoặc nhận diện chập chờn."
 )
 
+# Kích thước ảnh đưa vào model (nhỏ hơn -> nhanh hơn, người ở xa có thể bị sót)
+imgsz = st.sidebar.select_slider("Kích thước ảnh inference (imgsz)", options=[320, 416, 480, 640, 800, 960, 1280], value=640)
+pre = Preprocessor(imgsz)
+
+# Backend inference: model được export một lần và cache trên đĩa (ONNX Runtime / OpenVINO)
+backend = st.sidebar.selectbox("Backend inference", ["pytorch", "auto", "onnx", "openvino"])
+
+# Chạy detector mỗi k frame (hoặc khi có chuyển động), frame ở giữa dùng box ngoại suy
+stride = st.sidebar.select_slider("Chạy model mỗi k frame", options=[1, 2, 3, 4], value=1)
+adaptive_stride = st.sidebar.checkbox("Tự động theo chuyển động (tối đa 4 frame)", value=False)
+
+# Tùy chọn: đếm thêm số người đi qua một vạch ngang (dùng chung bộ đếm với app.py)
+use_line = st.sidebar.checkbox("Đếm người qua vạch kẻ", value=False)
+line_ratio = st.sidebar.slider("Vị trí vạch (% chiều cao)", 10, 90, 50, disabled=not use_line)
+
+# Số frame/giây hiển thị trên trình duyệt, model vẫn xử lý đủ mọi frame
+display_fps = st.sidebar.slider("FPS hiển thị", 1, 30, 15)
+# Tắt vẽ chú thích khi chỉ cần số đếm (cảnh rất đông thì vẽ tốn hơn cả tracking)
+draw_annotations = st.sidebar.checkbox("Vẽ box / quỹ đạo lên video", value=True)
+# Đổi min_hits / vạch đếm không cần chạy lại model: đếm lại trên track đã cache
+use_track_cache = st.sidebar.checkbox("Dùng lại kết quả tracking đã cache", value=True)
+# Thời gian từng tầng (p50/p95); bật export để ghi metrics/pedestrians.jsonl + .prom (Prometheus)
+export_metrics = st.sidebar.checkbox("Ghi metrics ra thư mục metrics/", value=False)
+# Ghi từng người được đếm / lượt qua vạch vào SQLite, xem lại: python -m vision.events events/events.db
+record_events = st.sidebar.checkbox("Ghi sự kiện đếm vào events/events.db", value=False)
+# Heatmap mật độ + thời gian lưu lại / luồng đi giữa các vùng (cộng dồn, bộ nhớ cố định)
+with st.sidebar.expander("📊 Heatmap & vùng"):
+    use_analytics = st.checkbox("Bật phân tích không gian", value=False)
+    show_heatmap = st.checkbox("Phủ heatmap lên video", value=False, disabled=not use_analytics)
+    zones_text = st.text_area(
+        "Vùng (mỗi dòng `tên: x,y x,y x,y ...`, % khung hình)",
+        "Trái: 0,0 50,0 50,100 0,100\nPhải: 50,0 100,0 100,100 50,100",
+        disabled=not use_analytics,
+    )
+# Xuất video có chú thích: vẽ lại từ track đã cache, không chạy model
+with st.sidebar.expander("🎬 Xuất video"):
+    export_codec = st.selectbox("Codec", list(CODECS))
+    export_bitrate = st.slider("Bitrate (Mbit/s)", 1, 20, 4)
+
+# 3. Load Model
+def load_server(backend, imgsz, max_batch=8):
+    # Model dùng chung cho mọi phiên (gom lô frame), tracker riêng theo từng phiên
+    model, actual_backend = backends.load_model('yolov8n.pt', backend, imgsz, batch=max_batch)
+    # Predict thử + tạo tracker một lần: frame thật đầu tiên không phải gánh cold start
+    warm_up(model, imgsz, batch=max_batch)
+    warm_tracker()
+    return InferenceServer(model, max_batch=max_batch), actual_backend
+
+@st.cache_resource
+def get_preloader():
+    # Dùng chung cả process: import torch / ultralytics + load model trên thread nền, trang hiển thị ngay.
+    # Chỉ giữ server của cấu hình mới nhất, server cũ được đóng khi không còn phiên nào dùng
+    return Preloader(max_entries=1, on_evict=lambda entry: entry[0].close())
+
+preloader = get_preloader()
+server_job = preloader.preload((backend, imgsz), load_server, backend, imgsz)
+if not server_job.done():
+    st.sidebar.caption("Đang tải và warm-up model ở chế độ nền...")
+elif server_job.exception() is not None:
+    # Bấm phân tích sẽ thử tải lại
+    st.sidebar.error(f"Lỗi tải model: {server_job.exception()}")
+else:
+    st.sidebar.caption(f"Backend đang dùng: {server_job.result()[1]}")
+    if backends.fallback_reason(server_job.result()[0].model):
+        st.sidebar.warning(backends.fallback_reason(server_job.result()[0].model))
+
+def get_server():
+    # Chỉ chờ model khi bấm phân tích / xuất video; lỗi thì lần sau được tải lại.
+    # Lease: phiên khác đổi cấu hình không đóng server khi phiên này còn dùng
+    try:
+        return preloader.use((backend, imgsz), load_server, backend, imgsz)
+    except Exception as e:
+        st.error(f"Lỗi tải model: {e}")
+        st.stop()
+
 # 4. Biến toàn cục
-track_history = {} 
-total_unique_ids = set() 
-id_life_count = {} # Biến đếm tuổi thọ ID
+# Quỹ đạo 40 điểm gần nhất của mỗi người, ID biến mất lâu sẽ tự được giải phóng
+track_history = TrackStore(capacity=1024, history=40, max_idle=150)
+hit_counter = HitCounter(min_hits) # Đếm ID duy nhất + tuổi thọ ID (Anti-Flicker)
 
 metric_placeholder = st.empty()
+line_placeholder = st.empty()
 st_frame = st.empty()
+memory_placeholder = st.sidebar.empty()
+profile_placeholder = st.sidebar.expander("⏱️ Thời gian xử lý (p50 / p95)", expanded=True).empty()
+startup_placeholder = st.sidebar.expander("🚀 Khởi động").empty()
+heatmap_placeholder = st.empty()
+zones_placeholder = st.empty()
+
+def analyze(tracks, idx, line_counter, heatmap=None, zones=None, events=None, ts=None):
+    # Anti-Flicker + quỹ đạo (+ heatmap / vùng / ghi sự kiện lúc `ts`) cho một frame, dùng chung cho phân tích live và xuất video
+    if not len(tracks.ids):
+        return None
+    boxes = tracks.xyxy
+    track_ids = tracks.ids
+
+    # --- LOGIC CHỐNG NHIỄU (ANTI-FLICKER) ---
+    # Tăng tuổi thọ của tất cả ID trong frame cùng lúc
+    life_counts, counted = hit_counter.update(track_ids, idx)
+    if events is not None:
+        events.add_crossings(ts, tracks, hit_counter.newly_counted, zone="unique")
+    if line_counter is not None:
+        crossed, directions = line_counter.update(boxes, track_ids, idx)
+        if events is not None:
+            events.add_crossings(ts, tracks, crossed, directions, zone="line")
+
+    # Ghi tâm của các ID đã đếm vào quỹ đạo (ring buffer)
+    traj_slots, _ = track_history.touch(track_ids[counted], idx)
+    points = anchor_points(boxes[counted])
+    track_history.append(traj_slots, points)
+    # Chỉ cộng dồn người đã qua Anti-Flicker (ID chập chờn không làm nhiễu heatmap / lượt vào vùng)
+    if heatmap is not None or zones is not None:
+        # Vị trí chân (giữa cạnh đáy box) mới cho biết người đang đứng ở vùng nào
+        feet = anchor_points(boxes[counted], "bottom")
+        if heatmap is not None:
+            heatmap.update(feet)
+        if zones is not None:
+            zones.update(feet, track_ids[counted], idx)
+    traj_points, traj_lens = track_history.trails(traj_slots)
+    return boxes, track_ids, life_counts, counted, traj_points, traj_lens
+
+def draw_overlay(frame, result, line_counter, renderer):
+    # Quỹ đạo (bán trong suốt) -> box + nhãn -> vạch đếm, vẽ thẳng lên frame
+    if not renderer.enabled:
+        return frame
+    if result is not None:
+        boxes, track_ids, life_counts, counted, traj_points, traj_lens = result
+        renderer.trails(frame, traj_points, traj_lens)
+        # Xanh = đang theo dõi, đỏ = đã đếm (tồn tại đủ min_hits frame); số trong ngoặc là tuổi thọ ID
+        labels = None
+        if len(boxes) <= renderer.max_labels:
+            labels = [f"ID:{i} ({life})" if c else f"Tracking... ({life})" for i, life, c in zip(track_ids, life_counts, counted)]
+        renderer.boxes(frame, boxes, groups=counted, labels=labels)
+    if line_counter is not None:
+        line_counter.draw(frame)
+    return frame
 
 # 5. Giao diện Upload
 uploaded_file = st.file_uploader("📂 Chọn video CCTV / Người đi bộ (mp4, avi)", type=['mp4', 'avi', 'mov'])
 
 if uploaded_file:
-    # Lưu file tạm
-    tfile = tempfile.NamedTemporaryFile(delete=False)
-    tfile.write(uploaded_file.read())
-    
-    if st.button("▶️ Bắt đầu phân tích"):
-        cap = cv2.VideoCapture(tfile.name)
+    # Lưu file tạm (ghi theo chunk, upload trùng nội dung không ghi lại)
+    video_path = save_upload(uploaded_file)
+    info = probe(video_path)
+
+    def make_line_counter():
+        if not use_line:
+            return None
+        line_y = int(info["height"] * line_ratio / 100)
+        return LineCounter([(0, line_y), (info["width"], line_y)], anchor="bottom")
+
+    def track_cache_id():
+        # Khóa cache: video + model + cấu hình tracking (không gồm min_hits / vạch đếm)
+        return cache_key(
+            video_path, "yolov8n.pt", backend=actual_backend, imgsz=imgsz, conf=conf_threshold,
+            classes=[0], tracker="bytetrack.yaml", stride="adaptive" if adaptive_stride else stride,
+        )
+
+    col_start, col_export = st.columns(2)
+    start_btn = col_start.button("▶️ Bắt đầu phân tích")
+    export_btn = col_export.button("🎬 Xuất video có chú thích")
+
+    if export_btn:
+        # Chỉ giải mã + vẽ + encode trên track đã cache, không tranh CPU với model
+        with get_server() as (_, actual_backend):  # backend thực tế nằm trong khóa cache
+            cached = open_cache(track_cache_id())
+        if cached is None:
+            st.warning("Chưa có track đã cache cho cấu hình này. Hãy bật 'Dùng lại kết quả tracking đã cache' và phân tích hết video một lần trước.")
+        else:
+            line_counter = make_line_counter()
+            out_path = os.path.join("output", f"{os.path.splitext(uploaded_file.name)[0]}_annotated.mp4")
+            progress_bar = st.progress(0)
+            renderer = OverlayRenderer()
+
+            def draw(frame, tracks, idx):
+                return draw_overlay(frame, analyze(tracks, idx, line_counter), line_counter, renderer)
+
+            t0 = time.perf_counter()
+            stats = render_video(video_path, cached.__getitem__, out_path, draw, progress=progress_bar.progress,
+                                 codec=export_codec, bitrate=export_bitrate * 1e6)
+            progress_bar.progress(1.0)
+            st.success(f"Đã xuất {stats['written']} frame ra {out_path} trong {time.perf_counter() - t0:.1f}s ({stats['codec']}), tổng số người: {hit_counter.count}")
+            with open(out_path, "rb") as f:
+                st.download_button("⬇️ Tải video", f, file_name=os.path.basename(out_path), mime="video/mp4")
+
+    if start_btn:
+        # Đọc vào vòng buffer cấp phát sẵn thay vì tạo frame mới mỗi lần
+        cap = VideoReader(video_path)
         
         if cap.isOpened():
-            stop_btn = st.button("Dừng lại")
+            # Bấm Dừng -> Streamlit chạy lại script, lượt phân tích này bị ngắt (cache dở bị bỏ)
+            st.button("Dừng lại")
             
             # Progress bar
             total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            line_counter = make_line_counter()
+            heatmap, zones = None, None
+            if use_analytics:
+                try:
+                    zones = ZoneAnalytics(parse_zones(zones_text, info["width"], info["height"]), fps=info["fps"])
+                except ValueError as e:
+                    st.error(f"Vùng không hợp lệ: {e}")
+                    st.stop()
+                heatmap = OccupancyHeatmap(info["width"], info["height"], cell=16, fps=info["fps"])
+                analytics_stem = os.path.join("output", "analytics", os.path.splitext(uploaded_file.name)[0])
             progress_bar = st.progress(0)
-            frame_count = 0
-            
-            while cap.isOpened() and not stop_btn:
-                success, frame = cap.read()
-                if not success: break
-                
-                frame_count += 1
-                if frame_count % 5 == 0: # Cập nhật thanh tiến trình mỗi 5 frame để đỡ lag
-                    progress_bar.progress(frame_count / total_frames)
-
-                overlay = frame.copy()
-                
-                # Tracking
-                results = model.track(frame, classes=[0], conf=conf_threshold, persist=True, tracker="bytetrack.yaml", verbose=False)
-                
-                if results[0].boxes.id is not None:
-                    boxes = results[0].boxes.xyxy.cpu().numpy()
-                    track_ids = results[0].boxes.id.cpu().numpy().astype(int)
-                    
-                    for box, track_id in zip(boxes, track_ids):
-                        x1, y1, x2, y2 = box
-                        
-                        # --- LOGIC CHỐNG NHIỄU (ANTI-FLICKER) ---
-                        # 1. Tăng tuổi thọ ID
-                        id_life_count[track_id] = id_life_count.get(track_id, 0) + 1
-                        
-                        color = (0, 255, 0) # Xanh (Chưa đếm)
-                        status_text = "Tracking..."
-                        
-                        # 2. Chỉ ĐẾM khi ID tồn tại đủ lâu ( > min_hits)
-                        if id_life_count[track_id] > min_hits:
-                            total_unique_ids.add(track_id)
-                            color = (0, 0, 255) # Đỏ (Đã đếm)
-                            status_text = f"ID:{track_id}"
-                            
-                            # Vẽ đường đi (Heatmap)
-                            cx, cy = int((x1 + x2) / 2), int((y1 + y2) / 2)
-                            if track_id not in track_history:
-                                track_history[track_id] = deque(maxlen=40)
-                            track_history[track_id].append((cx, cy))
-                            
-                            points = np.hstack(track_history[track_id]).astype(np.int32).reshape((-1, 1, 2))
-                            cv2.polylines(overlay, [points], isClosed=False, color=(255, 255, 0), thickness=3)
-
-                        # Vẽ Box
-                        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
-                        # Hiển thị số frame đã tồn tại để debug dễ hơn
-                        cv2.putText(frame, f"{status_text} ({id_life_count[track_id]})", (int(x1), int(y1)-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-
-                # Gộp lớp phủ
-                frame = cv2.addWeighted(overlay, 0.4, frame, 0.6, 0)
-
-                # Hiển thị kết quả
-                metric_placeholder.metric("👥 Tổng số người (Đã lọc nhiễu)", len(total_unique_ids))
-                
-                # Resize để hiển thị mượt hơn trên web
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                st_frame.image(frame_rgb, channels="RGB", width=1000)
-
-            cap.release()
+            profiler = Profiler()
+            # Thời gian còn phải chờ model (0 nếu đã preload xong)
+            started_at = time.perf_counter()
+            server_lease = get_server()
+            server, actual_backend = server_lease.value
+            profiler.gauge("model_wait_s", round(time.perf_counter() - started_at, 3))
+            stream = Stream("pedestrians", server, conf=conf_threshold, classes=[0], preprocessor=pre, profiler=profiler)
+            strided = StridedTracker(
+                stream.track,
+                StrideScheduler(stride=stride, adaptive=adaptive_stride, max_stride=4),
+            )
+
+            cache_id = track_cache_id()
+            cached = open_cache(cache_id) if use_track_cache else None
+            if cached is not None:
+                # Có cache -> ra ngay tổng số người theo min_hits mới, không cần chờ phát hết video
+                quick = HitCounter(min_hits)
+                for idx, tracks in cached:
+                    quick.update(tracks.ids, idx)
+                st.info(f"Dùng track đã cache ({len(cached)} frame), không chạy model. Tổng số người với min_hits={min_hits}: {quick.count}")
+            writer = None
+            writer_ctx = TrackCacheWriter(cache_id, video=os.path.basename(video_path)) if use_track_cache and cached is None else nullcontext()
+            # Thời điểm sự kiện = lúc bấm phân tích + vị trí trong video; chạy lại cùng file thì thay sự kiện cũ
+            run_started = time.time()
+            events = None
+            events_source = source_key("app-pedestrians", uploaded_file.name, os.path.splitext(os.path.basename(video_path))[0])
+            events_ctx = EventStore(os.path.join("events", "events.db"), source=events_source, replace=True) if record_events else nullcontext()
+
+            # Tracking + đếm chạy trên thread riêng cho MỌI frame, không chờ trình duyệt
+            def infer(frame, idx):
+                if cached is not None:
+                    tracks = cached[idx]
+                else:
+                    tracks, _ = strided.step(frame, idx)
+                    if writer is not None:
+                        writer.add(idx, tracks)
+                with profiler.stage("count"):
+                    return analyze(tracks, idx, line_counter, heatmap, zones, events, run_started + idx / (info["fps"] or 30))
+
+            def report_analytics(save=False):
+                # Snapshot đọc thẳng trạng thái cộng dồn, không cần phát lại video
+                if heatmap is None:
+                    return
+                heatmap_placeholder.image(heatmap.image((480, int(480 * info["height"] / info["width"]))), channels="BGR", caption="Heatmap mật độ")
+                zones_placeholder.dataframe(zones.table(), hide_index=True)
+                if save:
+                    heatmap.save(analytics_stem + ".heatmap.npz")
+                    zones.save(analytics_stem + ".zones.json", zones.store.frame)
+
+            def report_metrics():
+                profiler.gauge("active_tracks", len(hit_counter.store))
+                profiler.gauge("pedestrians_total", hit_counter.count)
+                profile_placeholder.dataframe(profiler.table(), hide_index=True)
+                if export_metrics:
+                    profiler.write_jsonl("metrics/pedestrians.jsonl", app="pedestrians", backend=actual_backend, imgsz=imgsz)
+                    profiler.write_prometheus("metrics/pedestrians.prom", labels={"app": "pedestrians"})
+
+            publisher = DisplayPublisher(st_frame, fps=display_fps, max_width=1000)
+            first_frame_s = None
+            renderer = OverlayRenderer(enabled=draw_annotations)
+            # Tiến trình / thống kê theo thời gian, không theo idx (pipeline bỏ frame cũ nên idx nhảy cóc)
+            progress_throttle, stats_throttle, save_throttle = Throttle(0.2), Throttle(1.0), Throttle(10.0)
+            # Track được ghi vào cache khi phân tích hết video (bấm Dừng thì bỏ)
+            with server_lease, writer_ctx as writer, events_ctx as events:
+                with FramePipeline(cap, infer, profiler=profiler) as pipeline:
+                    for idx, frame, result in pipeline:
+                        frame_count = idx + 1
+                        if total_frames > 0 and progress_throttle.due(): # Không cập nhật thanh tiến trình mỗi frame để đỡ lag
+                            progress_bar.progress(min(frame_count / total_frames, 1.0))
+
+                        # Hiển thị kết quả (chỉ render lại khi số thay đổi)
+                        publisher.metric(metric_placeholder, "👥 Tổng số người (Đã lọc nhiễu)", hit_counter.count)
+                        if line_counter is not None:
+                            publisher.metric(line_placeholder, "↕️ Qua vạch (lên / xuống)", f"{line_counter.in_count} / {line_counter.out_count}")
+                        if stats_throttle.due():
+                            # Bộ nhớ trạng thái track (số track đang giữ, số đã giải phóng)
+                            memory_placeholder.json({"trajectories": track_history.stats(), "anti_flicker": hit_counter.store.stats(), "display": publisher.stats()})
+                            report_metrics()
+                            # Lưu snapshot ra đĩa định kỳ (~ mỗi 10 giây) để xem được khi đang chạy
+                            report_analytics(save=save_throttle.due())
+
+                        # Chưa tới lượt hiển thị -> không cần vẽ
+                        if not publisher.due():
+                            continue
+
+                        with profiler.stage("draw"):
+                            if heatmap is not None and show_heatmap:
+                                heatmap.render(frame, alpha=0.4)
+                            frame = draw_overlay(frame, result, line_counter, renderer)
+                            if zones is not None and renderer.enabled:
+                                zones.draw(frame)
+
+                        # Thu nhỏ (rộng 1000px) + nén JPEG để hiển thị mượt hơn trên web
+                        with profiler.stage("publish"):
+                            publisher.publish(frame)
+                        if first_frame_s is None:
+                            # Từ lúc bấm phân tích tới frame đầu tiên hiển thị (gồm cả thời gian chờ model)
+                            first_frame_s = round(time.perf_counter() - started_at, 3)
+                            profiler.gauge("time_to_first_frame_s", first_frame_s)
+                            startup_placeholder.json({"time_to_first_frame_s": first_frame_s, **preloader.stats()})
+
+            report_metrics()
+            report_analytics(save=True)
+            memory_placeholder.json({"trajectories": track_history.stats(), "anti_flicker": hit_counter.store.stats(), "display": publisher.stats(), "pipeline": pipeline.snapshot()})
             st.success("Đã phân tích xong video!")
\ No newline at end of file
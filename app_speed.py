@@ -0,0 +1,205 @@
+import cv2
+import os
+import time
+import numpy as np
+import streamlit as st
+from contextlib import nullcontext
+
+from vision import backends
+from vision.decode import VideoReader
+from vision.display import DisplayPublisher, Throttle
+from vision.metrics import Profiler
+from vision.overlay import OverlayRenderer
+from vision.pipeline import FramePipeline
+from vision.preprocess import Preprocessor
+from vision.speed import SPEED_PALETTE, Calibration, SpeedEstimator, TrackSpeeds, frame_clock, speed_colors
+from vision.streams import InferenceServer, Stream
+from vision.trackcache import TrackCacheWriter, cache_key, open_cache
+from vision.tracking import BatchTracker
+from vision.uploads import save_upload
+
+# 1. Cấu hình trang
+st.set_page_config(page_title="AI Speed Estimation", layout="wide")
+st.title("🚗 AI Speed Estimation (Đo tốc độ)")
+st.markdown("""
+**Nguyên lý:**
+1. Tracking vị trí vật thể theo thời gian.
+2. Chiếu điểm chân xe về mặt đường (mét) bằng 4 điểm hiệu chỉnh (homography).
+3. Hồi quy vị trí theo timestamp của frame trong cửa sổ trượt để ra vận tốc.
+""")
+
+# 2. Sidebar
+st.sidebar.header("⚙️ Cấu hình đo đạc")
+conf_threshold = st.sidebar.slider("Độ nhạy (Confidence)", 0.3, 1.0, 0.5)
+imgsz = st.sidebar.select_slider("Kích thước ảnh inference (imgsz)", options=[320, 416, 480, 640, 800, 960, 1280], value=640)
+backend = st.sidebar.selectbox("Backend inference", ["pytorch", "auto", "onnx", "openvino"])
+
+# QUAN TRỌNG: Hiệu chỉnh Pixel -> Mét
+# Cách tốt: chọn 4 góc của một hình chữ nhật trên mặt đường đã biết kích thước
+# (vd 2 vạch kẻ làn cách nhau 3.5 m, dài 20 m), theo thứ tự trên-trái, trên-phải, dưới-phải, dưới-trái.
+# Cách cũ: một hệ số pixel/mét cho cả khung hình (sai khi xe ở xa / gần camera).
+calib_mode = st.sidebar.radio("Hiệu chỉnh", ["4 điểm (homography)", "Pixel / mét"])
+if calib_mode == "4 điểm (homography)":
+    calib_points = st.sidebar.text_input("4 điểm ảnh (% khung hình, `x,y x,y x,y x,y`)", "40,45 60,45 95,95 5,95")
+    road_width = st.sidebar.number_input("Chiều rộng thật (m)", min_value=0.5, value=7.0, step=0.5)
+    road_length = st.sidebar.number_input("Chiều dài thật (m)", min_value=0.5, value=30.0, step=1.0)
+else:
+    pixels_per_meter = st.sidebar.number_input("Số Pixel ứng với 1 Mét (Calibration)", min_value=1.0, value=20.0, step=1.0)
+window_s = st.sidebar.slider("Cửa sổ tính vận tốc (giây)", 0.2, 3.0, 1.0, 0.1)
+
+mode = st.sidebar.radio("Chế độ", ["Xem trực tiếp", "Phân tích cả file (theo lô)"])
+batch_size = st.sidebar.slider("Batch size", 1, 32, 8) if mode == "Phân tích cả file (theo lô)" else 1
+use_track_cache = st.sidebar.checkbox("Dùng lại kết quả tracking đã cache", value=True)
+display_fps = st.sidebar.slider("FPS hiển thị", 1, 30, 15)
+source_radio = st.sidebar.radio("Nguồn video:", ["📂 Upload Video", "📷 Webcam"])
+
+# Resize về 1280x720 ngay lúc giải mã để xử lý nhanh hơn nếu video 4K
+FRAME_SIZE = (1280, 720)
+# Xe hơi: class 2, Xe máy: class 3, Bus: 5, Xe tải: 7
+CLASSES = [2, 3, 5, 7]
+
+# 3. Load Model
+@st.cache_resource
+def load_model(purpose, backend, imgsz, batch=1):
+    # Dùng model lớn hơn chút (medium) để detect xe tốt hơn
+    return backends.load_model('yolov8m.pt', backend, imgsz, batch=batch)
+
+@st.cache_resource
+def load_server(backend, imgsz, max_batch=8):
+    model, actual_backend = load_model("live", backend, imgsz, batch=max_batch)
+    return InferenceServer(model, max_batch=max_batch), actual_backend
+
+try:
+    server, actual_backend = load_server(backend, imgsz)
+    st.sidebar.caption(f"Backend đang dùng: {actual_backend}")
+except Exception as e:
+    st.error(f"Lỗi tải model: {e}")
+    st.stop()
+
+def make_calibration():
+    w, h = FRAME_SIZE
+    if calib_mode == "Pixel / mét":
+        return Calibration.from_scale(pixels_per_meter)
+    try:
+        points = [tuple(float(v) for v in p.split(",")) for p in calib_points.split()]
+        points = [(x * w / 100, y * h / 100) for x, y in points]
+        return Calibration.from_rect(points, road_width, road_length)
+    except (ValueError, cv2.error):
+        st.error("Cần đúng 4 điểm dạng x,y (theo % khung hình)")
+        st.stop()
+
+def draw_speeds(frame, renderer, tracks, speeds, calibration):
+    labels = [f"ID:{i} {s:.0f} km/h" if not np.isnan(s) else f"ID:{i}" for i, s in zip(tracks.ids, speeds)]
+    # Đổi màu theo tốc độ (Nhanh = Đỏ, Chậm = Xanh)
+    renderer.boxes(frame, tracks.xyxy, groups=speed_colors(speeds), labels=labels)
+    calibration.draw(frame)
+    return frame
+
+st_frame = st.empty()
+st_stats = st.empty()
+video_path = None
+start = False
+
+if source_radio == "📂 Upload Video":
+    uploaded_file = st.file_uploader("Chọn video giao thông", type=['mp4', 'avi', 'mov'])
+    if uploaded_file:
+        video_path = save_upload(uploaded_file)
+        start = st.sidebar.button("▶️ Bắt đầu đo tốc độ")
+elif source_radio == "📷 Webcam":
+    start = st.sidebar.button("🔴 Bật Camera")
+
+# 4. Xử lý chính
+if start:
+    cap = VideoReader(video_path if video_path is not None else 0, size=FRAME_SIZE, buffers=max(16, batch_size + 2))
+    if not cap.isOpened():
+        st.error("Không mở được nguồn video")
+        st.stop()
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30 # Fallback nếu không đọc được FPS
+    calibration = make_calibration()
+    # Mỗi track giữ vị trí (mét) + timestamp gần nhất trong mảng cấp phát sẵn;
+    # track biến mất quá 150 frame được giải phóng để không rò rỉ bộ nhớ khi chạy lâu
+    estimator = SpeedEstimator(calibration, window=window_s)
+    summary = TrackSpeeds()
+    pre = Preprocessor(imgsz)
+    profiler = Profiler()
+
+    # Track không phụ thuộc hiệu chỉnh -> đổi 4 điểm / cửa sổ rồi chạy lại thì đo thẳng từ cache
+    cached, writer_ctx = None, nullcontext()
+    if video_path is not None and use_track_cache:
+        cache_id = cache_key(
+            video_path, "yolov8m.pt", backend=actual_backend, imgsz=imgsz, conf=conf_threshold,
+            classes=CLASSES, tracker="bytetrack.yaml", stride=1, size=FRAME_SIZE,
+        )
+        cached = open_cache(cache_id)
+        if cached is None:
+            writer_ctx = TrackCacheWriter(cache_id, video=os.path.basename(video_path))
+        else:
+            st.info(f"Dùng track đã cache ({len(cached)} frame), không chạy model.")
+
+    if mode == "Phân tích cả file (theo lô)" and video_path is not None:
+        # Offline: timestamp lấy từ PTS của file, không phụ thuộc tốc độ xử lý
+        clock = frame_clock(video_path, fps)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        progress_bar = st.progress(0)
+        if cached is not None:
+            cap.release()
+            tracks_iter = iter(cached)
+        else:
+            tracker = BatchTracker(load_model("batch", backend, imgsz, batch_size)[0], batch_size=batch_size, preprocessor=pre, conf=conf_threshold, classes=CLASSES)
+            tracks_iter = ((idx, tracks) for idx, _, tracks in tracker.iter_video(cap))
+        t0 = time.perf_counter()
+        frame_count = 0
+        with writer_ctx as writer:
+            for idx, tracks in tracks_iter:
+                if writer is not None:
+                    writer.add(idx, tracks)
+                with profiler.stage("speed"):
+                    summary.add(tracks.ids, estimator.update(tracks.xyxy, tracks.ids, clock(idx), idx))
+                frame_count += 1
+                if frame_count % 50 == 0 and total_frames > 0:
+                    progress_bar.progress(min(frame_count / total_frames, 1.0))
+        elapsed = time.perf_counter() - t0
+        progress_bar.progress(1.0)
+        st.metric("Throughput (frames/s)", round(frame_count / elapsed, 2) if elapsed > 0 else 0.0)
+        st_stats.json(summary.summary())
+        ids, median, top = summary.per_track()
+        order = np.argsort(-median)
+        st.dataframe({"ID": ids[order], "km/h (trung vị)": np.round(median[order], 1), "km/h (cao nhất)": np.round(top[order], 1)}, hide_index=True)
+    else:
+        # Bấm Dừng -> Streamlit chạy lại script, lượt này bị ngắt (cache dở bị bỏ)
+        st.sidebar.button("Dừng lại")
+        stream = Stream("speed", server, conf=conf_threshold, classes=CLASSES, preprocessor=pre, profiler=profiler)
+        publisher = DisplayPublisher(st_frame, fps=display_fps, max_width=1200)
+        renderer = OverlayRenderer(palette=SPEED_PALETTE, font_scale=0.7)
+
+        # Tầng infer: tracking + tốc độ cho MỌI frame; `t` là timestamp của frame
+        # (PTS của video / thời điểm chụp của camera), không phải lúc xử lý xong
+        def infer(frame, idx, t):
+            if cached is not None:
+                tracks = cached[idx]
+            else:
+                tracks = stream.track(frame)
+                if writer is not None:
+                    writer.add(idx, tracks)
+            with profiler.stage("speed"):
+                speeds = estimator.update(tracks.xyxy, tracks.ids, t, idx)
+            # Camera chạy liên tục -> không gom lại (bộ nhớ sẽ tăng mãi), chỉ tổng hợp khi là file
+            if video_path is not None:
+                summary.add(tracks.ids, speeds)
+            return tracks, speeds
+
+        # Thống kê mỗi giây một lần: pipeline bỏ frame cũ nên idx nhảy cóc
+        stats_throttle = Throttle(1.0)
+        with writer_ctx as writer:
+            with FramePipeline(cap, infer, profiler=profiler, with_time=True) as pipeline:
+                for idx, frame, (tracks, speeds) in pipeline:
+                    if stats_throttle.due():
+                        st_stats.json({**summary.summary(), "pipeline": pipeline.snapshot()["fps"], "tracks": estimator.store.stats()})
+                    if not publisher.due():
+                        continue
+                    with profiler.stage("draw"):
+                        draw_speeds(frame, renderer, tracks, speeds, calibration)
+                    with profiler.stage("publish"):
+                        publisher.publish(frame)
+        st_stats.json(summary.summary())
+    st.sidebar.dataframe(profiler.table(), hide_index=True)
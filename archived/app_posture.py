@@ -1,9 +1,15 @@
 import cv2
-import tempfile
-import numpy as np
+import os
+import sys
+import time
 import streamlit as st
 from ultralytics import YOLO
-from PIL import Image
+
+# Script nằm trong archived/ -> thêm thư mục gốc để import được package vision
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vision.decode import VideoReader
+from vision.posture import PoseTracker, PostureTimeline, analyze_batches, draw_posture, posture_angles, posture_points
+from vision.uploads import save_upload
 
 # 1. Cấu hình trang
 st.set_page_config(page_title="AI Posture Assistant", layout="centered")
@@ -13,7 +19,8 @@ st.markdown("---")
 
 # 2. Load Model (Cache để không load lại)
 @st.cache_resource
-def load_model():
+def load_model(purpose="live"):
+    # Chế độ theo lô cần model riêng (tracker gắn callback vào model)
     return YOLO('yolov8n-pose.pt')
 
 try:
@@ -22,35 +29,21 @@ except Exception as e:
     st.error(f"Lỗi tải model: {e}")
     st.stop()
 
-# 3. Hàm tính toán góc
-def calculate_angle(a, b, c):
-    a = np.array(a) 
-    b = np.array(b) 
-    c = np.array(c) 
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians*180.0/np.pi)
-    if angle > 180.0: angle = 360 - angle
-    return angle
-
+# 3. Góc Tai - Vai - Hông của MỌI người trong frame tính cùng lúc (vision.posture)
 def process_frame(frame, threshold):
-    # Resize để tăng tốc độ nếu ảnh quá lớn
-    # frame = cv2.resize(frame, (640, 480))
-    
-    results = model(frame, verbose=False, conf=0.5)
+    # Giảm kích thước ảnh đưa vào model (ultralytics tự letterbox + scale keypoint về ảnh gốc)
+    results = model(frame, imgsz=imgsz, verbose=False, conf=0.5)
     annotated_frame = frame.copy()
     status = "Unknown"
     color = (200, 200, 200)
 
     if results[0].keypoints.has_visible:
-        keypoints = results[0].keypoints.data[0].cpu().numpy()
-        
-        # Chọn bên nào rõ hơn (Left vs Right)
-        if keypoints[3][2] > keypoints[4][2]: # So sánh độ tin cậy của Tai
-            ear, shoulder, hip = keypoints[3][:2], keypoints[5][:2], keypoints[11][:2]
-        else:
-            ear, shoulder, hip = keypoints[4][:2], keypoints[6][:2], keypoints[12][:2]
-
-        angle = calculate_angle(ear, shoulder, hip)
+        # Chọn bên nào rõ hơn (Left vs Right) theo độ tin cậy của Tai, cho mọi người
+        points = posture_points(results[0].keypoints.data.cpu().numpy())
+        angles = posture_angles(points)
+        # Người đầu tiên quyết định trạng thái (như trước), các người khác chỉ vẽ
+        draw_posture(annotated_frame, points[1:], angles[1:], angles[1:] < threshold)
+        (ear, shoulder, hip), angle = points[0, :, :2], angles[0]
         
         if angle < threshold:
             color = (0, 0, 255) # Red
@@ -71,8 +64,14 @@ def process_frame(frame, threshold):
 
 # 4. Sidebar Cấu hình
 st.sidebar.header("⚙️ Cài đặt")
-mode = st.sidebar.radio("Chọn chế độ đầu vào:", ["📷 Sử dụng Webcam", "📂 Upload Video có sẵn"])
+mode = st.sidebar.radio("Chọn chế độ đầu vào:", ["📷 Sử dụng Webcam", "📂 Upload Video có sẵn", "📊 Phân tích cả file (theo lô)"])
 threshold = st.sidebar.slider("Ngưỡng cảnh báo (Góc lưng)", 50, 170, 140)
+imgsz = st.sidebar.select_slider("Kích thước ảnh inference (imgsz)", options=[320, 416, 480, 640], value=480)
+if mode == "📊 Phân tích cả file (theo lô)":
+    batch_size = st.sidebar.slider("Batch size", 1, 32, 8)
+    smooth_s = st.sidebar.slider("Làm mượt góc (giây)", 0.1, 3.0, 1.0, 0.1)
+    min_bad_s = st.sidebar.slider("Chỉ ghi lại khi sai tư thế ít nhất (giây)", 0.5, 10.0, 2.0, 0.5)
+    show_preview = st.sidebar.checkbox("Xem trước trong lúc phân tích", value=False)
 st_status_box = st.sidebar.empty()
 
 # 5. Logic xử lý chính
@@ -95,9 +94,7 @@ if mode == "📷 Sử dụng Webcam":
             # --- FALLBACK: Hiện chỗ upload ngay tại đây ---
             fallback_file = st.file_uploader("📂 Hãy chọn video mẫu để thay thế:", type=['mp4', 'avi', 'mov'])
             if fallback_file is not None:
-                tfile = tempfile.NamedTemporaryFile(delete=False)
-                tfile.write(fallback_file.read())
-                cap = cv2.VideoCapture(tfile.name)
+                cap = cv2.VideoCapture(save_upload(fallback_file))
             else:
                 st.stop() # Dừng lại đợi upload
         
@@ -134,10 +131,7 @@ elif mode == "📂 Upload Video có sẵn":
     
     if uploaded_file is not None:
         if st.button("▶️ Chạy Video", use_container_width=True):
-            tfile = tempfile.NamedTemporaryFile(delete=False)
-            tfile.write(uploaded_file.read())
-            
-            cap = cv2.VideoCapture(tfile.name)
+            cap = cv2.VideoCapture(save_upload(uploaded_file))
             
             stop_btn = st.button("Dừng video")
             
@@ -156,4 +150,41 @@ elif mode == "📂 Upload Video có sẵn":
                 else:
                     st_status_box.success(status_text)
 
-            cap.release()
\ No newline at end of file
+            cap.release()
+
+# --- CHẾ ĐỘ PHÂN TÍCH CẢ FILE (THEO LÔ, MỌI NGƯỜI, CÓ LÀM MƯỢT) ---
+elif mode == "📊 Phân tích cả file (theo lô)":
+    uploaded_file = st.file_uploader("Kéo thả video vào đây", type=['mp4', 'avi', 'mov'])
+
+    if uploaded_file is not None and st.button("▶️ Phân tích", use_container_width=True):
+        cap = VideoReader(save_upload(uploaded_file), buffers=batch_size + 2)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        tracker = PoseTracker(load_model("batch"), batch_size=batch_size, frame_rate=round(fps), imgsz=imgsz, conf=0.5)
+        timeline = PostureTimeline(fps, threshold=threshold, smooth_s=smooth_s, min_bad_s=min_bad_s)
+        progress_bar = st.progress(0)
+
+        t0 = time.perf_counter()
+        frame_count = 0
+        for idx, frame, tracks, points, smooth, bad in analyze_batches(tracker, timeline, cap):
+            frame_count += 1
+            if frame_count % 50 == 0:
+                if total_frames > 0:
+                    progress_bar.progress(min(frame_count / total_frames, 1.0))
+                if show_preview:
+                    st_frame_display.image(draw_posture(frame.copy(), points, smooth, bad, tracks.ids), channels="BGR", use_container_width=True)
+                st_status_box.info(f"{int(bad.sum())} / {len(bad)} người đang sai tư thế")
+        timeline.finish(frame_count)
+        elapsed = time.perf_counter() - t0
+        progress_bar.progress(1.0)
+
+        st.metric("Throughput (frames/s)", round(frame_count / elapsed, 2) if elapsed > 0 else 0.0)
+        people = timeline.per_person()
+        if not people:
+            st_status_box.success("Không phát hiện khoảng sai tư thế nào")
+        else:
+            st_status_box.error(f"{len(people)} người có lúc sai tư thế")
+            st.markdown("### ⏱️ Thời gian sai tư thế theo người")
+            st.bar_chart({f"ID {i}": v["bad_s"] for i, v in people.items()})
+            st.markdown("### 📋 Các khoảng sai tư thế")
+            st.dataframe(timeline.table(), hide_index=True, use_container_width=True)
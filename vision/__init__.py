@@ -0,0 +1 @@
+"""Các thành phần dùng chung cho các ứng dụng đếm (xe, người đi bộ, ngón tay...)."""
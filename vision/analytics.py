@@ -0,0 +1,263 @@
+"""
+Phân tích không gian cho video dài (hàng giờ): heatmap mật độ và thời gian
+lưu lại (dwell) / luồng di chuyển giữa các vùng.
+
+- OccupancyHeatmap: lưới thô (mỗi ô `cell` pixel) cộng dồn số "track-frame"
+  bằng `np.bincount`, bộ nhớ cố định bất kể video dài bao nhiêu.
+- ZoneAnalytics: với mỗi vùng đa giác: số người đang ở trong, số lượt vào / ra,
+  tổng / trung bình / tối đa thời gian lưu lại + histogram theo các mốc cố định,
+  và ma trận luồng (từ vùng nào sang vùng nào, "outside" là ngoài mọi vùng).
+  Trạng thái theo track nằm trong TrackStore (số slot cố định).
+
+Cả hai đều có `snapshot()` (xem kết quả bất cứ lúc nào, không cần phát lại video)
+và `save()` (ghi file tạm rồi đổi tên, process khác đọc không bao giờ gặp file dở).
+
+Ví dụ:
+    heatmap = OccupancyHeatmap(width, height, cell=16)
+    zones = ZoneAnalytics({"Cửa vào": [(0, 0), (400, 0), (400, 720), (0, 720)]}, fps=25)
+    for idx, tracks in cache:
+        points = anchor_points(tracks.xyxy, "bottom")
+        heatmap.update(points)
+        zones.update(points, tracks.ids, idx)
+    heatmap.save("output/analytics/cam1.npz")
+"""
+import json
+import os
+
+import cv2
+import numpy as np
+
+from vision.counter import points_in_polygon
+from vision.tracks import TrackStore
+
+# Mốc (giây) của histogram thời gian lưu lại; ô cuối là ">= 1 giờ"
+DWELL_BINS = (0, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _atomic_write(path, write):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class OccupancyHeatmap:
+    """Heatmap mật độ trên lưới thu nhỏ; giá trị mỗi ô = số lần có track đứng trong ô."""
+
+    def __init__(self, width, height, cell=16, fps=None):
+        self.width = width
+        self.height = height
+        self.cell = cell
+        self.fps = fps
+        self.shape = (-(-height // cell), -(-width // cell))
+        self.grid = np.zeros(self.shape, np.float64)
+        self.frames = 0
+
+    def update(self, points, weights=None):
+        """Cộng dồn các điểm (N, 2) (pixel) của một frame."""
+        self.frames += 1
+        points = np.asarray(points, np.float32).reshape(-1, 2)
+        if not len(points):
+            return
+        gh, gw = self.shape
+        col = np.clip((points[:, 0] // self.cell).astype(np.intp), 0, gw - 1)
+        row = np.clip((points[:, 1] // self.cell).astype(np.intp), 0, gh - 1)
+        self.grid += np.bincount(row * gw + col, weights=weights, minlength=gh * gw).reshape(self.shape)
+
+    def dwell_seconds(self):
+        """Tổng số giây-người trong mỗi ô (cần biết fps)."""
+        return self.grid / self.fps if self.fps else self.grid.copy()
+
+    def snapshot(self):
+        return {
+            "grid": self.grid.astype(np.float32),
+            "cell": self.cell,
+            "size": (self.width, self.height),
+            "frames": self.frames,
+            "fps": self.fps,
+        }
+
+    def image(self, size=None, colormap=cv2.COLORMAP_JET):
+        """Ảnh màu BGR của heatmap (thang log để ô đông không "nuốt" hết các ô khác)."""
+        peak = self.grid.max()
+        norm = np.log1p(self.grid) / np.log1p(peak) if peak > 0 else np.zeros(self.shape)
+        img = cv2.applyColorMap((norm * 255).astype(np.uint8), colormap)
+        w, h = size or (self.width, self.height)
+        return cv2.resize(img, (w, h), interpolation=cv2.INTER_LINEAR)
+
+    def render(self, frame, alpha=0.5):
+        """Phủ heatmap lên frame (chỉ ô đã có người mới bị tô màu)."""
+        h, w = frame.shape[:2]
+        color = self.image((w, h))
+        hot = cv2.resize((self.grid > 0).astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST)
+        blended = cv2.addWeighted(frame, 1 - alpha, color, alpha, 0)
+        cv2.copyTo(blended, hot, frame)
+        return frame
+
+    def save(self, path):
+        """Lưu .npz (mở lại bằng `OccupancyHeatmap.load`), kèm ảnh .png cùng tên."""
+        snap = self.snapshot()
+        _atomic_write(path, lambda f: np.savez_compressed(
+            f, grid=snap["grid"], cell=self.cell, size=np.array(snap["size"]), frames=self.frames, fps=self.fps or 0.0,
+        ))
+        ok, png = cv2.imencode(".png", self.image())
+        if ok:
+            _atomic_write(os.path.splitext(path)[0] + ".png", lambda f: f.write(png.tobytes()))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        width, height = (int(v) for v in data["size"])
+        heatmap = cls(width, height, int(data["cell"]), float(data["fps"]) or None)
+        heatmap.grid[:] = data["grid"]
+        heatmap.frames = int(data["frames"])
+        return heatmap
+
+
+def parse_zones(text, width, height):
+    """
+    Đọc danh sách vùng dạng text, mỗi dòng: `tên: x1,y1 x2,y2 x3,y3 ...`
+    với tọa độ theo % kích thước frame (0-100). Trả về {tên: đa giác pixel}.
+    """
+    zones = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if ":" not in line:
+            raise ValueError(f"Thiếu 'tên:' ở dòng: '{line}'")
+        name, coords = line.split(":", 1)
+        try:
+            points = [tuple(float(v) for v in p.split(",")) for p in coords.split()]
+        except ValueError:
+            raise ValueError(f"Tọa độ không hợp lệ ở dòng: '{line}'") from None
+        if len(points) < 3 or any(len(p) != 2 for p in points):
+            raise ValueError(f"Vùng '{name.strip()}' cần ít nhất 3 điểm dạng x,y")
+        zones[name.strip()] = [(x * width / 100, y * height / 100) for x, y in points]
+    return zones
+
+
+class ZoneAnalytics:
+    """
+    Thời gian lưu lại và luồng di chuyển giữa các vùng đa giác.
+
+    Một track thuộc vùng đầu tiên (theo thứ tự khai báo) chứa điểm của nó.
+    Lượt lưu lại kết thúc khi track ra khỏi vùng, hoặc khi track biến mất quá
+    `max_idle` frame (tính tới frame cuối cùng còn thấy).
+    """
+
+    def __init__(self, zones, fps, capacity=1024, max_idle=150):
+        if not zones:
+            raise ValueError("Cần ít nhất một vùng")
+        self.names = list(zones)
+        self.polygons = [np.asarray(p, np.float32).reshape(-1, 2) for p in zones.values()]
+        self.fps = fps or 30.0
+        self.max_idle = max_idle
+        k = len(self.names)
+        self.outside = k  # chỉ số "ngoài mọi vùng" trong ma trận luồng
+        self.occupancy = np.zeros(k, np.int64)
+        self.entries = np.zeros(k, np.int64)
+        self.exits = np.zeros(k, np.int64)
+        self.dwell_total = np.zeros(k, np.float64)
+        self.dwell_max = np.zeros(k, np.float64)
+        self.dwell_hist = np.zeros((k, len(DWELL_BINS)), np.int64)
+        self.flow = np.zeros((k + 1, k + 1), np.int64)
+        # zone lưu chỉ số vùng + 1 (0 = ngoài) để slot mới (reset về 0) mặc định là "ngoài"
+        self.store = TrackStore(capacity, max_idle=max_idle, zone=((), np.int16), entered=((), np.int64))
+
+    def _zone_of(self, points):
+        zone = np.full(len(points), self.outside, np.intp)
+        for i in range(len(self.polygons) - 1, -1, -1):
+            zone[points_in_polygon(points, self.polygons[i])] = i
+        return zone
+
+    def _close(self, zones, entered, left):
+        # Kết thúc các lượt lưu lại: zones / entered / left là mảng cùng độ dài
+        seconds = np.maximum(left - entered, 0) / self.fps
+        np.add.at(self.exits, zones, 1)
+        np.add.at(self.dwell_total, zones, seconds)
+        np.maximum.at(self.dwell_max, zones, seconds)
+        bins = np.searchsorted(DWELL_BINS, seconds, side="right") - 1
+        np.add.at(self.dwell_hist, (zones, bins), 1)
+
+    def _expire(self, frame):
+        # Track trong vùng nhưng đã mất dấu quá lâu -> coi như đã rời đi tại frame cuối còn thấy
+        zone = self.store["zone"]
+        gone = np.flatnonzero((self.store.ids >= 0) & (zone > 0) & (frame - self.store.last_seen > self.max_idle))
+        if len(gone):
+            z = zone[gone].astype(np.intp) - 1
+            self._close(z, self.store["entered"][gone], self.store.last_seen[gone] + 1)
+            np.add.at(self.flow, (z, self.outside), 1)
+            zone[gone] = 0
+
+    def update(self, points, ids, frame):
+        """points: (N, 2) điểm neo của các track (vd `anchor_points(xyxy, "bottom")`)."""
+        points = np.asarray(points, np.float32).reshape(-1, 2)
+        ids = np.asarray(ids, np.int64).reshape(-1)
+        self._expire(frame)
+        now = self._zone_of(points)
+        self.occupancy = np.bincount(now, minlength=self.outside + 1)[:self.outside]
+
+        slots, _ = self.store.touch(ids, frame)
+        valid = slots >= 0
+        slots, now = slots[valid], now[valid]
+        before = self.store["zone"][slots].astype(np.intp) - 1
+        before[before < 0] = self.outside
+        moved = before != now
+        if not moved.any():
+            return
+        s, a, b = slots[moved], before[moved], now[moved]
+        left = a != self.outside
+        if left.any():
+            self._close(a[left], self.store["entered"][s[left]], np.full(left.sum(), frame))
+        np.add.at(self.entries, b[b != self.outside], 1)
+        np.add.at(self.flow, (a, b), 1)
+        self.store["zone"][s] = np.where(b == self.outside, 0, b + 1)
+        self.store["entered"][s] = frame
+
+    def snapshot(self, frame=None):
+        """
+        Thống kê hiện tại theo vùng. Truyền `frame` để tính cả thời gian của
+        những người còn đang đứng trong vùng (`dwell_open_s`).
+        """
+        open_dwell = np.zeros(len(self.names))
+        if frame is not None:
+            active = np.flatnonzero((self.store.ids >= 0) & (self.store["zone"] > 0))
+            z = self.store["zone"][active].astype(np.intp) - 1
+            np.add.at(open_dwell, z, (frame - self.store["entered"][active]) / self.fps)
+        labels = [f">={b}s" for b in DWELL_BINS]
+        zones = {}
+        for i, name in enumerate(self.names):
+            zones[name] = {
+                "occupancy": int(self.occupancy[i]),
+                "entries": int(self.entries[i]),
+                "exits": int(self.exits[i]),
+                "dwell_total_s": round(float(self.dwell_total[i]), 1),
+                "dwell_mean_s": round(float(self.dwell_total[i] / self.exits[i]), 1) if self.exits[i] else 0.0,
+                "dwell_max_s": round(float(self.dwell_max[i]), 1),
+                "dwell_open_s": round(float(open_dwell[i]), 1),
+                "dwell_hist": dict(zip(labels, self.dwell_hist[i].tolist())),
+            }
+        names = self.names + ["outside"]
+        flow = {f"{names[a]} -> {names[b]}": int(self.flow[a, b]) for a, b in zip(*np.nonzero(self.flow))}
+        return {"zones": zones, "flow": flow}
+
+    def table(self):
+        """Các dòng {zone, occupancy, entries, ...} để hiển thị bằng `st.dataframe`."""
+        return [
+            {"zone": name, **{k: v for k, v in values.items() if k != "dwell_hist"}}
+            for name, values in self.snapshot()["zones"].items()
+        ]
+
+    def draw(self, frame, color=(255, 0, 255), thickness=2):
+        for name, poly in zip(self.names, self.polygons):
+            pts = poly.astype(np.int32)
+            cv2.polylines(frame, [pts.reshape(-1, 1, 2)], True, color, thickness)
+            cv2.putText(frame, name, tuple(int(v) for v in pts.min(0) + 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        return frame
+
+    def save(self, path, frame=None):
+        data = json.dumps(self.snapshot(frame), ensure_ascii=False, indent=2).encode("utf-8")
+        _atomic_write(path, lambda f: f.write(data))
+        return path
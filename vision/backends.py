@@ -0,0 +1,246 @@
+"""
+Chọn backend inference cho CPU: PyTorch (mặc định), ONNX Runtime hoặc OpenVINO.
+
+Model được export MỘT lần rồi lưu vào thư mục cache, khóa theo
+(trọng số, imgsz, precision, batch). Lần chạy sau chỉ việc load file đã export.
+Nếu export / load thất bại (thiếu thư viện, precision không hỗ trợ...) thì tự
+quay về PyTorch, báo bằng `warnings.warn` và giữ lý do trong `fallback_reason(model)`.
+
+Ví dụ:
+    model, backend = load_model("yolov8m.pt", backend="openvino", imgsz=640, threads=4)
+    python -m vision.backends video/count-car1.mp4 --model yolov8n.pt
+"""
+import argparse
+import hashlib
+import importlib.util
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from functools import partial
+
+import numpy as np
+
+BACKENDS = ("auto", "pytorch", "onnx", "openvino")
+PRECISIONS = ("fp32", "fp16", "int8")
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "VISION_MODEL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "vision", "models")
+)
+
+
+def _available(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def resolve_backend(backend):
+    """"auto" -> OpenVINO nếu có, rồi tới ONNX Runtime, cuối cùng là PyTorch."""
+    if backend != "auto":
+        return backend
+    if _available("openvino"):
+        return "openvino"
+    if _available("onnxruntime"):
+        return "onnx"
+    return "pytorch"
+
+
+def _file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def cache_key(weights_path, backend, imgsz, precision, batch):
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    return f"{stem}-{_file_digest(weights_path)}-{backend}-{imgsz}-{precision}-b{batch}"
+
+
+def export_cached(weights, backend, imgsz=640, precision="fp32", batch=1, cache_dir=None):
+    """Export (nếu chưa có trong cache) và trả về đường dẫn model đã export."""
+    from ultralytics import YOLO
+
+    if backend not in ("onnx", "openvino"):
+        raise ValueError(f"Không export được sang backend '{backend}'")
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision không hợp lệ: '{precision}'")
+
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+
+    model = YOLO(weights)  # tự tải trọng số nếu chưa có
+    weights_path = str(getattr(model, "ckpt_path", None) or weights)
+    key = cache_key(weights_path, backend, imgsz, precision, batch)
+    target = os.path.join(cache_dir, key + (".onnx" if backend == "onnx" else "_openvino_model"))
+    if os.path.exists(target):
+        return target
+
+    # Export trong thư mục tạm (ultralytics ghi file cạnh file .pt) rồi đổi tên vào cache,
+    # nhiều process export cùng lúc cũng không làm hỏng file trong cache
+    with tempfile.TemporaryDirectory(dir=cache_dir) as tmp:
+        local = os.path.join(tmp, os.path.basename(weights_path))
+        shutil.copy2(weights_path, local)
+        exported = YOLO(local).export(
+            format=backend, imgsz=imgsz, batch=batch, dynamic=batch > 1,
+            half=precision == "fp16", int8=precision == "int8", verbose=False,
+        )
+        try:
+            os.replace(exported, target)
+        except OSError:
+            if not os.path.exists(target):
+                raise
+    return target
+
+
+def _backend_of(model):
+    # ultralytics mới: AutoBackend.backend; bản cũ: chính AutoBackend giữ session
+    auto = getattr(model.predictor, "model", None)
+    return getattr(auto, "backend", None) or auto
+
+
+def tune_threads(model, path, threads):
+    """
+    Đặt số thread cho session ONNX Runtime / OpenVINO mà ultralytics đã tạo.
+    Phải gọi sau lần predict đầu tiên (lúc đó predictor mới được khởi tạo).
+    Trả về True nếu đã chỉnh được.
+    """
+    backend = _backend_of(model)
+    if backend is None:
+        return False
+
+    session = getattr(backend, "session", None)
+    if session is not None and hasattr(session, "get_providers"):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        backend.session = ort.InferenceSession(path, options, providers=session.get_providers())
+        return True
+
+    if getattr(backend, "ov_compiled_model", None) is not None:
+        import openvino as ov
+
+        core = ov.Core()
+        xml = path if path.endswith(".xml") else next(
+            os.path.join(path, f) for f in os.listdir(path) if f.endswith(".xml")
+        )
+        config = {"PERFORMANCE_HINT": "LATENCY", "INFERENCE_NUM_THREADS": threads}
+        backend.compile_model = partial(core.compile_model, device_name="CPU", config=config)
+        backend.ov_compiled_model = backend.compile_model(core.read_model(xml))
+        return True
+    return False
+
+
+def load_model(weights="yolov8n.pt", backend="auto", imgsz=640, precision="fp32", batch=1, threads=None, cache_dir=None):
+    """
+    Load model theo backend, trả về (model, tên backend thực tế).
+
+    Model trả về vẫn là `YOLO` của ultralytics nên `.track` / `.predict` dùng như cũ.
+    Nên gọi `.track` / `.predict` với đúng `imgsz` đã export.
+    """
+    from ultralytics import YOLO
+
+    backend = resolve_backend(backend)
+    threads = threads or os.cpu_count() or 1
+
+    if backend != "pytorch":
+        try:
+            path = export_cached(weights, backend, imgsz, precision, batch, cache_dir)
+            task = YOLO(weights).task
+            model = YOLO(path, task=task)
+            # Warm-up: khởi tạo predictor/session rồi mới chỉnh số thread
+            model.predict(np.zeros((imgsz, imgsz, 3), np.uint8), imgsz=imgsz, verbose=False)
+            tune_threads(model, path, threads)
+            return model, backend
+        except Exception as e:
+            reason = f"Không dùng được {backend} ({e}), quay về PyTorch"
+            warnings.warn(reason, RuntimeWarning, stacklevel=2)
+
+    import torch
+
+    torch.set_num_threads(threads)
+    model = YOLO(weights)
+    if backend != "pytorch":
+        model.fallback_reason = reason
+    return model, "pytorch"
+
+
+def fallback_reason(model):
+    """Vì sao `load_model` phải quay về PyTorch (None nếu dùng đúng backend đã chọn). CascadeModel: xem model nhỏ."""
+    return getattr(getattr(model, "small", model), "fallback_reason", None)
+
+
+# --- Benchmark ---
+def box_parity(ref_xyxy, ref_cls, xyxy, cls, iou_threshold=0.5):
+    """Tỉ lệ box của `ref` tìm được box cùng class, IoU >= ngưỡng trong kết quả còn lại."""
+    from vision.tracking import box_iou
+
+    if len(ref_xyxy) == 0:
+        return 1.0 if len(xyxy) == 0 else 0.0
+    iou = box_iou(ref_xyxy, xyxy)
+    iou[ref_cls[:, None] != cls[None, :]] = 0
+    return float((iou.max(axis=1, initial=0) >= iou_threshold).mean())
+
+
+def benchmark(weights, video, backends=("pytorch", "onnx", "openvino"), imgsz=640, precision="fp32", threads=None, max_frames=100, conf=0.25, classes=None):
+    """So sánh thời gian load, độ trễ (mean/p95) và độ khớp box của các backend trên cùng các frame."""
+    import cv2
+
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while len(frames) < max_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+
+    reports = []
+    reference = None
+    for name in backends:
+        t0 = time.perf_counter()
+        model, actual = load_model(weights, name, imgsz, precision, threads=threads)
+        load_s = time.perf_counter() - t0
+        if actual != name:
+            reports.append({"backend": name, "error": f"fallback -> {actual}"})
+            continue
+
+        outputs, latencies = [], []
+        for frame in frames:
+            t0 = time.perf_counter()
+            r = model.predict(frame, imgsz=imgsz, conf=conf, classes=classes, verbose=False)[0]
+            latencies.append(time.perf_counter() - t0)
+            outputs.append((r.boxes.xyxy.cpu().numpy(), r.boxes.cls.cpu().numpy().astype(int)))
+        if reference is None:
+            reference = outputs
+
+        lat = np.array(latencies) * 1000
+        reports.append({
+            "backend": actual,
+            "load_s": round(load_s, 2),
+            "mean_ms": round(float(lat.mean()), 2),
+            "p95_ms": round(float(np.percentile(lat, 95)), 2),
+            "fps": round(1000.0 / float(lat.mean()), 2),
+            "parity": round(float(np.mean([box_parity(*ref, *out) for ref, out in zip(reference, outputs)])), 4),
+        })
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh độ trễ và độ khớp giữa các backend inference")
+    parser.add_argument("video", help="vd: video/count-car1.mp4")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--backends", nargs="+", default=["pytorch", "onnx", "openvino"], choices=BACKENDS[1:])
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--max-frames", type=int, default=100)
+    args = parser.parse_args()
+
+    for report in benchmark(args.model, args.video, args.backends, args.imgsz, args.precision, args.threads, args.max_frames):
+        print(report)
@@ -0,0 +1,231 @@
+"""
+Benchmark tái lập được trên CPU: phát lại các video mẫu qua đúng logic đếm của
+`app.py` (xe qua vạch) và `app_pedestrian.py` (Anti-Flicker), đo frame/s, độ trễ
+từng frame (p50/p95/p99), thời gian từng tầng, đỉnh RSS và số đếm cuối cùng.
+
+Mỗi kịch bản chạy trong một process riêng để đỉnh RSS không lẫn vào nhau.
+Kết quả lưu thành JSON baseline để so sánh giữa các commit.
+
+Ví dụ:
+    python -m vision.bench --save baseline
+    python -m vision.bench --model yolov8n.pt --imgsz 480 --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+
+# Cấu hình giống các app Streamlit
+SCENARIOS = {
+    "vehicles": {"video": "video/count-car1.mp4", "model": "yolov8m.pt", "classes": [2, 5, 7], "conf": 0.5, "line_ratio": 0.6},
+    "pedestrians": {"video": "video/pedestrian.mp4", "model": "yolov8n.pt", "classes": [0], "conf": 0.5, "min_hits": 20},
+}
+
+
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def run_scenario(name, config, backend="pytorch", imgsz=640, stride=1, max_frames=None, draw=False):
+    """
+    Chạy một kịch bản, trả về dict kết quả (đo trong process hiện tại).
+    `draw=True`: vẽ thêm box / quỹ đạo mỗi frame như app (tầng "draw"), mặc định chạy không vẽ.
+    """
+    import cv2
+
+    from vision.backends import load_model
+    from vision.counter import HitCounter, LineCounter, anchor_points
+    from vision.metrics import Profiler
+    from vision.overlay import OverlayRenderer
+    from vision.preprocess import Preprocessor
+    from vision.stride import StrideScheduler, StridedTracker
+    from vision.streams import InferenceServer, Stream
+    from vision.tracks import TrackStore
+
+    video = os.path.join(ROOT, config["video"])
+    t0 = time.perf_counter()
+    model, actual_backend = load_model(config["model"], backend, imgsz)
+    server = InferenceServer(model, max_batch=1)
+    load_s = time.perf_counter() - t0
+
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise IOError(f"Không mở được video: {video}")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    # Warm-up để thời gian khởi tạo predictor không lẫn vào số đo
+    success, frame = cap.read()
+    if success:
+        server.submit(frame, imgsz).result()
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    profiler = Profiler(window=100000)
+    renderer = OverlayRenderer(enabled=draw)
+    trails = TrackStore(capacity=1024, history=40, max_idle=150)
+    stream = Stream(name, server, conf=config["conf"], classes=config["classes"], preprocessor=Preprocessor(imgsz), profiler=profiler)
+    strided = StridedTracker(stream.track, StrideScheduler(stride=stride))
+    if "line_ratio" in config:
+        line_y = int(height * config["line_ratio"])
+        counter = LineCounter([(0, line_y), (width, line_y)])
+    else:
+        counter = HitCounter(config["min_hits"])
+
+    latencies = []
+    idx = 0
+    started = time.perf_counter()
+    while max_frames is None or idx < max_frames:
+        t0 = time.perf_counter()
+        with profiler.stage("decode"):
+            success, frame = cap.read()
+        if not success:
+            break
+        tracks, _ = strided.step(frame, idx)
+        with profiler.stage("count"):
+            if isinstance(counter, LineCounter):
+                if len(tracks.ids):
+                    counter.update(tracks.xyxy, tracks.ids, idx)
+            else:
+                counter.update(tracks.ids, idx)
+        if draw:
+            with profiler.stage("draw"):
+                # Quỹ đạo 40 điểm + box như app_pedestrian.py
+                slots, _ = trails.touch(tracks.ids, idx)
+                trails.append(slots, anchor_points(tracks.xyxy))
+                renderer.trails(frame, *trails.trails(slots))
+                renderer.boxes(frame, tracks.xyxy)
+        latencies.append(time.perf_counter() - t0)
+        idx += 1
+    elapsed = time.perf_counter() - started
+    cap.release()
+    server.close()
+
+    lat = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    counts = {"count": counter.count}
+    if isinstance(counter, LineCounter):
+        counts.update({"in": counter.in_count, "out": counter.out_count})
+    return {
+        "video": config["video"],
+        "model": config["model"],
+        "backend": actual_backend,
+        "imgsz": imgsz,
+        "stride": stride,
+        "draw": draw,
+        "frames": len(latencies),
+        "load_s": round(load_s, 2),
+        "fps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {q: round(float(np.percentile(lat, int(q[1:]))), 2) for q in ("p50", "p95", "p99")},
+        "stages": {k: {"p50_ms": v["p50_ms"], "p95_ms": v["p95_ms"]} for k, v in profiler.summary()["stages"].items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "counts": counts,
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def machine_info():
+    try:
+        import ultralytics
+
+        ultralytics_version = ultralytics.__version__
+    except ImportError:
+        ultralytics_version = None
+    return {
+        "commit": _git_commit(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "ultralytics": ultralytics_version,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run(scenarios, verbose=True, **kwargs):
+    """Chạy các kịch bản {tên: config}, trả về {"meta": ..., "results": {tên: kết quả}}."""
+    report = {"meta": machine_info(), "results": {}}
+    # Mỗi kịch bản một process spawn mới -> đỉnh RSS và trạng thái torch độc lập
+    ctx = mp.get_context("spawn")
+    for name, config in scenarios.items():
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            report["results"][name] = pool.submit(run_scenario, name, config, **kwargs).result()
+        if verbose:
+            print(name, json.dumps(report["results"][name], ensure_ascii=False))
+    return report
+
+
+def compare(current, baseline, fps_tolerance=0.1, rss_tolerance=0.2):
+    """
+    So sánh với baseline, trả về danh sách cảnh báo hồi quy:
+    fps giảm quá `fps_tolerance`, RSS tăng quá `rss_tolerance`, số đếm thay đổi.
+    """
+    problems = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        if base["fps"] and cur["fps"] < base["fps"] * (1 - fps_tolerance):
+            problems.append(f"{name}: fps {base['fps']} -> {cur['fps']}")
+        if base["peak_rss_mb"] and cur["peak_rss_mb"] > base["peak_rss_mb"] * (1 + rss_tolerance):
+            problems.append(f"{name}: peak RSS {base['peak_rss_mb']} MB -> {cur['peak_rss_mb']} MB")
+        if cur["counts"] != base["counts"]:
+            problems.append(f"{name}: counts {base['counts']} -> {cur['counts']}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các app đếm trên video mẫu (CPU)")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--model", default=None, help="Ghi đè model của mọi kịch bản, vd yolov8n.pt")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--draw", action="store_true", help="Đo cả bước vẽ box / quỹ đạo (mặc định chạy không vẽ)")
+    parser.add_argument("--save", default=None, help="Lưu kết quả vào benchmarks/<tên>.json")
+    parser.add_argument("--compare", default=None, help="File baseline JSON để so sánh")
+    parser.add_argument("--fps-tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    scenarios = {name: {**SCENARIOS[name], **({"model": args.model} if args.model else {})} for name in args.scenarios}
+    report = run(scenarios, backend=args.backend, imgsz=args.imgsz, stride=args.stride, max_frames=args.max_frames, draw=args.draw)
+
+    if args.save:
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        path = os.path.join(BENCH_DIR, f"{args.save}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Đã lưu {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, fps_tolerance=args.fps_tolerance)
+        for p in problems:
+            print("REGRESSION", p)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
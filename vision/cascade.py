@@ -0,0 +1,265 @@
+"""
+Cascade 2 model: model nhỏ (nano) chạy mọi frame, model lớn (medium) chỉ kiểm
+tra lại những frame / vùng mà model nhỏ không chắc chắn.
+
+Một frame được "đẩy lên" model lớn khi:
+- `low_conf`: có box với độ tin cậy trong khoảng [low, conf) (có thể là xe nhưng
+  model nhỏ chưa chắc),
+- `crowded`: số box >= `crowd` (xe dính nhau, model nhỏ hay gộp / bỏ sót),
+- `near_line`: có box nằm gần vạch đếm (sai ở đây làm sai số đếm).
+
+`mode="frame"`: model lớn chạy lại cả frame. `mode="crop"`: chỉ chạy trên vùng bao
+các box gây nghi ngờ (trừ khi frame quá đông), box trong vùng lấy theo model lớn,
+ngoài vùng giữ kết quả của model nhỏ.
+
+CascadeModel có `predict(...)` giống model ultralytics nên dùng thẳng được với
+BatchTracker và InferenceServer. Vạch đếm cho theo tỉ lệ khung hình (0..1) để một
+model dùng chung được cho các video khác kích thước.
+
+Ví dụ:
+    python -m vision.cascade video/count-car1.mp4 --small yolov8n.pt --large yolov8m.pt
+"""
+import argparse
+import time
+
+import numpy as np
+
+REASONS = ("low_conf", "crowded", "near_line")
+
+
+def _point_segment_distance(points, a, b):
+    """Khoảng cách (N, S) từ N điểm tới S đoạn thẳng a[s] -> b[s]."""
+    ab = b - a
+    ap = points[:, None, :] - a[None, :, :]
+    t = np.clip((ap * ab[None]).sum(-1) / np.maximum((ab ** 2).sum(-1), 1e-9)[None], 0.0, 1.0)
+    closest = a[None] + t[..., None] * ab[None]
+    return np.linalg.norm(points[:, None, :] - closest, axis=-1)
+
+
+class EscalationPolicy:
+    """
+    Quyết định frame nào cần model lớn. `line`: các điểm của vạch đếm theo tỉ lệ
+    (x / w, y / h); `line_margin`: khoảng cách tới vạch (tỉ lệ chiều cao) được coi là "gần".
+    """
+
+    def __init__(self, low=0.25, crowd=20, line=None, line_margin=0.08, mode="frame", crop_pad=0.5, min_crop=160):
+        if mode not in ("frame", "crop"):
+            raise ValueError(f"mode không hợp lệ: '{mode}'")
+        self.low = low
+        self.crowd = crowd
+        self.line = np.asarray(line, np.float32).reshape(-1, 2) if line is not None else None
+        self.line_margin = line_margin
+        self.mode = mode
+        self.crop_pad = crop_pad
+        self.min_crop = min_crop
+
+    def key(self):
+        """Các tham số ảnh hưởng tới box (dùng cho khóa cache)."""
+        line = None if self.line is None else np.round(self.line, 4).tolist()
+        return {"low": self.low, "crowd": self.crowd, "line": line, "line_margin": self.line_margin, "mode": self.mode}
+
+    def check(self, data, shape, conf, line=None):
+        """
+        data: (N, 6) x1, y1, x2, y2, conf, cls của model nhỏ (đã lọc conf >= low).
+        `line` (tỉ lệ khung hình) thay cho `self.line` nếu truyền vào.
+        Trả về (lý do, mask các box gây nghi ngờ) hoặc (None, None).
+        """
+        line = self.line if line is None else np.asarray(line, np.float32).reshape(-1, 2)
+        if self.crowd and len(data) >= self.crowd:
+            return "crowded", np.ones(len(data), bool)
+        uncertain = data[:, 4] < conf
+        if uncertain.any():
+            return "low_conf", uncertain
+        if line is not None and len(data):
+            h, w = shape[:2]
+            line = line * (w, h)
+            centers = (data[:, :2] + data[:, 2:4]) / 2
+            near = _point_segment_distance(centers, line[:-1], line[1:]).min(1) <= self.line_margin * h
+            if near.any():
+                return "near_line", near
+        return None, None
+
+    def crop(self, data, mask, shape):
+        """Vùng (x1, y1, x2, y2) bao các box bị nghi ngờ, nới thêm `crop_pad` lần kích thước, tối thiểu `min_crop` px."""
+        h, w = shape[:2]
+        boxes = data[mask, :4]
+        x1, y1 = boxes[:, :2].min(0)
+        x2, y2 = boxes[:, 2:].max(0)
+        pad_x = max((x2 - x1) * self.crop_pad, (self.min_crop - (x2 - x1)) / 2, 0)
+        pad_y = max((y2 - y1) * self.crop_pad, (self.min_crop - (y2 - y1)) / 2, 0)
+        return (int(max(0, x1 - pad_x)), int(max(0, y1 - pad_y)), int(min(w, x2 + pad_x)), int(min(h, y2 + pad_y)))
+
+
+class CascadeModel:
+    """
+    `small` chạy mọi frame (conf thấp = `policy.low` để thấy các box chưa chắc),
+    `large` chạy theo lô trên các frame / vùng được đẩy lên.
+    """
+
+    # `predict` nhận thêm `lines=` (vạch đếm của từng frame), xem InferenceServer
+    accepts_lines = True
+
+    def __init__(self, small, large, policy=None):
+        self.small = small
+        self.large = large
+        self.policy = policy or EscalationPolicy()
+        self.names = getattr(small, "names", None)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames = 0
+        self.escalated = 0
+        self.reasons = dict.fromkeys(REASONS, 0)
+        self.small_s = 0.0
+        self.large_s = 0.0
+        self.large_pixels = 0.0  # tổng diện tích (tỉ lệ frame) model lớn phải xử lý
+
+    @property
+    def escalation_rate(self):
+        return self.escalated / self.frames if self.frames else 0.0
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "escalated": self.escalated,
+            "escalation_rate": round(self.escalation_rate, 3),
+            "reasons": dict(self.reasons),
+            "large_area": round(self.large_pixels / self.frames, 3) if self.frames else 0.0,
+            "small_ms": round(self.small_s / self.frames * 1000, 2) if self.frames else 0.0,
+            "large_ms": round(self.large_s / self.frames * 1000, 2) if self.frames else 0.0,
+        }
+
+    def predict(self, source, imgsz=640, conf=0.25, classes=None, verbose=False, lines=None, **kwargs):
+        """`lines`: vạch đếm riêng cho từng frame (vd nhiều stream dùng chung InferenceServer)."""
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        policy = self.policy
+        t0 = time.perf_counter()
+        small = self.small.predict(list(frames), imgsz=imgsz, conf=min(conf, policy.low), classes=classes, verbose=verbose, **kwargs)
+        self.small_s += time.perf_counter() - t0
+
+        outputs = []   # (N, 6) cho từng frame
+        jobs = []      # (vị trí frame, vùng crop hoặc None)
+        for i, (frame, r) in enumerate(zip(frames, small)):
+            data = r.boxes.data.cpu().numpy()
+            reason, mask = policy.check(data, frame.shape, conf, lines[i] if lines else None)
+            outputs.append(data[data[:, 4] >= conf])
+            if reason is None:
+                continue
+            self.reasons[reason] += 1
+            region = policy.crop(data, mask, frame.shape) if policy.mode == "crop" and reason != "crowded" else None
+            jobs.append((i, region))
+        self.frames += len(frames)
+        self.escalated += len(jobs)
+
+        if jobs:
+            t0 = time.perf_counter()
+            images = []
+            for i, region in jobs:
+                frame = frames[i]
+                if region is None:
+                    images.append(frame)
+                    self.large_pixels += 1.0
+                else:
+                    x1, y1, x2, y2 = region
+                    images.append(frame[y1:y2, x1:x2])
+                    self.large_pixels += (x2 - x1) * (y2 - y1) / (frame.shape[0] * frame.shape[1])
+            large = self.large.predict(images, imgsz=imgsz, conf=conf, classes=classes, verbose=verbose, **kwargs)
+            self.large_s += time.perf_counter() - t0
+            for (i, region), r in zip(jobs, large):
+                data = r.boxes.data.cpu().numpy()
+                if region is None:
+                    outputs[i] = data
+                    continue
+                # Trong vùng: lấy box của model lớn; ngoài vùng: giữ box của model nhỏ
+                x1, y1, x2, y2 = region
+                data[:, :4] += (x1, y1, x1, y1)
+                old = outputs[i]
+                cx, cy = (old[:, 0] + old[:, 2]) / 2, (old[:, 1] + old[:, 3]) / 2
+                outside = (cx < x1) | (cx >= x2) | (cy < y1) | (cy >= y2)
+                outputs[i] = np.concatenate([old[outside], data])
+        return [_with_boxes(r, data) for r, data in zip(small, outputs)]
+
+
+def _with_boxes(result, data):
+    """Results của model nhỏ nhưng với box đã gộp (giữ orig_img, names, path)."""
+    import torch
+
+    out = result.new()
+    out.update(boxes=torch.from_numpy(np.ascontiguousarray(data, np.float32)).reshape(-1, 6))
+    return out
+
+
+def compare(video, small="yolov8n.pt", large="yolov8m.pt", batch_size=8, imgsz=640, conf=0.5, classes=(2, 5, 7),
+            line_ratio=0.6, max_frames=None, modes=("frame", "crop"), **policy_kwargs):
+    """
+    Đếm xe trên cùng video với: chỉ model lớn (chuẩn), chỉ model nhỏ, và cascade
+    (từng `mode`). So sánh frame/s, sai số đếm, độ khớp box so với model lớn và
+    tỉ lệ frame phải đẩy lên model lớn.
+    """
+    from ultralytics import YOLO
+
+    from vision.backends import box_parity
+    from vision.counter import LineCounter
+    from vision.decode import VideoReader
+    from vision.tracking import BatchTracker
+
+    classes = list(classes) if classes else None
+    configs = [("large", None), ("small", None)] + [(f"cascade-{m}", m) for m in modes]
+    reports, reference = [], None
+    for name, mode in configs:
+        if mode is None:
+            model = YOLO(large if name == "large" else small)
+        else:
+            policy = EscalationPolicy(line=[(0, line_ratio), (1, line_ratio)], mode=mode, **policy_kwargs)
+            model = CascadeModel(YOLO(small), YOLO(large), policy)
+        end = max_frames / VideoReader(video).fps if max_frames else None
+        cap = VideoReader(video, end=end, buffers=batch_size + 2)
+        width, height = cap.width, cap.height
+        counter = LineCounter([(0, int(height * line_ratio)), (width, int(height * line_ratio))])
+        tracker = BatchTracker(model, batch_size=batch_size, frame_rate=round(cap.fps), imgsz=imgsz, conf=conf, classes=classes)
+
+        outputs = []
+        t0 = time.perf_counter()
+        for idx, _, tracks in tracker.iter_video(cap):
+            counter.update(tracks.xyxy, tracks.ids, idx)
+            outputs.append((tracks.xyxy, tracks.cls))
+        elapsed = time.perf_counter() - t0
+        if reference is None:
+            reference = outputs
+
+        report = {
+            "config": name,
+            "frames": len(outputs),
+            "fps": round(len(outputs) / elapsed, 2) if elapsed > 0 else 0.0,
+            "count": counter.count,
+            "parity": round(float(np.mean([box_parity(*ref, *out) for ref, out in zip(reference, outputs)])), 4),
+        }
+        if mode is not None:
+            report.update(model.stats())
+        reports.append(report)
+
+    base = reports[0]
+    for r in reports:
+        r["speedup"] = round(r["fps"] / base["fps"], 2) if base["fps"] else 0.0
+        r["count_error"] = r["count"] - base["count"]
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh cascade nano -> medium với chỉ chạy model lớn")
+    parser.add_argument("video", help="vd: video/count-car1.mp4")
+    parser.add_argument("--small", default="yolov8n.pt")
+    parser.add_argument("--large", default="yolov8m.pt")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--low", type=float, default=0.25, help="Box có conf trong [low, conf) -> đẩy lên model lớn")
+    parser.add_argument("--crowd", type=int, default=20)
+    parser.add_argument("--line-margin", type=float, default=0.08)
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--modes", nargs="+", default=["frame", "crop"], choices=["frame", "crop"])
+    args = parser.parse_args()
+
+    for report in compare(args.video, args.small, args.large, args.batch, args.imgsz, args.conf, max_frames=args.max_frames,
+                          modes=args.modes, low=args.low, crowd=args.crowd, line_margin=args.line_margin):
+        print(report)
@@ -0,0 +1,427 @@
+"""
+Chạy đếm hàng loạt (không cần Streamlit) trên cả thư mục video.
+
+Ví dụ:
+    python -m vision video/ --task vehicles --workers 4 --out results/
+    python -m vision "cctv/**/*.mp4" --task pedestrians --min-hits 20
+    python -m vision cctv/ --task pedestrians --heatmap --zones zones.txt
+    python -m vision video/ --task vehicles --speed calib.json
+    python -m vision cctv/junction/ --task junction --speed calib.json
+
+Kết quả mỗi video: <tên>.json (số đếm) + <tên>.tracks.csv (toàn bộ track),
+thêm <tên>.heatmap.npz / .png và <tên>.zones.json nếu bật --heatmap / --zones,
+<tên>.speeds.csv (tốc độ từng xe) nếu có --speed.
+Tiến độ được ghi vào manifest.json, chạy lại cùng lệnh sẽ bỏ qua các video đã xong.
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from vision.backends import BACKENDS
+from vision.counter import HitCounter, LineCounter, anchor_points
+
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv")
+
+# Cấu hình mặc định theo từng bài toán (giống các app Streamlit)
+TASKS = {
+    "vehicles": {"model": "yolov8m.pt", "classes": [2, 5, 7]},
+    "pedestrians": {"model": "yolov8n.pt", "classes": [0]},
+    # Xe + người (+ tốc độ) trong MỘT lượt tracking, xem vision.engine
+    "junction": {"model": "yolov8m.pt", "classes": [0, 2, 3, 5, 7]},
+}
+
+# Model được load MỘT lần cho mỗi process worker
+_MODEL = None
+_BACKEND = None
+
+
+def find_videos(inputs):
+    """Nhận danh sách thư mục / file / glob, trả về danh sách video (đã sắp xếp, không trùng)."""
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                found.update(os.path.join(root, f) for f in files if f.lower().endswith(VIDEO_EXTS))
+        elif os.path.isfile(item):
+            found.add(item)
+        else:
+            found.update(p for p in glob.glob(item, recursive=True) if p.lower().endswith(VIDEO_EXTS))
+    return sorted(os.path.abspath(p) for p in found)
+
+
+def video_key(path):
+    """Khóa nhận diện video trong manifest: đường dẫn + kích thước + thời gian sửa."""
+    st = os.stat(path)
+    return f"{path}|{st.st_size}|{int(st.st_mtime)}"
+
+
+def path_digest(path):
+    # Hash ngắn của đường dẫn để 2 video cùng tên ở 2 thư mục không ghi đè nhau
+    return hashlib.sha1(path.encode("utf-8")).hexdigest()[:8]
+
+
+def output_stem(out_dir, path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(out_dir, f"{name}-{path_digest(path)}")
+
+
+# --- Manifest ---
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"videos": {}}
+
+
+def save_manifest(manifest, path):
+    # Ghi ra file tạm rồi đổi tên -> không bao giờ để lại manifest hỏng khi bị ngắt
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+# --- Logic đếm ---
+def count_vehicles(tracks_iter, width, height, line_ratio=0.6, events=None, clock=None):
+    """
+    Giống app.py: đếm xe có tâm cắt qua vạch ngang ở `line_ratio` chiều cao.
+    `events` (EventStore): ghi từng lượt qua vạch với thời điểm `clock(idx)`.
+    """
+    line_y = int(height * line_ratio)
+    counter = LineCounter([(0, line_y), (width, line_y)])
+    for idx, tracks in tracks_iter:
+        crossed, directions = counter.update(tracks.xyxy, tracks.ids)
+        if events is not None:
+            events.add_crossings(clock(idx), tracks, crossed, directions, zone="line")
+        yield idx, tracks
+    yield None, {"count": counter.count, "in": counter.in_count, "out": counter.out_count, "line_y": line_y}
+
+
+def count_pedestrians(tracks_iter, min_hits=20, events=None, clock=None):
+    """Giống app_pedestrian.py: chỉ đếm ID tồn tại hơn `min_hits` frame (Anti-Flicker)."""
+    counter = HitCounter(min_hits)
+    for idx, tracks in tracks_iter:
+        counter.update(tracks.ids)
+        if events is not None:
+            events.add_crossings(clock(idx), tracks, counter.newly_counted, zone="unique")
+        yield idx, tracks
+    yield None, {"count": counter.count, "min_hits": min_hits}
+
+
+def count_junction(tracks_iter, engine, clock=None, events=None, event_clock=None):
+    """
+    Camera ngã tư: mọi phân tích của `engine` (xe qua vạch, người, tốc độ) dùng
+    chung một lượt tracking thay vì mỗi bài toán chạy lại model.
+    """
+    for idx, tracks in tracks_iter:
+        out = engine.update(tracks, idx, clock(idx) if clock is not None else None)
+        if events is not None:
+            ts = event_clock(idx)
+            crossed, directions = out["vehicles"]
+            events.add_crossings(ts, tracks, crossed, directions, zone="line")
+            events.add_crossings(ts, tracks, out["pedestrians"], zone="unique")
+        yield idx, tracks
+    results = engine.results()
+    yield None, {"count": {name: r["count"] for name, r in results.items() if "count" in r}, **results}
+
+
+def _analyzed(tracks_iter, heatmap=None, zones=None, min_hits=None):
+    # Heatmap / vùng cộng dồn trên đường đi; `min_hits`: chỉ tính người đã qua Anti-Flicker như app
+    gate = HitCounter(min_hits) if min_hits else None
+    for idx, tracks in tracks_iter:
+        xyxy, ids = tracks.xyxy, tracks.ids
+        if gate is not None:
+            _, counted = gate.update(ids, idx)
+            xyxy, ids = xyxy[counted], ids[counted]
+        # Vị trí chân, như app_pedestrian.py
+        points = anchor_points(xyxy, "bottom")
+        if heatmap is not None:
+            heatmap.update(points)
+        if zones is not None:
+            zones.update(points, ids, idx)
+        yield idx, tracks
+
+
+def _measured(tracks_iter, estimator, clock, speeds):
+    # Tốc độ theo timestamp của frame (PTS), không phụ thuộc tốc độ xử lý
+    for idx, tracks in tracks_iter:
+        speeds.add(tracks.ids, estimator.update(tracks.xyxy, tracks.ids, clock(idx), idx))
+        yield idx, tracks
+
+
+def _recorded(tracks_iter, writer):
+    # Ghi từng frame vào cache; chỉ hoàn tất cache khi duyệt hết video
+    with writer:
+        for idx, tracks in tracks_iter:
+            writer.add(idx, tracks)
+            yield idx, tracks
+
+
+# --- Worker ---
+def _init_worker(model_path, backend, batch, threads):
+    global _MODEL, _BACKEND
+    from vision.backends import load_model
+    from vision.warmup import warm_up
+
+    # Chia đều CPU cho các worker, tránh nhiều process tranh nhau cùng một lõi
+    _MODEL, _BACKEND = load_model(model_path, backend, batch=batch, threads=threads)
+    # Cold start trả một lần ở đây, không tính vào fps của video đầu tiên
+    warm_up(_MODEL, 640, batch=batch)
+
+
+def process_video(path, stem, options, use_cache=True):
+    """
+    Xử lý một video trong process worker, ghi <stem>.json và <stem>.tracks.csv.
+
+    Track được cache theo (video, model, conf, classes): chạy lại với `--min-hits`
+    khác chỉ đọc cache rồi đếm lại, không gọi model.
+    """
+    import cv2
+
+    from vision.analytics import OccupancyHeatmap, ZoneAnalytics, parse_zones
+    from vision.decode import VideoReader, probe
+    from vision.engine import AnalyticsEngine, SpeedMeasure, make_analytics
+    from vision.events import EventStore, source_key
+    from vision.speed import Calibration, SpeedEstimator, TrackSpeeds, frame_clock
+    from vision.trackcache import TrackCacheWriter, cache_key, open_cache
+    from vision.tracking import BatchTracker
+
+    start, end = options.get("window") or (None, None)
+    # BatchTracker giữ cả lô frame cùng lúc -> vòng buffer phải lớn hơn batch
+    cap = VideoReader(path, start=start, end=end, buffers=options["batch"] + 2)
+    if not cap.isOpened():
+        raise IOError(f"Không mở được video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    key = cache_key(
+        path, options["model"], backend=_BACKEND, imgsz=640, conf=options["conf"],
+        classes=options["classes"], tracker="bytetrack.yaml", stride=1, window=options.get("window"),
+    )
+    cached = open_cache(key) if use_cache else None
+    writer = None
+    if cached is not None:
+        cap.release()
+        tracks_iter = iter(cached)
+    else:
+        tracker = BatchTracker(
+            _MODEL, batch_size=options["batch"], frame_rate=round(fps),
+            conf=options["conf"], classes=options["classes"],
+        )
+        tracks_iter = ((idx, tracks) for idx, _, tracks in tracker.iter_video(cap))
+        if use_cache:
+            writer = TrackCacheWriter(key, video=os.path.basename(path))
+            tracks_iter = _recorded(tracks_iter, writer)
+    heatmap = OccupancyHeatmap(width, height, fps=fps) if options.get("heatmap") else None
+    zones = ZoneAnalytics(parse_zones(options["zones"], width, height), fps=fps) if options.get("zones") else None
+    if heatmap is not None or zones is not None:
+        min_hits = options["min_hits"] if options["task"] == "pedestrians" else None
+        tracks_iter = _analyzed(tracks_iter, heatmap, zones, min_hits)
+    speeds = None
+    if options.get("speed") and options["task"] != "junction":
+        speeds = TrackSpeeds()
+        estimator = SpeedEstimator(Calibration.from_dict(options["speed"], (width, height)))
+        tracks_iter = _measured(tracks_iter, estimator, frame_clock(path, fps, start), speeds)
+    events, event_clock = None, None
+    if options.get("events"):
+        # Không có giờ ghi hình trong file: coi mtime là lúc kết thúc bản ghi (như file CCTV vừa ghi xong)
+        started = os.path.getmtime(path) - probe(path)["duration"]
+        video_clock = frame_clock(path, fps, start)
+
+        def event_clock(idx):
+            return started + video_clock(idx)
+        # Chạy lại cùng video + task thì thay sự kiện cũ của đúng lượt đó, nhiều worker ghi chung một file DB
+        source = source_key(options["task"], os.path.basename(path), path_digest(path))
+        events = EventStore(options["events"], source=source, replace=True)
+    if options["task"] == "junction":
+        # Tốc độ (nếu có --speed) là một phân tích của engine, không chạy `_measured` riêng
+        engine = AnalyticsEngine(make_analytics(min_hits=options["min_hits"], calibration=options.get("speed"), conf=options["conf"]))
+        engine.start(width, height, fps)
+        speeds = next((a.speeds for a in engine.analytics if isinstance(a, SpeedMeasure)), None)
+        clock = frame_clock(path, fps, start) if speeds is not None else None
+        counted = count_junction(tracks_iter, engine, clock, events=events, event_clock=event_clock)
+    elif options["task"] == "vehicles":
+        counted = count_vehicles(tracks_iter, width, height, events=events, clock=event_clock)
+    else:
+        counted = count_pedestrians(tracks_iter, options["min_hits"], events=events, clock=event_clock)
+
+    t0 = time.perf_counter()
+    frames = 0
+    summary = None
+    csv_part = stem + ".tracks.csv.part"
+    try:
+        with open(csv_part, "w", newline="", encoding="utf-8") as f:
+            rows = csv.writer(f)
+            rows.writerow(["frame", "track_id", "cls", "conf", "x1", "y1", "x2", "y2"])
+            for idx, tracks in counted:
+                if idx is None:
+                    summary = tracks
+                    break
+                frames += 1
+                for box, obj_id, cls, conf in zip(tracks.xyxy.tolist(), tracks.ids.tolist(), tracks.cls.tolist(), tracks.conf.tolist()):
+                    rows.writerow([idx, obj_id, cls, round(conf, 4)] + [round(v, 1) for v in box])
+    finally:
+        if events is not None:
+            events.close()
+    elapsed = time.perf_counter() - t0
+
+    os.replace(csv_part, stem + ".tracks.csv")
+    result = {
+        "video": path,
+        "task": options["task"],
+        "model": options["model"],
+        "frames": frames,
+        "fps_video": fps,
+        "seconds": round(elapsed, 2),
+        "fps_processing": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "from_cache": cached is not None,
+        **summary,
+    }
+    if heatmap is not None:
+        result["heatmap"] = heatmap.save(stem + ".heatmap.npz")
+    if zones is not None:
+        zones.save(stem + ".zones.json", zones.store.frame)
+        result["zones"] = {name: {k: v for k, v in z.items() if k != "dwell_hist"} for name, z in zones.snapshot()["zones"].items()}
+    if events is not None:
+        result["events"] = events.stats()
+    if speeds is not None:
+        result["speed"] = speeds.summary()
+        with open(stem + ".speeds.csv", "w", newline="", encoding="utf-8") as f:
+            rows = csv.writer(f)
+            rows.writerow(["track_id", "median_kmh", "max_kmh"])
+            rows.writerows(zip(*(v.tolist() for v in speeds.per_track())))
+    with open(stem + ".json", "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
+
+
+def write_summary(manifest, path):
+    rows, extra = [], []
+    for v in manifest["videos"].values():
+        if v.get("status") != "done":
+            continue
+        row = dict(v["result"])
+        if isinstance(row.get("count"), dict):
+            # --task junction: mỗi phân tích một cột (vehicles, pedestrians, ...)
+            counts = row.pop("count")
+            row.update(counts)
+            extra += [name for name in counts if name not in extra]
+        rows.append(row)
+    fields = ["video", "task", "model", "frames", "count", *extra, "seconds", "fps_processing"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run(args):
+    os.makedirs(args.out, exist_ok=True)
+    manifest_path = os.path.join(args.out, "manifest.json")
+    manifest = load_manifest(manifest_path)
+
+    task = TASKS[args.task]
+    options = {
+        "task": args.task,
+        "model": args.model or task["model"],
+        "classes": task["classes"],
+        "conf": args.conf,
+        "batch": args.batch,
+        "min_hits": args.min_hits,
+    }
+    if args.start is not None or args.end is not None:
+        options["window"] = [args.start, args.end]
+    if args.heatmap:
+        options["heatmap"] = True
+    if args.speed:
+        with open(args.speed, encoding="utf-8") as f:
+            options["speed"] = json.load(f)
+    if args.events:
+        options["events"] = os.path.abspath(args.events)
+    if args.zones:
+        # Lưu nội dung (không phải đường dẫn) để sửa file vùng thì manifest biết phải chạy lại
+        with open(args.zones, encoding="utf-8") as f:
+            options["zones"] = f.read()
+
+    todo = []
+    for path in find_videos(args.inputs):
+        key = video_key(path)
+        entry = manifest["videos"].get(key)
+        if entry and entry.get("status") == "done" and entry.get("options") == options:
+            continue
+        if entry and entry.get("status") == "failed" and args.skip_failed:
+            continue
+        todo.append((key, path))
+
+    print(f"{len(todo)} video cần xử lý ({len(manifest['videos'])} đã có trong manifest)")
+    if not todo:
+        write_summary(manifest, os.path.join(args.out, "summary.csv"))
+        return manifest
+
+    # "spawn" để mỗi worker có PyTorch sạch (không fork khi đã có thread)
+    ctx = mp.get_context("spawn")
+    executor = ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(options["model"], args.backend, args.batch, max(1, (os.cpu_count() or 1) // args.workers)),
+    )
+    try:
+        futures = {
+            executor.submit(process_video, path, output_stem(args.out, path), options, not args.no_cache): (key, path)
+            for key, path in todo
+        }
+        for future in as_completed(futures):
+            key, path = futures[future]
+            try:
+                result = future.result()
+                manifest["videos"][key] = {"status": "done", "options": options, "result": result}
+                print(f"[OK] {path}: {result['count']} ({result['fps_processing']} frame/s)")
+            except Exception as e:
+                manifest["videos"][key] = {"status": "failed", "options": options, "error": str(e)}
+                print(f"[LỖI] {path}: {e}")
+            save_manifest(manifest, manifest_path)
+    except KeyboardInterrupt:
+        print("Đã dừng. Chạy lại cùng lệnh để tiếp tục từ manifest.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    write_summary(manifest, os.path.join(args.out, "summary.csv"))
+    return manifest
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m vision", description="Đếm xe / người đi bộ hàng loạt trên nhiều video")
+    parser.add_argument("inputs", nargs="+", help="Thư mục, file video hoặc glob (vd: 'cctv/**/*.mp4')")
+    parser.add_argument("--task", choices=sorted(TASKS), default="vehicles")
+    parser.add_argument("--out", default="results", help="Thư mục kết quả (chứa manifest.json)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--model", default=None, help="Mặc định: yolov8m.pt (xe) / yolov8n.pt (người)")
+    parser.add_argument("--backend", choices=BACKENDS, default="pytorch", help="ONNX / OpenVINO được export và cache một lần")
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--batch", type=int, default=8, help="Số frame mỗi lần gọi model")
+    parser.add_argument("--min-hits", type=int, default=20, help="Anti-Flicker cho bài toán pedestrians")
+    parser.add_argument("--skip-failed", action="store_true", help="Không thử lại các video đã lỗi")
+    parser.add_argument("--start", type=float, default=None, help="Chỉ phân tích từ giây thứ ... (seek theo keyframe)")
+    parser.add_argument("--end", type=float, default=None, help="... tới giây thứ")
+    parser.add_argument("--no-cache", action="store_true", help="Luôn chạy model, không đọc / ghi cache track")
+    parser.add_argument("--speed", default=None, help="File JSON hiệu chỉnh (4 điểm ảnh + kích thước thật) -> đo tốc độ từng xe")
+    parser.add_argument("--heatmap", action="store_true", help="Ghi heatmap mật độ <tên>.heatmap.npz / .png")
+    parser.add_argument("--events", default=None, help="File SQLite ghi từng lượt đếm (vd: events/events.db), xem: python -m vision.events")
+    parser.add_argument("--zones", default=None, help="File vùng, mỗi dòng 'tên: x,y x,y x,y ...' (%% khung hình) -> <tên>.zones.json")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        run(args)
+    except KeyboardInterrupt:
+        return 130
+    return 0
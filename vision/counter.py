@@ -0,0 +1,236 @@
+"""
+Bộ đếm dùng chung cho các app (xe, người đi bộ).
+
+Mọi phép tính đều trên mảng NumPy cho tất cả track trong frame cùng lúc,
+không có vòng lặp Python theo từng box. Trạng thái theo track nằm trong
+TrackStore nên track biến mất quá `max_idle` frame sẽ được giải phóng
+(giữ `max_idle` lớn hơn `track_buffer` của ByteTrack để ID không bị đếm lại).
+"""
+import cv2
+import numpy as np
+
+from vision.tracks import TrackStore
+
+
+def anchor_points(xyxy, anchor="center"):
+    """Điểm đại diện của box: tâm ("center") hoặc điểm giữa cạnh đáy ("bottom")."""
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    cx = (xyxy[:, 0] + xyxy[:, 2]) / 2
+    cy = xyxy[:, 3] if anchor == "bottom" else (xyxy[:, 1] + xyxy[:, 3]) / 2
+    return np.stack([cx, cy], axis=1)
+
+
+def _cross(o, a, b):
+    # Tích có hướng (a - o) x (b - o), broadcast theo các trục đầu
+    return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+
+def segments_cross(p, q, a, b):
+    """
+    Kiểm tra N đoạn di chuyển p->q có cắt K đoạn thẳng a->b hay không.
+
+    Trả về (hit, side): hai mảng (N, K). `side > 0` nghĩa là điểm p nằm bên
+    "trái" của a->b (theo hệ trục ảnh, y hướng xuống).
+    """
+    P, Q = p[:, None, :], q[:, None, :]
+    A, B = a[None, :, :], b[None, :, :]
+    d1 = _cross(A, B, P)
+    d2 = _cross(A, B, Q)
+    d3 = _cross(P, Q, A)
+    d4 = _cross(P, Q, B)
+    # Quy ước nửa mở (0 thuộc phía "phải") -> chạm đúng vạch không bị đếm 2 lần
+    hit = ((d1 > 0) != (d2 > 0)) & ((d3 > 0) != (d4 > 0))
+    return hit, d1
+
+
+def points_in_polygon(points, polygon):
+    """Ray casting cho N điểm với đa giác K đỉnh, trả về mảng bool (N,)."""
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    straddle = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = (x2 - x1) * (y - y1) / (y2 - y1) + x1
+    return (straddle & (x < x_cross)).sum(axis=1) % 2 == 1
+
+
+class LineCounter:
+    """
+    Đếm track cắt qua một vạch kẻ (đường gấp khúc gồm >= 2 điểm).
+
+    Mỗi track lưu lại điểm của frame trước; một lần đếm xảy ra khi đoạn
+    di chuyển prev -> cur cắt vạch, nên xe chạy nhanh "nhảy" qua vạch
+    giữa 2 frame vẫn được đếm.
+
+    Hướng: "in" là đi từ phía trái sang phía phải của vạch (theo thứ tự điểm).
+    Với vạch ngang vẽ từ trái sang phải, "in" là đi từ dưới lên trên.
+    Mỗi track được đếm tối đa một lần cho mỗi hướng; với "both", `count` là số
+    track đã qua vạch (tâm box rung qua lại vạch vẫn chỉ tính một lần),
+    `in_count` / `out_count` là thống kê riêng từng hướng.
+    """
+
+    def __init__(self, points, direction="both", anchor="center", capacity=1024, max_idle=150):
+        pts = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        if len(pts) < 2:
+            raise ValueError("Vạch kẻ cần ít nhất 2 điểm")
+        if direction not in ("both", "in", "out"):
+            raise ValueError(f"direction không hợp lệ: '{direction}'")
+        self.points = pts
+        self.direction = direction
+        self.anchor = anchor
+        self.in_count = 0
+        self.out_count = 0
+        self.track_count = 0  # số track đã được đếm (ít nhất một hướng)
+        self._a, self._b = pts[:-1], pts[1:]
+        self.store = TrackStore(capacity, max_idle=max_idle, prev=((2,), np.float32), counted=((2,), bool))
+
+    @property
+    def count(self):
+        if self.direction == "in":
+            return self.in_count
+        if self.direction == "out":
+            return self.out_count
+        return self.track_count
+
+    def update(self, xyxy, ids, frame=None):
+        """
+        Cập nhật với các box của một frame.
+
+        Trả về (crossed_ids, directions): các ID vừa được đếm ở frame này và
+        hướng tương ứng (+1 = in, -1 = out).
+        """
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        pts = anchor_points(xyxy, self.anchor)
+        slots, is_new = self.store.touch(ids, frame)
+        valid = slots >= 0
+        known = valid & ~is_new
+        crossed_ids = np.zeros(0, np.int64)
+        directions = np.zeros(0, np.int8)
+
+        if known.any():
+            s = slots[known]
+            prev, cur = self.store["prev"][s], pts[known]
+            hit, side = segments_cross(prev, cur, self._a, self._b)
+            # Cộng hướng qua từng đoạn: đi qua 2 đoạn ngược chiều nhau thì triệt tiêu
+            net = np.where(hit, np.where(side > 0, 1, -1), 0).sum(axis=1)
+            moved = net != 0
+            if moved.any():
+                dirs = np.sign(net[moved]).astype(np.int8)
+                col = (dirs < 0).astype(np.intp)  # cột 0 = in, 1 = out
+                ms = s[moved]
+                fresh = ~self.store["counted"][ms, col]
+                self.track_count += int((fresh & ~self.store["counted"][ms].any(axis=1)).sum())
+                self.store["counted"][ms[fresh], col[fresh]] = True
+                directions = dirs[fresh]
+                crossed_ids = ids[known][moved][fresh]
+                self.in_count += int((directions > 0).sum())
+                self.out_count += int((directions < 0).sum())
+
+        self.store["prev"][slots[valid]] = pts[valid]
+        return crossed_ids, directions
+
+    def draw(self, frame, color=(0, 0, 255), thickness=3):
+        cv2.polylines(frame, [self.points.astype(np.int32).reshape(-1, 1, 2)], False, color, thickness)
+        return frame
+
+
+class ZoneCounter:
+    """
+    Đếm track đi vào / đi ra một vùng đa giác.
+
+    "in" khi điểm của track chuyển từ ngoài vào trong đa giác giữa 2 frame,
+    "out" khi ngược lại. `occupancy` là số track đang ở trong vùng. Như
+    LineCounter, `count` với "both" tính mỗi track một lần.
+    """
+
+    def __init__(self, polygon, direction="in", anchor="bottom", capacity=1024, max_idle=150):
+        poly = np.asarray(polygon, dtype=np.float32).reshape(-1, 2)
+        if len(poly) < 3:
+            raise ValueError("Vùng đếm cần ít nhất 3 điểm")
+        if direction not in ("both", "in", "out"):
+            raise ValueError(f"direction không hợp lệ: '{direction}'")
+        self.polygon = poly
+        self.direction = direction
+        self.anchor = anchor
+        self.in_count = 0
+        self.out_count = 0
+        self.track_count = 0  # số track đã được đếm (ít nhất một hướng)
+        self.occupancy = 0
+        self.store = TrackStore(capacity, max_idle=max_idle, inside=((), bool), counted=((2,), bool))
+
+    @property
+    def count(self):
+        if self.direction == "in":
+            return self.in_count
+        if self.direction == "out":
+            return self.out_count
+        return self.track_count
+
+    def update(self, xyxy, ids, frame=None):
+        """Giống LineCounter.update: trả về (crossed_ids, directions)."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        inside = points_in_polygon(anchor_points(xyxy, self.anchor), self.polygon)
+        self.occupancy = int(inside.sum())
+        slots, is_new = self.store.touch(ids, frame)
+        valid = slots >= 0
+        known = valid & ~is_new
+        crossed_ids = np.zeros(0, np.int64)
+        directions = np.zeros(0, np.int8)
+
+        if known.any():
+            s = slots[known]
+            was, now = self.store["inside"][s], inside[known]
+            changed = was != now
+            if changed.any():
+                dirs = np.where(now[changed], 1, -1).astype(np.int8)
+                col = (dirs < 0).astype(np.intp)
+                cs = s[changed]
+                fresh = ~self.store["counted"][cs, col]
+                self.track_count += int((fresh & ~self.store["counted"][cs].any(axis=1)).sum())
+                self.store["counted"][cs[fresh], col[fresh]] = True
+                directions = dirs[fresh]
+                crossed_ids = ids[known][changed][fresh]
+                self.in_count += int((directions > 0).sum())
+                self.out_count += int((directions < 0).sum())
+
+        self.store["inside"][slots[valid]] = inside[valid]
+        return crossed_ids, directions
+
+    def draw(self, frame, color=(0, 0, 255), thickness=3):
+        cv2.polylines(frame, [self.polygon.astype(np.int32).reshape(-1, 1, 2)], True, color, thickness)
+        return frame
+
+
+class HitCounter:
+    """
+    Đếm ID duy nhất có cơ chế Anti-Flicker: một ID chỉ được tính khi đã
+    xuất hiện hơn `min_hits` frame.
+    """
+
+    def __init__(self, min_hits=20, capacity=1024, max_idle=150):
+        self.min_hits = min_hits
+        self.count = 0
+        # ID vừa được đếm ở lần `update` gần nhất (để ghi sự kiện)
+        self.newly_counted = np.zeros(0, np.int64)
+        self.store = TrackStore(capacity, max_idle=max_idle, hits=((), np.int32), counted=((), bool))
+
+    def update(self, ids, frame=None):
+        """Trả về (hits, counted): tuổi thọ và trạng thái đã đếm của từng ID trong frame."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        slots, _ = self.store.touch(ids, frame)
+        valid = slots >= 0
+        s = slots[valid]
+
+        hits = self.store["hits"]
+        counted = self.store["counted"]
+        hits[s] += 1
+        newly = (hits[s] > self.min_hits) & ~counted[s]
+        counted[s[newly]] = True
+        self.count += int(newly.sum())
+        self.newly_counted = ids[valid][newly]
+
+        out_hits = np.zeros(len(ids), np.int32)
+        out_counted = np.zeros(len(ids), bool)
+        out_hits[valid] = hits[s]
+        out_counted[valid] = counted[s]
+        return out_hits, out_counted
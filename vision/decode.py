@@ -0,0 +1,303 @@
+"""
+Lớp giải mã video dùng chung, thay cho `cv2.VideoCapture(path)` + `cap.read()`:
+
+- Dùng lại một vòng buffer cấp phát sẵn (`cap.read(buf)`), không cấp phát frame mới mỗi lần đọc.
+- `step=k`: chỉ giải mã đầy đủ 1/k frame, các frame bỏ qua chỉ `grab()` (không chuyển màu / copy).
+- `size=(w, h)`: trả về frame đã thu nhỏ (PyAV: thu nhỏ ngay lúc chuyển sang BGR).
+- `start` / `end` (giây): seek tới keyframe gần nhất rồi giải mã tới đúng thời điểm,
+  để chỉ phân tích một khoảng của bản ghi dài hoặc chia file cho nhiều worker.
+
+VideoReader có `read()`, `get()`, `isOpened()`, `release()` như VideoCapture nên
+dùng thẳng được với FramePipeline, BatchTracker...
+
+PyAV (`pip install av`) là tùy chọn: có thì dùng cho seek chính xác theo keyframe,
+giải mã đa luồng và thu nhỏ khi chuyển màu; không có thì dùng OpenCV.
+
+Ví dụ:
+    reader = VideoReader("video/count-car1.mp4", start=60, end=120, step=2)
+    for idx, frame in reader:
+        ...
+    python -m vision.decode video/count-car1.mp4
+"""
+import argparse
+import importlib.util
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+def has_pyav():
+    return importlib.util.find_spec("av") is not None
+
+
+def _is_file(source):
+    return isinstance(source, (str, os.PathLike)) and os.path.isfile(source)
+
+
+class VideoReader:
+    """
+    Đọc video theo kiểu VideoCapture, trả về frame BGR và chỉ số frame tuyệt đối.
+
+    Lưu ý: với backend OpenCV, frame trả về nằm trong vòng `buffers` buffer dùng lại,
+    nên người gọi không được giữ quá `buffers - 1` frame cùng lúc (cần giữ lâu thì
+    `.copy()`). Mặc định 16 đủ cho FramePipeline (hàng đợi 8 + kết quả 2 + đang xử lý).
+    """
+
+    def __init__(self, source, start=None, end=None, step=1, size=None, backend="auto", buffers=16):
+        if backend == "auto":
+            backend = "pyav" if has_pyav() and _is_file(source) and (start or size) else "opencv"
+        if backend not in ("opencv", "pyav"):
+            raise ValueError(f"backend không hợp lệ: '{backend}'")
+        self.source = source
+        self.backend = backend
+        self.start = start or 0.0
+        self.end = end
+        self.step = max(1, step)
+        self.size = tuple(size) if size else None
+        self.index = -1  # chỉ số (tuyệt đối) của frame vừa đọc
+        self.time = 0.0  # thời điểm (giây) của frame vừa đọc
+        self._ring = [None] * max(1, buffers)
+        self._ring_pos = 0
+        self._scratch = None
+        self._opened = False
+
+        if backend == "opencv":
+            self._open_opencv()
+        else:
+            self._open_pyav()
+
+    # --- OpenCV ---
+    def _open_opencv(self):
+        self._cap = cv2.VideoCapture(self.source)
+        self._opened = self._cap.isOpened()
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.frame_count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.start:
+            # Backend FFmpeg của OpenCV seek tới keyframe rồi giải mã tới đúng mốc
+            self._cap.set(cv2.CAP_PROP_POS_MSEC, self.start * 1000)
+
+    def _next_buffer(self, shape):
+        buf = self._ring[self._ring_pos]
+        if buf is None or buf.shape != shape:
+            buf = self._ring[self._ring_pos] = np.empty(shape, np.uint8)
+        self._ring_pos = (self._ring_pos + 1) % len(self._ring)
+        return buf
+
+    def _read_opencv(self):
+        # Các frame bị bỏ qua chỉ grab (giải mã gói tin, không chuyển sang BGR)
+        skip = self.step - 1 if self.index >= 0 else 0
+        for _ in range(skip):
+            if not self._cap.grab():
+                return False, None
+        if not self._cap.grab():
+            return False, None
+        self.index = int(self._cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+        self.time = self._cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if self.size is None:
+            ok, frame = self._cap.retrieve(self._next_buffer((self.height, self.width, 3)))
+            return ok, frame
+        ok, self._scratch = self._cap.retrieve(self._scratch)
+        if not ok:
+            return False, None
+        w, h = self.size
+        return True, cv2.resize(self._scratch, (w, h), dst=self._next_buffer((h, w, 3)), interpolation=cv2.INTER_AREA)
+
+    # --- PyAV ---
+    def _open_pyav(self):
+        import av
+
+        self._container = av.open(str(self.source))
+        self._stream = self._container.streams.video[0]
+        # Giải mã đa luồng (frame + slice) trong FFmpeg
+        self._stream.thread_type = "AUTO"
+        self._opened = True
+        self._time_base = float(self._stream.time_base)
+        self.fps = float(self._stream.average_rate or 30.0)
+        self.width = self._stream.codec_context.width
+        self.height = self._stream.codec_context.height
+        self.frame_count = int(self._stream.frames or 0)
+        if self.start:
+            self._container.seek(int(self.start / self._time_base), stream=self._stream, backward=True, any_frame=False)
+        self._frames = self._container.decode(self._stream)
+
+    def _read_pyav(self):
+        for frame in self._frames:
+            t = float(frame.pts * self._time_base) if frame.pts is not None else self.time + 1.0 / self.fps
+            # Seek chỉ tới keyframe -> bỏ các frame trước mốc start (không chuyển màu)
+            if t < self.start - 0.5 / self.fps:
+                continue
+            index = int(round(t * self.fps))
+            if self.index >= 0 and index - self.index < self.step:
+                continue
+            self.index, self.time = index, t
+            if self.size is None:
+                return True, frame.to_ndarray(format="bgr24")
+            w, h = self.size
+            return True, frame.to_ndarray(format="bgr24", width=w, height=h, interpolation="AREA")
+        return False, None
+
+    # --- Giao diện giống VideoCapture ---
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        ok, frame = self._read_opencv() if self.backend == "opencv" else self._read_pyav()
+        if ok and self.end is not None and self.time > self.end:
+            return False, None
+        return ok, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps / self.step
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.size[0] if self.size else self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.size[1] if self.size else self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            # Số frame sẽ được trả về trong khoảng [start, end]
+            total = self.frame_count
+            if self.end is not None:
+                total = min(total, int(self.end * self.fps) + 1) if total else int(self.end * self.fps) + 1
+            return max(0, total - int(self.start * self.fps)) // self.step
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.time * 1000.0
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.index + 1
+        return 0.0
+
+    def release(self):
+        if self.backend == "opencv":
+            self._cap.release()
+        elif self._opened:
+            self._container.close()
+        self._opened = False
+
+    def __iter__(self):
+        """Duyệt (idx, frame), idx là chỉ số frame tuyệt đối trong video."""
+        try:
+            while True:
+                ok, frame = self.read()
+                if not ok:
+                    return
+                yield self.index, frame
+        finally:
+            self.release()
+
+
+def probe(path):
+    """Thông tin cơ bản của video: fps, số frame, thời lượng, kích thước."""
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    info = {
+        "fps": fps,
+        "frames": frames,
+        "duration": frames / fps if fps else 0.0,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+    cap.release()
+    return info
+
+
+def keyframes(path):
+    """
+    Thời điểm (giây) của các keyframe, đọc từ gói tin (không giải mã) -> rất nhanh.
+    Cần PyAV; không có thì trả về None.
+    """
+    if not has_pyav():
+        return None
+    import av
+
+    with av.open(str(path)) as container:
+        stream = container.streams.video[0]
+        tb = float(stream.time_base)
+        times = [float(p.pts * tb) for p in container.demux(stream) if p.pts is not None and p.is_keyframe]
+    return sorted(times)
+
+
+def frame_times(path):
+    """
+    Timestamp (giây) của từng frame theo thứ tự hiển thị, đọc từ PTS của gói tin
+    (không giải mã). Đúng cả với video frame rate thay đổi; cần PyAV, không có thì None.
+    """
+    if not has_pyav():
+        return None
+    import av
+
+    with av.open(str(path)) as container:
+        stream = container.streams.video[0]
+        tb = float(stream.time_base)
+        pts = [p.pts for p in container.demux(stream) if p.pts is not None and p.size]
+    start = stream.start_time or 0
+    return (np.sort(np.asarray(pts, np.int64)) - start) * tb
+
+
+def split_segments(path, n):
+    """
+    Chia video thành tối đa `n` khoảng (start, end) giây, biên được dời về keyframe
+    gần nhất để mỗi worker seek vào không phải giải mã bỏ đi nhiều frame.
+    """
+    duration = probe(path)["duration"]
+    bounds = [duration * i / n for i in range(n + 1)]
+    kf = keyframes(path)
+    if kf:
+        kf = np.asarray(kf)
+        inner = [float(kf[np.abs(kf - b).argmin()]) for b in bounds[1:-1]]
+        bounds = [0.0] + inner + [duration]
+    bounds = sorted(set(bounds))
+    # Mỗi khoảng là [start, end): end của khoảng trước lùi nửa frame để không trùng frame biên
+    half = 0.5 / (probe(path)["fps"] or 30.0)
+    return [(a, b - half if i < len(bounds) - 2 else None) for i, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+
+def benchmark(path, max_frames=None):
+    """So sánh tốc độ giải mã: VideoCapture gốc và các chế độ của VideoReader."""
+    def run(make):
+        reader = make()
+        t0 = time.perf_counter()
+        n = 0
+        while max_frames is None or n < max_frames:
+            ok, _ = reader.read()
+            if not ok:
+                break
+            n += 1
+        elapsed = time.perf_counter() - t0
+        reader.release()
+        return {"frames": n, "fps": round(n / elapsed, 1) if elapsed > 0 else 0.0}
+
+    info = probe(path)
+    half = (info["width"] // 2, info["height"] // 2)
+    configs = {
+        "cv2.VideoCapture": lambda: cv2.VideoCapture(path),
+        "opencv (buffer ring)": lambda: VideoReader(path, backend="opencv"),
+        "opencv step=2 (grab)": lambda: VideoReader(path, backend="opencv", step=2),
+        "opencv half size": lambda: VideoReader(path, backend="opencv", size=half),
+    }
+    if has_pyav():
+        configs.update({
+            "pyav": lambda: VideoReader(path, backend="pyav"),
+            "pyav half size": lambda: VideoReader(path, backend="pyav", size=half),
+            "pyav second half (seek)": lambda: VideoReader(path, backend="pyav", start=info["duration"] / 2),
+        })
+    return {name: run(make) for name, make in configs.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo tốc độ giải mã / liệt kê keyframe / chia đoạn video")
+    parser.add_argument("video", help="vd: video/count-car1.mp4")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--segments", type=int, default=0, help="In các khoảng thời gian chia cho N worker")
+    args = parser.parse_args()
+
+    print(probe(args.video))
+    if args.segments:
+        print(split_segments(args.video, args.segments))
+    for name, report in benchmark(args.video, args.max_frames).items():
+        print(f"{name:28s} {report}")
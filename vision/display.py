@@ -0,0 +1,93 @@
+"""
+Giảm chi phí đẩy frame lên trình duyệt của Streamlit.
+
+Gửi ảnh RGB full-size mỗi frame thường tốn hơn cả chạy model, nên:
+- chỉ hiển thị tối đa `fps` frame/giây (frame chưa tới lượt thì bỏ qua luôn bước vẽ),
+- thu nhỏ về `max_width` rồi nén JPEG một lần (nén thẳng từ BGR, không cần cvtColor),
+- metric chỉ render lại khi giá trị thay đổi.
+
+Dùng ở tầng render của FramePipeline: tầng infer vẫn chạy đủ mọi frame trên
+thread riêng, render chậm thì kết quả cũ bị bỏ qua.
+"""
+import time
+
+import cv2
+
+from vision.pipeline import StageStats
+
+
+class DisplayPublisher:
+    def __init__(self, placeholder, fps=15, max_width=960, quality=80):
+        self.placeholder = placeholder
+        self.interval = 1.0 / fps if fps else 0.0
+        self.max_width = max_width
+        self.quality = quality
+        self.published = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.encode = StageStats()
+        self._last = None
+        self._metrics = {}
+
+    def due(self):
+        """True nếu đã tới lượt hiển thị frame tiếp theo."""
+        now = time.perf_counter()
+        if self._last is not None and now - self._last < self.interval:
+            self.skipped += 1
+            return False
+        self._last = now
+        return True
+
+    def encode_jpeg(self, frame):
+        h, w = frame.shape[:2]
+        if self.max_width and w > self.max_width:
+            frame = cv2.resize(frame, (self.max_width, int(h * self.max_width / w)), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise ValueError("Không nén được frame sang JPEG")
+        return buf.tobytes()
+
+    def publish(self, frame):
+        """Nén và đẩy frame (BGR) lên placeholder."""
+        t0 = time.perf_counter()
+        data = self.encode_jpeg(frame)
+        self.encode.add(time.perf_counter() - t0)
+        self.placeholder.image(data, use_container_width=True)
+        self.published += 1
+        self.bytes += len(data)
+
+    def metric(self, placeholder, label, value):
+        """Chỉ gọi `placeholder.metric` khi (label, value) khác lần trước."""
+        key = id(placeholder)
+        if self._metrics.get(key) == (label, value):
+            return False
+        placeholder.metric(label, value)
+        self._metrics[key] = (label, value)
+        return True
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "skipped": self.skipped,
+            "encode_ms": round(self.encode.mean_ms, 2),
+            "kb_per_frame": round(self.bytes / self.published / 1024, 1) if self.published else 0.0,
+        }
+
+
+class Throttle:
+    """
+    `due()` True tối đa một lần mỗi `interval` giây. Dùng thay `idx % N == 0` ở
+    tầng render: FramePipeline bỏ frame cũ nên idx nhảy cóc, phép chia lấy dư
+    có thể bị lỡ rất lâu.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._last = None
+
+    def due(self):
+        now = time.perf_counter()
+        if self._last is not None and now - self._last < self.interval:
+            return False
+        self._last = now
+        return True
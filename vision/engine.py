@@ -0,0 +1,251 @@
+"""
+Một lượt detect + tracking cho nhiều phân tích cùng lúc.
+
+Trước đây app.py (đếm xe), app_pedestrian.py (đếm người) và app_speed.py (tốc
+độ) mỗi app load model riêng rồi chạy lại tracking trên cùng video với
+`classes=` khác nhau: camera ngã tư cần cả 3 -> 3 lượt inference. Ở đây:
+
+- Model + ByteTrack chạy MỘT lần với hợp các class của mọi phân tích.
+- Track của từng frame được chia cho từng phân tích (lọc theo class / conf
+  riêng) -> chi phí tỉ lệ với số frame, không phải số frame x số phân tích.
+- Phân tích có sẵn: LineCount (qua vạch), UniqueCount (Anti-Flicker),
+  SpeedMeasure (tốc độ). Phân tích mới chỉ cần `start` / `update` / `result`.
+
+Ví dụ:
+    engine = AnalyticsEngine([LineCount("vehicles"), UniqueCount("pedestrians"), SpeedMeasure("speed", calib)])
+    python -m vision.engine video/junction.mp4 --speed calib.json
+    python -m vision.engine video/junction.mp4 --compare   # một lượt vs mỗi phân tích một lượt
+"""
+import argparse
+import json
+import time
+
+from vision.counter import HitCounter, LineCounter
+from vision.tracking import select_tracks
+
+VEHICLE_CLASSES = (2, 5, 7)
+PEDESTRIAN_CLASSES = (0,)
+
+
+class Analytic:
+    """
+    Một phân tích chạy trên track đã lọc theo `classes` / `conf` của nó.
+    `conf` ở đây lọc track sau khi tracking; model chạy với conf nhỏ nhất của
+    mọi phân tích.
+    """
+
+    def __init__(self, name, classes=None, conf=0.5):
+        self.name = name
+        self.classes = None if classes is None else tuple(classes)
+        self.conf = conf
+
+    def start(self, width, height, fps):
+        """Gọi một lần trước frame đầu tiên (kích thước khung hình, fps của nguồn)."""
+
+    def update(self, tracks, idx, t):
+        """Track của frame `idx` tại thời điểm `t` (giây theo video)."""
+        raise NotImplementedError
+
+    def result(self):
+        return {}
+
+
+class LineCount(Analytic):
+    """Đếm track cắt qua vạch (như app.py). `line`: các điểm theo tỉ lệ khung hình."""
+
+    def __init__(self, name="vehicles", classes=VEHICLE_CLASSES, conf=0.5, line=((0.0, 0.6), (1.0, 0.6)), anchor="center"):
+        super().__init__(name, classes, conf)
+        self.line = line
+        self.anchor = anchor
+        self.counter = None
+
+    def start(self, width, height, fps):
+        self.counter = LineCounter([(x * width, y * height) for x, y in self.line], anchor=self.anchor)
+
+    def update(self, tracks, idx, t):
+        """Trả về (crossed_ids, directions) như LineCounter.update."""
+        return self.counter.update(tracks.xyxy, tracks.ids, idx)
+
+    def result(self):
+        return {"count": self.counter.count, "in": self.counter.in_count, "out": self.counter.out_count}
+
+
+class UniqueCount(Analytic):
+    """Đếm ID duy nhất tồn tại hơn `min_hits` frame (như app_pedestrian.py)."""
+
+    def __init__(self, name="pedestrians", classes=PEDESTRIAN_CLASSES, conf=0.5, min_hits=20):
+        super().__init__(name, classes, conf)
+        self.counter = HitCounter(min_hits)
+
+    def update(self, tracks, idx, t):
+        """Trả về các ID vừa được đếm ở frame này."""
+        self.counter.update(tracks.ids, idx)
+        return self.counter.newly_counted
+
+    def result(self):
+        return {"count": self.counter.count, "min_hits": self.counter.min_hits}
+
+
+class SpeedMeasure(Analytic):
+    """Tốc độ từng xe (như app_speed.py). `calibration`: dict giống file JSON của `--speed`."""
+
+    def __init__(self, name="speed", calibration=None, classes=(2, 3, 5, 7), conf=0.5, window=1.0):
+        from vision.speed import TrackSpeeds
+
+        super().__init__(name, classes, conf)
+        self.calibration = calibration
+        self.window = window
+        self.estimator = None
+        self.speeds = TrackSpeeds()
+
+    def start(self, width, height, fps):
+        from vision.speed import Calibration, SpeedEstimator
+
+        self.estimator = SpeedEstimator(Calibration.from_dict(self.calibration, (width, height)), window=self.window)
+
+    def update(self, tracks, idx, t):
+        """Trả về tốc độ km/h (NaN nếu chưa đủ điểm) theo thứ tự `tracks.ids`."""
+        speeds = self.estimator.update(tracks.xyxy, tracks.ids, t, idx)
+        self.speeds.add(tracks.ids, speeds)
+        return speeds
+
+    def result(self):
+        return self.speeds.summary()
+
+
+class AnalyticsEngine:
+    """
+    Chia track của mỗi frame cho các phân tích. `classes` / `conf` là cấu hình
+    cho model + tracker chạy chung (hợp các class, conf nhỏ nhất).
+    """
+
+    def __init__(self, analytics, profiler=None):
+        self.analytics = list(analytics)
+        names = [a.name for a in self.analytics]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Tên phân tích bị trùng: {names}")
+        self.profiler = profiler
+        self.fps = 30.0
+        self.frames = 0
+
+    @property
+    def classes(self):
+        if any(a.classes is None for a in self.analytics):
+            return None
+        return sorted({c for a in self.analytics for c in a.classes})
+
+    @property
+    def conf(self):
+        return min(a.conf for a in self.analytics)
+
+    def start(self, width, height, fps):
+        self.fps = fps or 30.0
+        for a in self.analytics:
+            a.start(width, height, self.fps)
+
+    def update(self, tracks, idx, t=None):
+        """Trả về {tên phân tích: kết quả `update` của nó} cho frame này."""
+        t = idx / self.fps if t is None else t
+        out = {}
+        for a in self.analytics:
+            sub = select_tracks(tracks, a.classes, a.conf)
+            if self.profiler is None:
+                out[a.name] = a.update(sub, idx, t)
+            else:
+                with self.profiler.stage(a.name):
+                    out[a.name] = a.update(sub, idx, t)
+        self.frames += 1
+        return out
+
+    def results(self):
+        return {a.name: a.result() for a in self.analytics}
+
+
+def make_analytics(line=0.6, min_hits=20, calibration=None, conf=0.5):
+    """Bộ phân tích cho camera ngã tư: xe qua vạch + người (Anti-Flicker) [+ tốc độ]."""
+    analytics = [
+        LineCount("vehicles", conf=conf, line=((0.0, line), (1.0, line))),
+        UniqueCount("pedestrians", conf=conf, min_hits=min_hits),
+    ]
+    if calibration is not None:
+        analytics.append(SpeedMeasure("speed", calibration, conf=conf))
+    return analytics
+
+
+def run_video(video, model, analytics, batch_size=8, imgsz=640, max_frames=None):
+    """Một lượt BatchTracker trên `video` cho mọi phân tích, trả về số frame, frame/s và kết quả."""
+    from vision.decode import VideoReader
+    from vision.speed import frame_clock
+    from vision.tracking import BatchTracker
+
+    engine = AnalyticsEngine(analytics)
+    end = max_frames / VideoReader(video).fps if max_frames else None
+    cap = VideoReader(video, end=end, buffers=batch_size + 2)
+    engine.start(cap.width, cap.height, cap.fps)
+    clock = frame_clock(video, cap.fps)
+    tracker = BatchTracker(model, batch_size=batch_size, frame_rate=round(cap.fps), imgsz=imgsz, conf=engine.conf, classes=engine.classes)
+    t0 = time.perf_counter()
+    for idx, _, tracks in tracker.iter_video(cap):
+        engine.update(tracks, idx, clock(idx))
+    elapsed = time.perf_counter() - t0
+    cap.release()
+    return {
+        "frames": engine.frames,
+        "seconds": round(elapsed, 2),
+        "fps": round(engine.frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "results": engine.results(),
+    }
+
+
+def compare(video, model_path="yolov8m.pt", batch_size=8, imgsz=640, max_frames=None, **analytics_kwargs):
+    """
+    Cùng video, cùng model: mọi phân tích trong MỘT lượt vs mỗi phân tích một
+    lượt riêng (như chạy 3 app). So sánh thời gian và sai số đếm của từng phân tích.
+    """
+    from ultralytics import YOLO
+
+    single = run_video(video, YOLO(model_path), make_analytics(**analytics_kwargs), batch_size, imgsz, max_frames)
+    separate = {"frames": 0, "seconds": 0.0, "results": {}}
+    for analytic in make_analytics(**analytics_kwargs):
+        # Model mới cho mỗi lượt: giống các app load model riêng
+        report = run_video(video, YOLO(model_path), [analytic], batch_size, imgsz, max_frames)
+        separate["frames"] += report["frames"]
+        separate["seconds"] += report["seconds"]
+        separate["results"].update(report["results"])
+    count_error = {
+        name: abs(result.get("count", 0) - separate["results"][name].get("count", 0))
+        for name, result in single["results"].items() if "count" in result
+    }
+    return [
+        {"config": "single-pass", **single},
+        {"config": "separate", **separate, "seconds": round(separate["seconds"], 2)},
+        {"speedup": round(separate["seconds"] / single["seconds"], 2) if single["seconds"] > 0 else None, "count_error": count_error},
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đếm xe + người (+ tốc độ) trong MỘT lượt detect / tracking")
+    parser.add_argument("video", help="vd: video/junction.mp4")
+    parser.add_argument("--model", default="yolov8m.pt")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--line", type=float, default=0.6, help="Vị trí vạch đếm xe (tỉ lệ chiều cao)")
+    parser.add_argument("--min-hits", type=int, default=20, help="Anti-Flicker khi đếm người")
+    parser.add_argument("--speed", default=None, help="File JSON hiệu chỉnh (như `python -m vision --speed`)")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--compare", action="store_true", help="So sánh với mỗi phân tích một lượt riêng")
+    args = parser.parse_args()
+
+    calibration = None
+    if args.speed:
+        with open(args.speed, encoding="utf-8") as f:
+            calibration = json.load(f)
+    kwargs = dict(line=args.line, min_hits=args.min_hits, calibration=calibration, conf=args.conf)
+    if args.compare:
+        for report in compare(args.video, args.model, args.batch, args.imgsz, args.max_frames, **kwargs):
+            print(report)
+    else:
+        from ultralytics import YOLO
+
+        print(run_video(args.video, YOLO(args.model), make_analytics(**kwargs), args.batch, args.imgsz, args.max_frames))
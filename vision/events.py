@@ -0,0 +1,347 @@
+"""
+Lưu từng sự kiện đếm (xe qua vạch, người được đếm...) xuống đĩa để xem lại sau,
+thay vì chỉ có con số trong bộ nhớ mất đi khi phiên Streamlit kết thúc.
+
+- SQLite ở chế độ WAL: chỉ ghi thêm, đọc (dashboard) không chặn ghi, nhiều
+  process (camera / worker CLI) ghi chung một file.
+- Ghi theo lô trên thread nền: `add` chỉ đưa vào hàng đợi có giới hạn (đầy thì
+  bỏ và đếm `dropped`, không bao giờ chặn vòng xử lý video).
+- Bảng `counts_1m` cộng dồn số sự kiện theo phút (nguồn, vùng, class, hướng)
+  ngay lúc ghi -> truy vấn theo giờ / ngày trên nhiều tháng không phải quét
+  từng sự kiện.
+
+Ví dụ:
+    with EventStore("events/events.db", source="cam-1") as events:
+        crossed, dirs = line_counter.update(tracks.xyxy, tracks.ids, idx)
+        events.add_crossings(time.time(), tracks, crossed, dirs, zone="line")
+
+    EventQuery("events/events.db").counts(bucket="1h", since=7 * 86400)
+    python -m vision.events events/events.db --bucket 1h --since 7d
+"""
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,          -- 'source' (camera / video) hoặc 'zone' (vạch, vùng)
+    name TEXT NOT NULL,
+    UNIQUE (kind, name)
+);
+CREATE TABLE IF NOT EXISTS events (
+    ts REAL NOT NULL,            -- unix time (giây)
+    source INTEGER NOT NULL,
+    zone INTEGER NOT NULL,
+    cls INTEGER NOT NULL,
+    track INTEGER NOT NULL,
+    direction INTEGER NOT NULL   -- +1 = in, -1 = out, 0 = không có hướng
+);
+CREATE INDEX IF NOT EXISTS events_source_ts ON events (source, ts);
+CREATE TABLE IF NOT EXISTS counts_1m (
+    minute INTEGER NOT NULL,     -- floor(ts / 60)
+    source INTEGER NOT NULL,
+    zone INTEGER NOT NULL,
+    cls INTEGER NOT NULL,
+    direction INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (minute, source, zone, cls, direction)
+) WITHOUT ROWID;
+"""
+
+GROUP_COLUMNS = ("source", "zone", "cls", "direction")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_STOP = object()
+
+
+def parse_seconds(value):
+    """`90`, `"15m"`, `"1h"`, `"7d"` -> số giây."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value = str(value).strip()
+    if value[-1:] in _UNITS:
+        return float(value[:-1]) * _UNITS[value[-1]]
+    return float(value)
+
+
+def connect(path, readonly=False):
+    if readonly:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Chưa có file sự kiện: {path}")
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: không mất dữ liệu khi app crash
+        conn.executescript(SCHEMA)
+    conn.execute("PRAGMA busy_timeout=30000")  # nhiều process ghi chung: chờ thay vì lỗi "database is locked"
+    return conn
+
+
+def _name_id(conn, cache, kind, name):
+    key = (kind, name)
+    if key not in cache:
+        conn.execute("INSERT OR IGNORE INTO names (kind, name) VALUES (?, ?)", key)
+        cache[key] = conn.execute("SELECT id FROM names WHERE kind = ? AND name = ?", key).fetchone()[0]
+    return cache[key]
+
+
+def source_key(producer, name, digest=None):
+    """
+    Tên nguồn duy nhất cho (app / task, video), vd "vehicles:0001.mp4@1a2b3c4d".
+    `digest`: hash nội dung hoặc đường dẫn -> cam1/0001.mp4 và cam2/0001.mp4 không
+    trùng nhau; app đếm người không đụng tới sự kiện app đếm xe ghi cho cùng file.
+    """
+    return f"{producer}:{name}@{digest[:8]}" if digest else f"{producer}:{name}"
+
+
+class EventStore:
+    """
+    Ghi sự kiện của một nguồn (`source`: tên camera / video) theo lô trên thread nền.
+    `replace=True`: xóa sự kiện cũ của đúng nguồn này trước (chạy lại cùng một
+    video) -> `source` phải riêng cho từng app / task và từng video, xem `source_key`.
+    """
+
+    def __init__(self, path, source="default", flush_interval=1.0, max_batch=4096, queue_size=1024, replace=False):
+        self.path = path
+        self.source = source
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.write_s = 0.0
+        self.error = None
+        self._names = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Mở DB + tạo bảng ngay (lỗi đường dẫn / quyền báo ở đây, không phải trên thread nền)
+        self._conn = connect(path)
+        with self._conn:
+            self._source_id = _name_id(self._conn, self._names, "source", source)
+            if replace:
+                self._conn.execute("DELETE FROM events WHERE source = ?", (self._source_id,))
+                self._conn.execute("DELETE FROM counts_1m WHERE source = ?", (self._source_id,))
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def add(self, ts, track_ids, cls, directions=None, zone="line"):
+        """Thêm các sự kiện cùng thời điểm `ts` (hoặc mảng ts). Không chặn: hàng đợi đầy thì bỏ."""
+        track_ids = np.asarray(track_ids, np.int64).reshape(-1)
+        if not len(track_ids):
+            return
+        cls = np.broadcast_to(np.asarray(cls, np.int64), track_ids.shape)
+        directions = np.broadcast_to(np.asarray(0 if directions is None else directions, np.int64), track_ids.shape)
+        ts = np.broadcast_to(np.asarray(ts, np.float64), track_ids.shape)
+        try:
+            self._queue.put_nowait((zone, np.stack([ts, track_ids, cls, directions], 1)))
+        except queue.Full:
+            self.dropped += len(track_ids)
+
+    def add_crossings(self, ts, tracks, crossed_ids, directions=None, zone="line"):
+        """Từ kết quả `LineCounter.update` / `ZoneCounter.update`: lấy class theo `tracks`."""
+        crossed_ids = np.asarray(crossed_ids, np.int64)
+        if not len(crossed_ids):
+            return
+        # crossed_ids giữ thứ tự của tracks.ids nên lọc theo mask là khớp từng phần tử với `directions`
+        hit = np.isin(tracks.ids, crossed_ids)
+        self.add(ts, tracks.ids[hit], tracks.cls[hit], directions, zone)
+
+    def _write(self, items):
+        t0 = time.perf_counter()
+        rows = []
+        for zone, data in items:
+            zone_id = _name_id(self._conn, self._names, "zone", zone)
+            rows.append(np.column_stack([data, np.full(len(data), zone_id)]))
+        data = np.concatenate(rows)  # ts, track, cls, direction, zone
+        # Cộng dồn theo phút trong NumPy rồi UPSERT một dòng cho mỗi nhóm
+        keys = np.column_stack([np.floor(data[:, 0] / 60), data[:, 4], data[:, 2], data[:, 3]]).astype(np.int64)
+        groups, counts = np.unique(keys, axis=0, return_counts=True)
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO events (ts, source, zone, cls, track, direction) VALUES (?, ?, ?, ?, ?, ?)",
+                ((ts, self._source_id, int(zone), int(c), int(tid), int(d)) for ts, tid, c, d, zone in data.tolist()),
+            )
+            self._conn.executemany(
+                "INSERT INTO counts_1m (minute, source, zone, cls, direction, n) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (minute, source, zone, cls, direction) DO UPDATE SET n = n + excluded.n",
+                ((m, self._source_id, z, c, d, n) for (m, z, c, d), n in zip(groups.tolist(), counts.tolist())),
+            )
+        self.written += len(data)
+        self.batches += 1
+        self.write_s += time.perf_counter() - t0
+
+    def _loop(self):
+        stop = False
+        while not stop:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Gom mọi thứ đang chờ (tối đa `max_batch` sự kiện) vào một transaction
+            items, n = [], 0
+            deadline = time.perf_counter() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                else:
+                    items.append(item)
+                    n += len(item[1])
+                if stop or n >= self.max_batch or time.perf_counter() >= deadline:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+            if items:
+                try:
+                    self._write(items)
+                except sqlite3.Error as e:
+                    # Không làm chết thread ghi: ghi nhận lỗi, bỏ lô này
+                    self.error = str(e)
+                    self.dropped += n
+        self._conn.close()
+
+    def close(self):
+        """Ghi nốt các sự kiện còn trong hàng đợi rồi đóng DB."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "queue": self._queue.qsize(),
+            "write_ms": round(self.write_s / self.batches * 1000, 2) if self.batches else 0.0,
+            "error": self.error,
+        }
+
+
+class EventQuery:
+    """Truy vấn (chỉ đọc) số sự kiện theo khoảng thời gian, nguồn, vùng, class."""
+
+    def __init__(self, path):
+        self.conn = connect(path, readonly=True)
+
+    def close(self):
+        self.conn.close()
+
+    def names(self, kind):
+        return [r[0] for r in self.conn.execute("SELECT name FROM names WHERE kind = ? ORDER BY name", (kind,))]
+
+    def counts(self, bucket="1h", start=None, end=None, since=None, sources=None, zones=None, classes=None, by=("source", "zone", "cls")):
+        """
+        Số sự kiện theo bucket thời gian (giây hoặc "15m" / "1h" / "1d"; None = tổng
+        cả khoảng). `since`: chỉ lấy N giây gần nhất. `by`: các cột nhóm
+        (source, zone, cls, direction). Bucket là bội của 1 phút thì đọc từ bảng
+        `counts_1m` (start / end được làm tròn xuống theo phút).
+        """
+        bucket = int(parse_seconds(bucket)) if bucket else None
+        start, end = parse_seconds(start), parse_seconds(end)
+        if since is not None:
+            start = time.time() - parse_seconds(since)
+        by = [c for c in GROUP_COLUMNS if c in by]
+        rollup = bucket is None or bucket % 60 == 0
+        table, t_col, count = ("counts_1m", "minute * 60", "SUM(n)") if rollup else ("events", "ts", "COUNT(*)")
+
+        where, params = [], []
+        if start is not None:
+            where.append("minute >= ?" if rollup else "ts >= ?")
+            params.append(int(start // 60) if rollup else start)
+        if end is not None:
+            where.append("minute < ?" if rollup else "ts < ?")
+            params.append(int(-(-end // 60)) if rollup else end)
+        for column, kind, values in (("source", "source", sources), ("zone", "zone", zones)):
+            if values is not None:
+                where.append(f"{column} IN (SELECT id FROM names WHERE kind = '{kind}' AND name IN ({','.join('?' * len(values))}))")
+                params.extend(values)
+        if classes is not None:
+            where.append(f"cls IN ({','.join('?' * len(classes))})")
+            params.extend(int(c) for c in classes)
+
+        select = [f"CAST({t_col} / {bucket} AS INTEGER) * {bucket} AS t"] if bucket else []
+        group = ["t"] if bucket else []
+        for c in by:
+            select.append(f"(SELECT name FROM names WHERE id = {c})" if c in ("source", "zone") else c)
+            group.append(c)
+        sql = f"SELECT {', '.join(select + [count])} FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if group:
+            sql += f" GROUP BY {', '.join(group)} ORDER BY {', '.join(group)}"
+        keys = (["t"] if bucket else []) + by + ["count"]
+        return [dict(zip(keys, row)) for row in self.conn.execute(sql, params)]
+
+    def recent(self, source=None, limit=100):
+        """Các sự kiện mới nhất (ts, source, zone, cls, track, direction)."""
+        sql = ("SELECT ts, s.name, z.name, cls, track, direction FROM events "
+               "JOIN names s ON s.id = events.source JOIN names z ON z.id = events.zone")
+        params = []
+        if source is not None:
+            sql += " WHERE s.name = ?"
+            params.append(source)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+        keys = ("ts", "source", "zone", "cls", "track", "direction")
+        return [dict(zip(keys, row)) for row in self.conn.execute(sql, params)]
+
+
+def benchmark(path, events=1_000_000, sources=20, days=90, batch=512):
+    """Ghi `events` sự kiện giả trải trên `days` ngày, đo tốc độ ghi và thời gian truy vấn theo giờ / ngày."""
+    rng = np.random.default_rng(0)
+    t_end = time.time()
+    ts = np.sort(rng.uniform(t_end - days * 86400, t_end, events))
+    src = rng.integers(0, sources, events)
+    t0 = time.perf_counter()
+    stores = [EventStore(path, source=f"cam-{i}", queue_size=1 << 16) for i in range(sources)]
+    for i in range(0, events, batch):
+        for s in np.unique(src[i:i + batch]):
+            sel = src[i:i + batch] == s
+            stores[s].add(ts[i:i + batch][sel], np.arange(sel.sum()), rng.integers(2, 8, sel.sum()), 1)
+    for store in stores:
+        store.close()
+    write_s = time.perf_counter() - t0
+    report = {"events": events, "write_per_s": round(events / write_s), "dropped": sum(s.dropped for s in stores)}
+    query = EventQuery(path)
+    for bucket in ("1h", "1d"):
+        t0 = time.perf_counter()
+        rows = query.counts(bucket=bucket, by=("source", "cls"))
+        report[f"query_{bucket}_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        report[f"rows_{bucket}"] = len(rows)
+    query.close()
+    report["db_mb"] = round(os.path.getsize(path) / (1 << 20), 1)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Xem số sự kiện đếm theo thời gian từ file SQLite")
+    parser.add_argument("db", help="vd: events/events.db")
+    parser.add_argument("--bucket", default="1h", help="vd 15m, 1h, 1d; 'total' = cộng cả khoảng")
+    parser.add_argument("--since", default=None, help="vd 24h, 7d")
+    parser.add_argument("--source", nargs="*", default=None)
+    parser.add_argument("--zone", nargs="*", default=None)
+    parser.add_argument("--by", nargs="*", default=["source", "zone", "cls"], choices=GROUP_COLUMNS)
+    parser.add_argument("--benchmark", type=int, default=0, help="Ghi N sự kiện giả vào `db` (file mới) rồi đo tốc độ")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(benchmark(args.db, args.benchmark))
+    else:
+        query = EventQuery(args.db)
+        bucket = None if args.bucket == "total" else args.bucket
+        for row in query.counts(bucket, since=args.since, sources=args.source, zones=args.zone, by=args.by):
+            if "t" in row:
+                row["t"] = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["t"]))
+            print(row)
@@ -0,0 +1,217 @@
+"""
+Xuất video đã vẽ chú thích (box, ID, vạch đếm, số đếm) ra file.
+
+- VideoExporter: encoder chạy trên thread nền, nhận frame qua hàng đợi có giới hạn;
+  chọn codec (H.264 / MPEG-4 qua PyAV, hoặc mp4v của OpenCV) và bitrate.
+- render_video: đọc lại video gốc + track đã cache (vision.trackcache) rồi vẽ và
+  ghi ra file, không chạy lại model, không ảnh hưởng tới phiên đếm live.
+
+Ví dụ:
+    python -m vision.export video/count-car1.mp4 output/count-car1_annotated.mp4 --cache <khóa cache>
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from fractions import Fraction
+
+import cv2
+
+from vision.decode import VideoReader, has_pyav
+from vision.pipeline import StageStats
+
+# Tên codec -> (backend, tên codec của backend)
+CODECS = {
+    "h264": ("pyav", "libx264"),
+    "mpeg4": ("pyav", "mpeg4"),
+    "mp4v": ("opencv", "mp4v"),
+}
+
+_END = object()
+
+
+class VideoExporter:
+    """
+    Ghi frame BGR ra file video trên một thread nền.
+
+    `write` copy frame rồi đưa vào hàng đợi `queue_size` phần tử: đầy thì chờ
+    (mặc định, không mất frame) hoặc bỏ frame nếu `drop_when_full=True` (dùng khi
+    ghi kèm luồng live và không được làm chậm nó).
+    """
+
+    def __init__(self, path, fps, codec="h264", bitrate=None, preset="veryfast", queue_size=32, drop_when_full=False):
+        if codec not in CODECS:
+            raise ValueError(f"codec không hợp lệ: '{codec}'")
+        backend, codec_name = CODECS[codec]
+        if backend == "pyav" and not has_pyav():
+            # Không có PyAV -> vẫn xuất được bằng OpenCV (không chỉnh được bitrate)
+            backend, codec_name = CODECS["mp4v"]
+        self.path = path
+        self.fps = fps
+        self.backend = backend
+        self.codec_name = codec_name
+        self.bitrate = bitrate
+        self.preset = preset
+        self.drop_when_full = drop_when_full
+        self.written = 0
+        self.dropped = 0
+        self.encode = StageStats()
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def write(self, frame):
+        """Trả về False nếu frame bị bỏ (chỉ khi drop_when_full=True)."""
+        if self.error is not None:
+            raise self.error
+        item = frame.copy()  # frame gốc có thể nằm trong vòng buffer được dùng lại
+        if self.drop_when_full:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                return False
+            return True
+        self._queue.put(item)
+        return True
+
+    def close(self):
+        self._queue.put(_END)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "encode_ms": round(self.encode.mean_ms, 2),
+            "queue": self._queue.qsize(),
+            "codec": self.codec_name,
+        }
+
+    # --- Thread encoder ---
+    def _loop(self):
+        sink = None
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is _END:
+                    break
+                if sink is None:
+                    sink = self._open(frame.shape[1], frame.shape[0])
+                t0 = time.perf_counter()
+                sink(frame)
+                self.encode.add(time.perf_counter() - t0)
+                self.written += 1
+        except Exception as e:
+            self.error = e
+            # Xả hàng đợi để `write` / `close` ở thread kia không bị treo
+            while True:
+                try:
+                    if self._queue.get_nowait() is _END:
+                        break
+                except queue.Empty:
+                    time.sleep(0.01)
+        finally:
+            if sink is not None:
+                sink(None)
+
+    def _open(self, width, height):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self.backend == "opencv":
+            writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.codec_name), self.fps, (width, height))
+            if not writer.isOpened():
+                raise IOError(f"Không mở được VideoWriter cho {self.path}")
+
+            def sink(frame):
+                if frame is None:
+                    writer.release()
+                else:
+                    writer.write(frame)
+            return sink
+
+        import av
+
+        container = av.open(self.path, "w")
+        stream = container.add_stream(self.codec_name, rate=Fraction(self.fps).limit_denominator(1000))
+        # yuv420p cần kích thước chẵn
+        w, h = width - width % 2, height - height % 2
+        stream.width, stream.height = w, h
+        stream.pix_fmt = "yuv420p"
+        if self.bitrate:
+            stream.bit_rate = int(self.bitrate)
+        if self.codec_name == "libx264":
+            stream.options = {"preset": self.preset}
+
+        def sink(frame):
+            if frame is None:
+                for packet in stream.encode():
+                    container.mux(packet)
+                container.close()
+                return
+            video_frame = av.VideoFrame.from_ndarray(frame[:h, :w], format="bgr24")
+            for packet in stream.encode(video_frame):
+                container.mux(packet)
+        return sink
+
+
+def render_video(video, tracks_at, out_path, draw, start=None, end=None, progress=None, **exporter_kwargs):
+    """
+    Vẽ lại video từ track có sẵn: `tracks_at(i)` trả về Tracks của frame thứ i
+    (tính từ `start`), `draw(frame, tracks, i)` vẽ rồi trả về frame cần ghi.
+    Trả về thống kê encoder.
+    """
+    reader = VideoReader(video, start=start, end=end)
+    fps = reader.get(cv2.CAP_PROP_FPS) or 30.0
+    total = int(reader.get(cv2.CAP_PROP_FRAME_COUNT))
+    exporter = VideoExporter(out_path, fps, **exporter_kwargs)
+    with exporter:
+        for i, (_, frame) in enumerate(reader):
+            exporter.write(draw(frame, tracks_at(i), i))
+            if progress is not None and total and i % 25 == 0:
+                progress(min((i + 1) / total, 1.0))
+    return exporter.stats()
+
+
+if __name__ == "__main__":
+    from vision.counter import LineCounter
+    from vision.trackcache import cache_path, TrackCache
+
+    parser = argparse.ArgumentParser(description="Xuất video có vẽ box / ID / vạch đếm từ track đã cache")
+    parser.add_argument("video")
+    parser.add_argument("out")
+    parser.add_argument("--cache", required=True, help="Khóa cache (tên thư mục trong ~/.cache/vision/tracks)")
+    parser.add_argument("--line-ratio", type=float, default=0.6)
+    parser.add_argument("--codec", choices=list(CODECS), default="h264")
+    parser.add_argument("--bitrate", type=float, default=None, help="Mbit/s")
+    args = parser.parse_args()
+
+    cache = TrackCache(cache_path(args.cache))
+    reader = VideoReader(args.video)
+    width, height = int(reader.get(cv2.CAP_PROP_FRAME_WIDTH)), int(reader.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    reader.release()
+    line_y = int(height * args.line_ratio)
+    counter = LineCounter([(0, line_y), (width, line_y)])
+
+    def draw(frame, tracks, i):
+        counter.update(tracks.xyxy, tracks.ids, i)
+        for (x1, y1, x2, y2), obj_id in zip(tracks.xyxy.astype(int), tracks.ids):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, f"ID: {obj_id}", (x1, y1 - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        counter.draw(frame)
+        cv2.putText(frame, f"Count: {counter.count}", (50, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3)
+        return frame
+
+    t0 = time.perf_counter()
+    stats = render_video(args.video, cache.__getitem__, args.out, draw, codec=args.codec, bitrate=args.bitrate * 1e6 if args.bitrate else None)
+    print({**stats, "seconds": round(time.perf_counter() - t0, 2), "count": counter.count})
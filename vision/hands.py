@@ -0,0 +1,195 @@
+"""
+Đếm ngón tay cho NHIỀU bàn tay cùng lúc bằng NumPy.
+
+Cách cũ: mỗi tay gọi `count_fingers` một lần, so sánh từng khớp
+`hand_landmarks.landmark[i].y` (đối tượng protobuf của MediaPipe). Ở đây:
+
+- Landmark của mọi tay được chuyển MỘT lần thành mảng (H, 21, 3).
+- Trạng thái 5 ngón của mọi tay tính bằng vài phép so sánh trên cả mảng.
+- `HandCounter` giữ một phiên MediaPipe Hands (dùng lại giữa các lần gọi /
+  các lần rerun của Streamlit khi bọc bằng `st.cache_resource`).
+- Chạy được trên file video (không cần webcam) để đo hiệu năng:
+    python -m vision.hands video/hands.mp4 --max-hands 2
+"""
+import argparse
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# 4: Ngón cái, 8: Trỏ, 12: Giữa, 16: Áp út, 20: Út
+TIP_IDS = np.array([4, 8, 12, 16, 20])
+# Khớp so sánh: IP của ngón cái (3), PIP của 4 ngón dài (tip - 2)
+JOINT_IDS = np.array([3, 6, 10, 14, 18])
+FINGER_NAMES = ("Cái", "Trỏ", "Giữa", "Áp út", "Út")
+
+# landmarks (H, 21, 3) theo tỉ lệ khung hình, is_left (H,), score (H,),
+# fingers (H, 5) ngón đang mở, counts (H,) số ngón mở của từng tay
+Hands = namedtuple("Hands", ["landmarks", "is_left", "score", "fingers", "counts"])
+
+
+def finger_states(landmarks, is_left):
+    """
+    Ngón nào đang mở (H, 5) cho mọi tay.
+    - 4 ngón dài: đầu ngón CAO HƠN khớp PIP (trục Y hướng xuống -> y nhỏ hơn).
+    - Ngón cái: đi theo trục ngang, hướng phụ thuộc tay Trái / Phải (ảnh đã lật
+      kiểu selfie; ảnh không lật thì nhãn của MediaPipe cũng bị đảo nên vẫn đúng).
+    """
+    landmarks = np.asarray(landmarks, np.float32).reshape(-1, 21, 3)
+    tips = landmarks[:, TIP_IDS]
+    joints = landmarks[:, JOINT_IDS]
+    fingers = tips[:, :, 1] < joints[:, :, 1]
+    thumb_right = tips[:, 0, 0] > joints[:, 0, 0]
+    fingers[:, 0] = np.where(np.asarray(is_left, bool), thumb_right, ~thumb_right)
+    return fingers
+
+
+def empty_hands():
+    return Hands(np.zeros((0, 21, 3), np.float32), np.zeros(0, bool), np.zeros(0, np.float32),
+                 np.zeros((0, 5), bool), np.zeros(0, np.int64))
+
+
+def from_mediapipe(results):
+    """Chuyển kết quả `Hands.process` của MediaPipe thành mảng một lần cho mọi tay."""
+    if not results.multi_hand_landmarks:
+        return empty_hands()
+    landmarks = np.array(
+        [[(p.x, p.y, p.z) for p in hand.landmark] for hand in results.multi_hand_landmarks], np.float32
+    )
+    labels = [h.classification[0] for h in results.multi_handedness]
+    is_left = np.array([c.label == "Left" for c in labels], bool)
+    score = np.array([c.score for c in labels], np.float32)
+    fingers = finger_states(landmarks, is_left)
+    return Hands(landmarks, is_left, score, fingers, fingers.sum(1))
+
+
+class HandCounter:
+    """
+    Một phiên MediaPipe Hands dùng lại cho mọi frame. `process` nhận frame BGR.
+    Có khóa để dùng chung an toàn khi nhiều phiên Streamlit cùng gọi.
+    """
+
+    def __init__(self, max_num_hands=2, detection_confidence=0.7, tracking_confidence=0.5, complexity=1):
+        import mediapipe as mp
+
+        self.max_num_hands = max_num_hands
+        self._hands = mp.solutions.hands.Hands(
+            static_image_mode=False,
+            max_num_hands=max_num_hands,
+            model_complexity=complexity,
+            min_detection_confidence=detection_confidence,
+            min_tracking_confidence=tracking_confidence,
+        )
+        self._lock = threading.Lock()
+        self._rgb = None
+
+    def detect(self, frame):
+        """Kết quả thô của MediaPipe cho frame BGR."""
+        # Buffer RGB dùng lại, không cấp phát mỗi frame (dùng chung giữa các phiên -> nằm trong khóa)
+        with self._lock:
+            if self._hands is None:
+                raise RuntimeError("HandCounter đã bị đóng")
+            if self._rgb is None or self._rgb.shape != frame.shape:
+                self._rgb = np.empty_like(frame)
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb)
+            rgb.flags.writeable = False
+            results = self._hands.process(rgb)
+            rgb.flags.writeable = True
+        return results
+
+    def process(self, frame):
+        return from_mediapipe(self.detect(frame))
+
+    def warm_up(self, width=640, height=480):
+        """Chạy thử trên ảnh đen (khởi tạo graph MediaPipe) trước frame thật đầu tiên, trả về ms."""
+        t0 = time.perf_counter()
+        self.detect(np.zeros((height, width, 3), np.uint8))
+        return round((time.perf_counter() - t0) * 1000, 1)
+
+    def close(self):
+        # Chờ lần `process` đang chạy (của phiên khác) xong rồi mới hủy graph
+        with self._lock:
+            if self._hands is not None:
+                self._hands.close()
+                self._hands = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Các cặp khớp của khung xương bàn tay (như mp.solutions.hands.HAND_CONNECTIONS)
+HAND_CONNECTIONS = np.array([
+    (0, 1), (1, 2), (2, 3), (3, 4), (0, 5), (5, 6), (6, 7), (7, 8), (5, 9), (9, 10), (10, 11), (11, 12),
+    (9, 13), (13, 14), (14, 15), (15, 16), (13, 17), (0, 17), (17, 18), (18, 19), (19, 20),
+])
+
+
+def draw_hands(frame, hands, line_color=(250, 44, 250), joint_color=(121, 22, 76), text_color=(0, 255, 0)):
+    """Vẽ khung xương + số ngón của mọi tay: một lần `polylines` cho tất cả các đoạn xương."""
+    if not len(hands.counts):
+        return frame
+    h, w = frame.shape[:2]
+    px = (hands.landmarks[:, :, :2] * (w, h)).astype(np.int32)  # (H, 21, 2)
+    cv2.polylines(frame, list(px[:, HAND_CONNECTIONS].reshape(-1, 2, 2)), False, line_color, 2)
+    for x, y in px.reshape(-1, 2):
+        cv2.circle(frame, (int(x), int(y)), 4, joint_color, -1)
+    # Số ngón hiển thị gần cổ tay
+    for (x, y), count, left in zip(px[:, 0], hands.counts, hands.is_left):
+        label = "L" if left else "R"
+        cv2.putText(frame, f"{label}: {count}", (int(x) - 50, int(y) + 50), cv2.FONT_HERSHEY_SIMPLEX, 1, text_color, 2, cv2.LINE_AA)
+    return frame
+
+
+def benchmark(video, max_num_hands=2, max_frames=None, flip=False, draw=False):
+    """Chạy trên file video: thời gian từng tầng (decode, mediapipe, count, draw) và số tay / frame."""
+    from vision.decode import VideoReader
+    from vision.metrics import Profiler
+
+    profiler = Profiler()
+    reader = VideoReader(video)
+    hands_seen = frames = 0
+    t0 = time.perf_counter()
+    with HandCounter(max_num_hands) as counter:
+        it = iter(reader)
+        while max_frames is None or frames < max_frames:
+            with profiler.stage("decode"):
+                item = next(it, None)
+            if item is None:
+                break
+            _, frame = item
+            if flip:
+                frame = cv2.flip(frame, 1)
+            with profiler.stage("mediapipe"):
+                results = counter.detect(frame)
+            with profiler.stage("count"):
+                hands = from_mediapipe(results)
+            if draw:
+                with profiler.stage("draw"):
+                    draw_hands(frame, hands)
+            hands_seen += len(hands.counts)
+            frames += 1
+    reader.release()
+    elapsed = time.perf_counter() - t0
+    return {
+        "frames": frames,
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "hands_per_frame": round(hands_seen / frames, 2) if frames else 0.0,
+        "stages": {name: s["mean_ms"] for name, s in profiler.summary()["stages"].items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo tốc độ đếm ngón tay trên file video (không cần webcam)")
+    parser.add_argument("video", help="vd: video/hands.mp4")
+    parser.add_argument("--max-hands", type=int, default=2)
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--flip", action="store_true", help="Lật ảnh như webcam selfie")
+    parser.add_argument("--draw", action="store_true", help="Đo thêm chi phí vẽ khung xương")
+    args = parser.parse_args()
+
+    print(benchmark(args.video, args.max_hands, args.max_frames, args.flip, args.draw))
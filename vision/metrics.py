@@ -0,0 +1,146 @@
+"""
+Đo thời gian từng tầng xử lý (decode, detect, track, count, draw, publish),
+bộ nhớ (RSS) và số track đang hoạt động của các app đếm.
+
+- Mỗi tầng giữ `window` mẫu gần nhất -> p50 / p95 "live" không phình bộ nhớ.
+- Xuất ra JSONL (một dòng mỗi lần ghi, tiện so sánh giữa các lần chạy) hoặc
+  định dạng text của Prometheus (dùng với textfile collector của node_exporter).
+
+Ví dụ:
+    profiler = Profiler()
+    with profiler.stage("detect"):
+        ...
+    profiler.gauge("active_tracks", 12)
+    profiler.write_prometheus("metrics/vehicles.prom")
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def rss_bytes():
+    """Bộ nhớ RSS hiện tại của process (byte)."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Không có /proc (macOS, Windows): chỉ lấy được đỉnh bộ nhớ
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class _Samples:
+    # Ring buffer thời gian (giây) của một tầng
+    def __init__(self, window):
+        self.values = np.zeros(window, np.float64)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.values[self.count % len(self.values)] = seconds
+        self.count += 1
+        self.total += seconds
+
+    def recent(self):
+        return self.values[:min(self.count, len(self.values))]
+
+
+class Profiler:
+    """Gom thời gian theo tầng + các giá trị gauge; an toàn khi ghi từ nhiều thread."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.started_at = time.time()
+        self._stages = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            samples = self._stages.get(name)
+            if samples is None:
+                samples = self._stages[name] = _Samples(self.window)
+            samples.add(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def gauge(self, name, value):
+        self._gauges[name] = value
+
+    def summary(self):
+        """p50 / p95 / mean (ms) theo tầng trên `window` mẫu gần nhất, gauge và RSS."""
+        with self._lock:
+            stages = {}
+            for name, s in self._stages.items():
+                recent = s.recent() * 1000
+                p50, p95 = np.percentile(recent, [50, 95]) if len(recent) else (0.0, 0.0)
+                stages[name] = {
+                    "count": s.count,
+                    "p50_ms": round(float(p50), 2),
+                    "p95_ms": round(float(p95), 2),
+                    "mean_ms": round(float(recent.mean()), 2) if len(recent) else 0.0,
+                    "total_s": round(s.total, 3),
+                }
+        return {
+            "time": round(time.time(), 3),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "rss_mb": round(rss_bytes() / (1 << 20), 1),
+            "stages": stages,
+            "gauges": dict(self._gauges),
+        }
+
+    def table(self):
+        """Các dòng {stage, p50_ms, p95_ms, ...} để hiển thị bằng `st.dataframe`."""
+        return [{"stage": name, **values} for name, values in self.summary()["stages"].items()]
+
+    def to_prometheus(self, prefix="vision", labels=None):
+        labels = dict(labels or {})
+
+        def fmt(extra=None):
+            items = {**labels, **(extra or {})}
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items.items()) + "}" if items else ""
+
+        summary = self.summary()
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for name, s in summary["stages"].items():
+            lines.append(f"{prefix}_stage_seconds{fmt({'stage': name, 'quantile': '0.5'})} {s['p50_ms'] / 1000:.6f}")
+            lines.append(f"{prefix}_stage_seconds{fmt({'stage': name, 'quantile': '0.95'})} {s['p95_ms'] / 1000:.6f}")
+            lines.append(f"{prefix}_stage_seconds_sum{fmt({'stage': name})} {s['total_s']:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{fmt({'stage': name})} {s['count']}")
+        lines.append(f"# TYPE {prefix}_rss_bytes gauge")
+        lines.append(f"{prefix}_rss_bytes{fmt()} {rss_bytes()}")
+        for name, value in summary["gauges"].items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name}{fmt()} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, **kwargs):
+        # Ghi file tạm rồi đổi tên, collector không bao giờ đọc phải file ghi dở
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus(**kwargs))
+        os.replace(tmp, path)
+
+    def write_jsonl(self, path, **extra):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({**extra, **self.summary()}, ensure_ascii=False) + "\n")
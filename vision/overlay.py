@@ -0,0 +1,101 @@
+"""
+Vẽ chú thích (box, nhãn, quỹ đạo) cho cảnh đông người với chi phí thấp.
+
+Cách cũ: `frame.copy()` làm lớp phủ, mỗi track một lần gọi `cv2.rectangle` /
+`cv2.putText` / `cv2.polylines`, rồi `cv2.addWeighted` trên cả frame. Ở đây:
+
+- Box: gom theo màu, mỗi màu MỘT lần gọi `cv2.polylines` cho mọi box.
+- Quỹ đạo: lấy thẳng từ mảng cấp phát sẵn của TrackStore (`trails`), mọi
+  quỹ đạo vẽ trong MỘT lần gọi `cv2.polylines` lên mặt nạ.
+- Chỉ pha màu (alpha) trong hình chữ nhật bao các quỹ đạo và chỉ chép lại
+  pixel của quỹ đạo (theo mặt nạ), không copy / blend cả frame.
+- Nhãn chữ chỉ vẽ khi số track <= `max_labels` (đông hơn thì chữ chồng lên
+  nhau, không đọc được mà lại là phần tốn nhất).
+- `enabled=False`: không vẽ gì (chạy không giao diện, benchmark).
+
+Ví dụ:
+    renderer = OverlayRenderer()
+    renderer.trails(frame, *store.trails(slots))
+    renderer.boxes(frame, tracks.xyxy, groups=counted, labels=[...])
+"""
+import cv2
+import numpy as np
+
+# Màu theo nhóm: 0 = đang theo dõi (xanh lá), 1 = đã đếm (đỏ)
+PALETTE = ((0, 255, 0), (0, 0, 255))
+
+
+class OverlayRenderer:
+    def __init__(self, enabled=True, alpha=0.4, trail_color=(255, 255, 0), trail_thickness=3,
+                 box_thickness=2, font_scale=0.5, max_labels=150, palette=PALETTE):
+        self.enabled = enabled
+        self.alpha = alpha
+        self.trail_color = trail_color
+        self.trail_thickness = trail_thickness
+        self.box_thickness = box_thickness
+        self.font_scale = font_scale
+        self.max_labels = max_labels
+        self.palette = palette
+        self.dirty_px = 0  # diện tích vùng được pha màu ở lần vẽ quỹ đạo gần nhất
+        self._mask = self._tinted = self._solid = None
+
+    def boxes(self, frame, xyxy, groups=None, labels=None):
+        """Vẽ box (màu theo `groups`, chỉ số trong palette) và nhãn tương ứng."""
+        if not self.enabled or not len(xyxy):
+            return frame
+        xyxy = np.asarray(xyxy).astype(np.int32).reshape(-1, 4)
+        groups = np.zeros(len(xyxy), np.intp) if groups is None else np.asarray(groups, np.intp)
+        x1, y1, x2, y2 = xyxy.T
+        # 4 góc của mọi box: (N, 4, 2)
+        corners = np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1), np.stack([x2, y2], 1), np.stack([x1, y2], 1)], 1)
+        for g in np.unique(groups):
+            cv2.polylines(frame, list(corners[groups == g]), True, self.palette[g], self.box_thickness)
+        if labels is not None and len(xyxy) <= self.max_labels:
+            for (x, y), text, g in zip(xyxy[:, :2], labels, groups):
+                cv2.putText(frame, text, (int(x), int(y) - 10), cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, self.palette[g], 2)
+        return frame
+
+    def trails(self, frame, points, lengths):
+        """
+        Vẽ quỹ đạo bán trong suốt. `points` (N, history, 2) và `lengths` (N,) như
+        `TrackStore.trails`: điểm hợp lệ của quỹ đạo i là points[i, history - lengths[i]:].
+        """
+        self.dirty_px = 0
+        if not self.enabled or not len(lengths):
+            return frame
+        lengths = np.asarray(lengths)
+        keep = lengths >= 2
+        if not keep.any():
+            return frame
+        history = points.shape[1]
+        pts = np.asarray(points[keep], np.int32)
+        lengths = lengths[keep]
+
+        # Vùng bẩn: hình chữ nhật bao mọi điểm hợp lệ (+ độ dày nét), cắt theo frame
+        valid = np.arange(history)[None, :] >= history - lengths[:, None]
+        flat = pts[valid]
+        pad = self.trail_thickness
+        h, w = frame.shape[:2]
+        x0, y0 = np.maximum(flat.min(0) - pad, 0)
+        x1, y1 = np.minimum(flat.max(0) + pad + 1, (w, h))
+        if x0 >= x1 or y0 >= y1:
+            return frame
+
+        if self._mask is None or self._mask.shape != (h, w):
+            # Buffer cấp phát một lần theo kích thước frame
+            self._mask = np.empty((h, w), np.uint8)
+            self._tinted = np.empty((h, w, 3), np.uint8)
+            self._solid = np.empty((h, w, 3), np.uint8)
+            self._solid[:] = self.trail_color
+        mask = self._mask[y0:y1, x0:x1]
+        mask.fill(0)
+        pts -= np.array([x0, y0], np.int32)
+        cv2.polylines(mask, [p[history - n:] for p, n in zip(pts, lengths)], False, 1, self.trail_thickness)
+
+        # Pha màu trong vùng bẩn rồi chỉ chép lại các pixel của quỹ đạo:
+        # kết quả giống addWeighted(overlay, a, frame, 1 - a) trên cả frame
+        region = frame[y0:y1, x0:x1]
+        tinted = cv2.addWeighted(region, 1 - self.alpha, self._solid[y0:y1, x0:x1], self.alpha, 0, dst=self._tinted[y0:y1, x0:x1])
+        cv2.copyTo(tinted, mask, region)
+        self.dirty_px = int(mask.size)
+        return frame
@@ -0,0 +1,195 @@
+import queue
+import threading
+import time
+
+import cv2
+
+# Đánh dấu hết luồng dữ liệu giữa các tầng
+_END = object()
+
+
+class StageStats:
+    """Thống kê thời gian xử lý của một tầng trong pipeline."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+
+    @property
+    def mean_ms(self):
+        return 1000.0 * self.total / self.count if self.count else 0.0
+
+    def as_dict(self):
+        return {"count": self.count, "mean_ms": round(self.mean_ms, 2), "last_ms": round(1000.0 * self.last, 2)}
+
+
+def frame_time(cap, idx, started_at):
+    """
+    Timestamp (giây) của frame vừa đọc: PTS của video (file, VideoReader), hoặc
+    thời điểm chụp tính từ `started_at` (perf_counter) với camera không có PTS.
+    """
+    t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+    if t <= 0 and idx > 0:
+        return time.perf_counter() - started_at
+    return t
+
+
+class FramePipeline:
+    """
+    Pipeline 3 tầng: decode -> infer -> render.
+
+    - Tầng decode chạy trên một thread riêng, đẩy frame vào hàng đợi có giới hạn
+      (đầy thì chờ, để không bỏ sót frame nào khi đếm).
+    - Tầng infer chạy trên thread thứ hai, gọi `infer_fn(frame, idx)` cho MỌI frame.
+    - Tầng render/publish là vòng `for` của người gọi (thread của Streamlit).
+      Nếu trình duyệt nhận chậm, các kết quả cũ bị bỏ qua thay vì chặn tầng infer.
+
+    `profiler` (vision.metrics.Profiler, tùy chọn) nhận thêm thời gian từng tầng để tính p50/p95.
+    `with_time=True`: gọi `infer_fn(frame, idx, t)` với `t` là timestamp (giây) của frame
+    lấy ngay lúc giải mã (xem `frame_time`), dùng cho các phép đo theo thời gian như tốc độ.
+    """
+
+    def __init__(self, source, infer_fn, queue_size=8, result_queue_size=2, profiler=None, with_time=False):
+        self.source = source
+        self.infer_fn = infer_fn
+        self.profiler = profiler
+        self.with_time = with_time
+        self.stats = {name: StageStats() for name in ("decode", "infer", "render")}
+        self.processed = 0
+        self.dropped = 0
+        self.error = None
+
+        self._frames = queue.Queue(maxsize=queue_size)
+        self._results = queue.Queue(maxsize=result_queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+        self._cap = None
+        self._started_at = None
+
+    # --- Vòng đời ---
+    def start(self):
+        if self._threads:
+            return self
+        self._cap = cv2.VideoCapture(self.source) if isinstance(self.source, str) else self.source
+        self._started_at = time.perf_counter()
+        for target in (self._decode_loop, self._infer_loop):
+            t = threading.Thread(target=target, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def close(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=2.0)
+        if self._cap is not None:
+            self._cap.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Hàm tiện ích cho hàng đợi ---
+    def _put(self, q, item):
+        # Chờ chỗ trống nhưng vẫn kiểm tra tín hiệu dừng
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _publish(self, item):
+        # Hàng đợi kết quả đầy -> bỏ kết quả cũ nhất (frame "stale")
+        while True:
+            try:
+                self._results.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._results.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _record(self, name, seconds):
+        self.stats[name].add(seconds)
+        if self.profiler is not None:
+            self.profiler.add(name, seconds)
+
+    # --- Các tầng ---
+    def _decode_loop(self):
+        idx = 0
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                success, frame = self._cap.read()
+                if not success:
+                    break
+                self._record("decode", time.perf_counter() - t0)
+                t = frame_time(self._cap, idx, self._started_at) if self.with_time else None
+                if not self._put(self._frames, (idx, frame, t)):
+                    break
+                idx += 1
+        finally:
+            self._put(self._frames, _END)
+
+    def _infer_loop(self):
+        try:
+            while True:
+                item = self._get(self._frames)
+                if item is _END:
+                    break
+                idx, frame, t = item
+                t0 = time.perf_counter()
+                result = self.infer_fn(frame, idx, t) if self.with_time else self.infer_fn(frame, idx)
+                self._record("infer", time.perf_counter() - t0)
+                self.processed += 1
+                self._publish((idx, frame, result))
+        except Exception as e:
+            self.error = e
+            self._stop.set()
+        finally:
+            self._publish(_END)
+
+    def __iter__(self):
+        self.start()
+        while True:
+            item = self._get(self._results)
+            if item is _END:
+                break
+            t0 = time.perf_counter()
+            yield item
+            self._record("render", time.perf_counter() - t0)
+        if self.error is not None:
+            raise self.error
+
+    # --- Báo cáo ---
+    def snapshot(self):
+        """Độ sâu hàng đợi và thời gian từng tầng, dùng để hiển thị ở sidebar."""
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        return {
+            "frames": self.processed,
+            "dropped_renders": self.dropped,
+            "fps": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            "queue_decode": self._frames.qsize(),
+            "queue_render": self._results.qsize(),
+            "stages": {name: s.as_dict() for name, s in self.stats.items()},
+        }
@@ -0,0 +1,261 @@
+"""
+Phân tích tư thế (góc Tai - Vai - Hông) cho video: theo lô, mọi người, có làm mượt.
+
+Cách cũ (`archived/app_posture.py`): mỗi frame một lần gọi `model(frame)`, chỉ
+xét người đầu tiên (`keypoints.data[0]`), tính góc bằng hàm vô hướng nên trạng
+thái nhấp nháy liên tục giữa các frame. Ở đây:
+
+- Model pose chạy theo lô N frame (`PoseTracker`, giống BatchTracker) và
+  ByteTrack gán ID cho từng người, keypoint đi kèm theo đúng track.
+- Góc của MỌI người trong MỌI frame của lô tính trong một phép toán NumPy.
+- `PostureTimeline` làm mượt góc theo thời gian cho từng ID (EMA) và có
+  ngưỡng trễ (hysteresis) -> danh sách các khoảng ngồi sai tư thế của từng người.
+
+Ví dụ:
+    python -m vision.posture video/office.mp4 --model yolov8n-pose.pt --batch 8
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from vision.tracking import BatchTracker, tracks_from_array
+from vision.tracks import TrackStore
+
+# Chỉ số keypoint COCO: (tai, vai, hông) bên trái / bên phải
+LEFT_SIDE = np.array([3, 5, 11])
+RIGHT_SIDE = np.array([4, 6, 12])
+
+
+def posture_points(keypoints):
+    """
+    (N, 17, 3) -> (N, 3, 3): tai, vai, hông (x, y, conf) của bên nhìn rõ hơn
+    (so độ tin cậy của tai) cho mọi người cùng lúc.
+    """
+    keypoints = np.asarray(keypoints, np.float32).reshape(-1, 17, 3)
+    left = keypoints[:, 3, 2] > keypoints[:, 4, 2]
+    pick = np.where(left[:, None], LEFT_SIDE, RIGHT_SIDE)
+    return np.take_along_axis(keypoints, pick[:, :, None], axis=1)
+
+
+def posture_angles(points, min_conf=0.0):
+    """Góc Tai - Vai - Hông (độ, 0..180) từ `posture_points`; NaN nếu keypoint kém tin cậy hơn `min_conf`."""
+    points = np.asarray(points, np.float32).reshape(-1, 3, 3)
+    a, b, c = points[:, 0, :2], points[:, 1, :2], points[:, 2, :2]
+    radians = np.arctan2(c[:, 1] - b[:, 1], c[:, 0] - b[:, 0]) - np.arctan2(a[:, 1] - b[:, 1], a[:, 0] - b[:, 0])
+    angle = np.abs(np.degrees(radians))
+    angle = np.where(angle > 180.0, 360.0 - angle, angle)
+    if min_conf > 0:
+        angle[points[:, :, 2].min(1) < min_conf] = np.nan
+    return angle.astype(np.float32)
+
+
+class PoseTracker(BatchTracker):
+    """
+    BatchTracker cho model pose: mỗi frame trả về (tracks, keypoints) với
+    keypoints (N, 17, 3) cùng thứ tự với `tracks.ids`. Không hỗ trợ ROI
+    (preprocessor), imgsz truyền qua `predict_kwargs`.
+    """
+
+    def __init__(self, model, batch_size=8, tracker="bytetrack.yaml", frame_rate=30, **predict_kwargs):
+        super().__init__(model, batch_size, tracker, frame_rate, preprocessor=None, **predict_kwargs)
+
+    def update(self, result):
+        det = result.boxes.cpu().numpy()
+        out = self.tracker.update(det, result.orig_img)
+        tracks = tracks_from_array(out)
+        if not len(tracks.ids) or result.keypoints is None:
+            return tracks, np.zeros((len(tracks.ids), 17, 3), np.float32)
+        # Cột cuối của tracker là chỉ số detection -> lấy đúng keypoint của từng track
+        keypoints = result.keypoints.data.cpu().numpy()
+        return tracks, keypoints[out[:, 7].astype(np.intp)].astype(np.float32)
+
+
+class PostureTimeline:
+    """
+    Làm mượt góc lưng theo từng ID và ghi lại các khoảng sai tư thế.
+
+    - Góc làm mượt bằng EMA với hằng số thời gian `smooth_s` giây; frame thiếu
+      keypoint (NaN) giữ nguyên giá trị cũ.
+    - Bắt đầu "sai" khi góc mượt < `threshold`, chỉ hết khi > `threshold + hysteresis`.
+    - Khoảng ngắn hơn `min_bad_s` bị bỏ qua; người mất dấu quá `max_idle` frame
+      thì khoảng đang mở được đóng tại frame cuối còn thấy.
+    """
+
+    def __init__(self, fps, threshold=140.0, smooth_s=1.0, hysteresis=5.0, min_bad_s=1.0, capacity=256, max_idle=150):
+        self.fps = fps or 30.0
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.min_bad_s = min_bad_s
+        self.max_idle = max_idle
+        self.alpha = 1.0 - np.exp(-1.0 / max(self.fps * smooth_s, 1.0))
+        self.store = TrackStore(
+            capacity, max_idle=max_idle,
+            angle=((), np.float32), has=((), bool), bad=((), bool), bad_start=((), np.int64),
+        )
+        self._intervals = []  # các mảng (K, 3): id, frame bắt đầu, frame kết thúc
+
+    def _close(self, ids, start, end):
+        keep = (end - start) / self.fps >= self.min_bad_s
+        if keep.any():
+            self._intervals.append(np.stack([ids[keep], start[keep], end[keep]], 1))
+
+    def _expire(self, frame):
+        store = self.store
+        gone = np.flatnonzero((store.ids >= 0) & store["bad"] & (frame - store.last_seen > self.max_idle))
+        if len(gone):
+            self._close(store.ids[gone], store["bad_start"][gone], store.last_seen[gone] + 1)
+            store["bad"][gone] = False
+
+    def update(self, ids, angles, frame):
+        """Trả về (góc đã làm mượt, đang sai tư thế) cho các `ids` ở `frame`."""
+        ids = np.asarray(ids, np.int64).reshape(-1)
+        angles = np.asarray(angles, np.float32).reshape(-1)
+        smooth = np.full(len(ids), np.nan, np.float32)
+        bad = np.zeros(len(ids), bool)
+        self._expire(frame)
+        if not len(ids):
+            return smooth, bad
+        slots, _ = self.store.touch(ids, frame)
+        ok = slots >= 0
+        s, a = slots[ok], angles[ok]
+        value, has = self.store["angle"], self.store["has"]
+
+        valid = ~np.isnan(a)
+        first = valid & ~has[s]
+        value[s[first]] = a[first]
+        more = valid & has[s]
+        value[s[more]] += self.alpha * (a[more] - value[s[more]])
+        has[s[valid]] = True
+
+        # Chuyển trạng thái có ngưỡng trễ
+        current = value[s]
+        was_bad = self.store["bad"][s]
+        enter = has[s] & ~was_bad & (current < self.threshold)
+        leave = was_bad & (current > self.threshold + self.hysteresis)
+        self.store["bad"][s[enter]] = True
+        self.store["bad_start"][s[enter]] = frame
+        if leave.any():
+            self._close(ids[ok][leave], self.store["bad_start"][s[leave]], np.full(leave.sum(), frame))
+            self.store["bad"][s[leave]] = False
+
+        smooth[ok] = np.where(has[s], current, np.nan)
+        bad[ok] = self.store["bad"][s]
+        return smooth, bad
+
+    def finish(self, frame):
+        """Hết video: đóng mọi khoảng đang mở tại `frame`."""
+        store = self.store
+        open_ = np.flatnonzero((store.ids >= 0) & store["bad"])
+        if len(open_):
+            self._close(store.ids[open_], store["bad_start"][open_], np.minimum(store.last_seen[open_] + 1, frame))
+            store["bad"][open_] = False
+
+    def intervals(self):
+        """Mảng (K, 3) id, frame bắt đầu, frame kết thúc, sắp theo id rồi thời gian."""
+        if not self._intervals:
+            return np.zeros((0, 3), np.int64)
+        rows = np.concatenate(self._intervals)
+        return rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+
+    def table(self, offset_s=0.0):
+        """Các dòng {ID, bắt đầu, kết thúc, thời lượng} (giây) để hiển thị bằng `st.dataframe`."""
+        return [
+            {"ID": int(i), "start_s": round(offset_s + a / self.fps, 1), "end_s": round(offset_s + b / self.fps, 1),
+             "duration_s": round((b - a) / self.fps, 1)}
+            for i, a, b in self.intervals().tolist()
+        ]
+
+    def per_person(self):
+        """Tổng thời gian sai tư thế và số lần theo ID."""
+        rows = self.intervals()
+        if not len(rows):
+            return {}
+        ids, inverse = np.unique(rows[:, 0], return_inverse=True)
+        seconds = np.bincount(inverse, (rows[:, 2] - rows[:, 1]) / self.fps)
+        counts = np.bincount(inverse)
+        return {int(i): {"bad_s": round(float(t), 1), "intervals": int(n)} for i, t, n in zip(ids, seconds, counts)}
+
+
+def analyze_batches(tracker, timeline, source, min_conf=0.3):
+    """
+    Chạy PoseTracker trên `source` theo lô. Góc của mọi người trong cả lô tính
+    một lần, sau đó cập nhật timeline theo thứ tự frame.
+    Trả về (idx, frame, tracks, points, smooth, bad) cho từng frame.
+    """
+    for start, frames, results in tracker.iter_batches(source):
+        counts = [len(tracks.ids) for tracks, _ in results]
+        points = posture_points(np.concatenate([kp for _, kp in results]))
+        angles = posture_angles(points, min_conf)
+        bounds = np.cumsum(counts)[:-1]
+        for i, ((tracks, _), p, a) in enumerate(zip(results, np.split(points, bounds), np.split(angles, bounds))):
+            smooth, bad = timeline.update(tracks.ids, a, start + i)
+            yield start + i, frames[i], tracks, p, smooth, bad
+
+
+def draw_posture(frame, points, smooth, bad, ids=None):
+    """Vẽ đoạn Tai - Vai - Hông và góc đã làm mượt cho mọi người."""
+    if not len(points):
+        return frame
+    px = points[:, :, :2].astype(np.int32)
+    cv2.polylines(frame, list(px), False, (255, 255, 255), 3)
+    for i, ((x, y), angle, is_bad) in enumerate(zip(px[:, 1], smooth, bad)):
+        color = (0, 0, 255) if is_bad else (0, 255, 0)
+        cv2.circle(frame, (int(x), int(y)), 10, color, -1)
+        text = "?" if np.isnan(angle) else f"{int(angle)}"
+        if ids is not None:
+            text = f"ID:{ids[i]} {text}"
+        cv2.putText(frame, text, (int(x) + 12, int(y)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+    return frame
+
+
+def compare_throughput(model_path, video, batch_size=8, imgsz=480, max_frames=300, conf=0.5):
+    """So sánh frame/s: cách cũ (từng frame, người đầu tiên) và theo lô (mọi người + timeline)."""
+    from ultralytics import YOLO
+
+    from vision.decode import VideoReader
+
+    model = YOLO(model_path)
+    cap = VideoReader(video)
+    fps = cap.fps
+    frames = 0
+    t0 = time.perf_counter()
+    while frames < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        r = model(frame, imgsz=imgsz, verbose=False, conf=conf)[0]
+        if r.keypoints is not None and r.keypoints.has_visible:
+            posture_angles(posture_points(r.keypoints.data[0].cpu().numpy()))
+        frames += 1
+    per_frame = frames / (time.perf_counter() - t0)
+    cap.release()
+
+    tracker = PoseTracker(YOLO(model_path), batch_size=batch_size, frame_rate=round(fps), imgsz=imgsz, conf=conf)
+    timeline = PostureTimeline(fps)
+    batched = 0
+    t0 = time.perf_counter()
+    for _ in analyze_batches(tracker, timeline, VideoReader(video, end=frames / fps, buffers=batch_size + 2)):
+        batched += 1
+    batched_fps = batched / (time.perf_counter() - t0)
+    timeline.finish(batched)
+    return {
+        "frames": frames,
+        "per_frame_fps": round(per_frame, 2),
+        "batched_fps": round(batched_fps, 2),
+        "speedup": round(batched_fps / per_frame, 2) if per_frame else 0.0,
+        "people": timeline.per_person(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Phân tích tư thế theo lô và so sánh với cách từng frame")
+    parser.add_argument("video", help="vd: video/office.mp4")
+    parser.add_argument("--model", default="yolov8n-pose.pt")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--imgsz", type=int, default=480)
+    parser.add_argument("--max-frames", type=int, default=300)
+    args = parser.parse_args()
+
+    print(compare_throughput(args.model, args.video, args.batch, args.imgsz, args.max_frames))
@@ -0,0 +1,131 @@
+"""
+Tiền xử lý trước khi đưa frame vào model:
+- `imgsz`: kích thước ảnh model nhận vào (ultralytics tự letterbox + scale box về lại),
+- `roi`: chỉ cắt vùng cần quan tâm (vd dải đường quanh vạch đếm), box được
+  dịch lại về tọa độ của frame gốc.
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from vision.tracking import Tracks, tracks_from_result
+
+
+def roi_around_line(line_y, width, height, margin=0.25):
+    """ROI là dải ngang quanh vạch đếm, cao `margin` * height về mỗi phía."""
+    pad = int(height * margin)
+    return (0, max(0, line_y - pad), width, min(height, line_y + pad))
+
+
+class Preprocessor:
+    def __init__(self, imgsz=640, roi=None):
+        """roi: (x1, y1, x2, y2) theo pixel của frame gốc, None = cả frame."""
+        self.imgsz = imgsz
+        self.roi = tuple(int(v) for v in roi) if roi is not None else None
+        self._offset = np.array([self.roi[0], self.roi[1]] * 2, np.float32) if self.roi else None
+
+    def crop(self, frame):
+        # Cắt bằng slicing -> không copy dữ liệu ảnh
+        if self.roi is None:
+            return frame
+        x1, y1, x2, y2 = self.roi
+        return frame[y1:y2, x1:x2]
+
+    def to_original(self, xyxy):
+        if self._offset is None:
+            return xyxy
+        return xyxy + self._offset
+
+    def map_tracks(self, tracks):
+        if self._offset is None:
+            return tracks
+        return Tracks(self.to_original(tracks.xyxy), tracks.ids, tracks.cls, tracks.conf)
+
+    def track(self, model, frame, **kwargs):
+        """Gọi `model.track` trên vùng đã cắt, trả về Tracks theo tọa độ gốc."""
+        results = model.track(self.crop(frame), imgsz=self.imgsz, **kwargs)
+        return self.map_tracks(tracks_from_result(results[0]))
+
+    def draw(self, frame, color=(255, 255, 255)):
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 1)
+        return frame
+
+
+def compare_settings(model_path, video, settings, classes=None, conf=0.5, line_ratio=0.6, max_frames=300):
+    """
+    Chạy cùng video với nhiều cấu hình (imgsz, roi) và so sánh với cấu hình đầu tiên:
+    thời gian model trung bình, frame/s, số xe đếm được và chênh lệch số đếm.
+    """
+    from ultralytics import YOLO
+
+    from vision.counter import LineCounter
+
+    reports = []
+    for setting in settings:
+        model = YOLO(model_path)
+        cap = cv2.VideoCapture(video)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        line_y = int(height * line_ratio)
+        roi = roi_around_line(line_y, width, height, setting["roi_margin"]) if setting.get("roi_margin") else None
+        pre = Preprocessor(setting.get("imgsz", 640), roi)
+        counter = LineCounter([(0, line_y), (width, line_y)])
+
+        # Warm-up 1 lần để thời gian load/khởi tạo không lẫn vào số đo
+        success, frame = cap.read()
+        if success:
+            model.predict(pre.crop(frame), imgsz=pre.imgsz, verbose=False)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+        latencies = []
+        boxes = 0
+        while len(latencies) < max_frames:
+            success, frame = cap.read()
+            if not success:
+                break
+            t0 = time.perf_counter()
+            tracks = pre.track(model, frame, persist=True, conf=conf, classes=classes, tracker="bytetrack.yaml", verbose=False)
+            latencies.append(time.perf_counter() - t0)
+            counter.update(tracks.xyxy, tracks.ids, len(latencies))
+            boxes += len(tracks.ids)
+        cap.release()
+
+        mean_ms = 1000.0 * float(np.mean(latencies)) if latencies else 0.0
+        reports.append({
+            "imgsz": pre.imgsz,
+            "roi": pre.roi,
+            "frames": len(latencies),
+            "mean_ms": round(mean_ms, 2),
+            "fps": round(1000.0 / mean_ms, 2) if mean_ms else 0.0,
+            "count": counter.count,
+            "boxes_per_frame": round(boxes / max(len(latencies), 1), 2),
+        })
+
+    base = reports[0]
+    for r in reports:
+        r["latency_saved_ms"] = round(base["mean_ms"] - r["mean_ms"], 2)
+        r["count_delta"] = r["count"] - base["count"]
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh độ trễ / số đếm theo imgsz và ROI")
+    parser.add_argument("video", help="vd: video/count-car1.mp4")
+    parser.add_argument("--model", default="yolov8m.pt")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[640, 480, 320])
+    parser.add_argument("--roi-margin", type=float, default=0.25, help="Nửa chiều cao dải ROI (tỉ lệ), 0 = không cắt")
+    parser.add_argument("--classes", type=int, nargs="*", default=[2, 5, 7])
+    parser.add_argument("--max-frames", type=int, default=300)
+    args = parser.parse_args()
+
+    # Cấu hình đầu tiên (imgsz lớn nhất, cả frame) là mốc so sánh
+    settings = [{"imgsz": args.imgsz[0]}]
+    settings += [{"imgsz": s} for s in args.imgsz[1:]]
+    if args.roi_margin:
+        settings += [{"imgsz": s, "roi_margin": args.roi_margin} for s in args.imgsz]
+    for report in compare_settings(args.model, args.video, settings, classes=args.classes or None, max_frames=args.max_frames):
+        print(report)
@@ -0,0 +1,288 @@
+"""
+Một model dùng chung cho nhiều luồng video (file, RTSP, webcam, nhiều phiên Streamlit).
+
+- InferenceServer: thread duy nhất gọi model; frame gửi tới từ nhiều stream được
+  gom thành MỘT lần `model.predict` theo lô.
+- Stream: trạng thái riêng của một luồng (tracker ByteTrack, bộ đếm), nên ID và
+  số đếm của các luồng / các phiên không lẫn vào nhau như khi dùng
+  `model.track(persist=True)` trên model được cache chung.
+- StreamManager: chạy headless nhiều nguồn cùng lúc, công bố số đếm theo từng luồng.
+
+Ví dụ:
+    python -m vision.streams video/count-car1.mp4 video/pedestrian.mp4 --model yolov8n.pt
+"""
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from vision.counter import LineCounter
+from vision.tracking import make_tracker, tracks_from_array
+
+_STOP = object()
+
+
+class InferenceServer:
+    """
+    Gom các yêu cầu detect từ nhiều thread thành lô (tối đa `max_batch` frame,
+    chờ thêm tối đa `max_wait` giây) và gọi model một lần cho cả lô. Chỉ chờ khi
+    có nhiều hơn một thread gửi frame trong `active_window` giây gần nhất: một
+    luồng duy nhất không phải trả thêm `max_wait` cho mỗi frame.
+
+    `model` chỉ được dùng qua server này (không gọi `model.track` trực tiếp).
+    """
+
+    def __init__(self, model, max_batch=8, max_wait=0.01, active_window=1.0):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.active_window = active_window
+        self._clients = {}  # thread id -> lần gửi gần nhất
+        self.batches = 0
+        self.frames = 0
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def mean_batch(self):
+        return self.frames / self.batches if self.batches else 0.0
+
+    def submit(self, frame, imgsz=640, conf=0.25, classes=None, line=None):
+        """
+        Gửi một frame, trả về Future chứa `Boxes` (NumPy) đã lọc theo conf / classes.
+        `line`: vạch đếm theo tỉ lệ khung hình, chỉ chuyển cho model có
+        `accepts_lines` (CascadeModel); model YOLO thường bỏ qua.
+        """
+        future = Future()
+        self._clients[threading.get_ident()] = time.perf_counter()
+        self._requests.put((frame, imgsz, conf, classes, future, line))
+        return future
+
+    def close(self):
+        self._requests.put(_STOP)
+        self._thread.join(timeout=2.0)
+
+    @property
+    def active_clients(self):
+        """Số thread đã gửi frame trong `active_window` giây gần nhất."""
+        now = time.perf_counter()
+        for key, last in list(self._clients.items()):
+            if now - last > self.active_window:
+                self._clients.pop(key, None)
+        return len(self._clients)
+
+    def _collect(self):
+        first = self._requests.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        # Một luồng: không có ai để chờ, chỉ gom những frame đã nằm sẵn trong hàng đợi
+        deadline = time.perf_counter() + (self.max_wait if self.active_clients > 1 else 0.0)
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._requests.get(timeout=timeout) if timeout > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._requests.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # Chỉ gom chung các yêu cầu cùng imgsz
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for imgsz, items in groups.items():
+                self._run(imgsz, items)
+
+    def _run(self, imgsz, items):
+        # Model chạy với conf thấp nhất + hợp các class, sau đó lọc lại cho từng stream
+        conf = min(item[2] for item in items)
+        classes = None
+        if all(item[3] is not None for item in items):
+            classes = sorted({c for item in items for c in item[3]})
+        kwargs = {}
+        if getattr(self.model, "accepts_lines", False) and any(item[5] is not None for item in items):
+            kwargs["lines"] = [item[5] for item in items]
+        try:
+            results = self.model.predict([item[0] for item in items], imgsz=imgsz, conf=conf, classes=classes, verbose=False, **kwargs)
+        except Exception as e:
+            for item in items:
+                item[4].set_exception(e)
+            return
+        self.batches += 1
+        self.frames += len(items)
+        try:
+            for (frame, _, item_conf, item_classes, future, _), result in zip(items, results):
+                det = result.boxes.cpu().numpy()
+                keep = det.conf >= item_conf
+                if item_classes is not None:
+                    keep &= np.isin(det.cls, item_classes)
+                future.set_result(det[keep])
+        except Exception as e:
+            # Không để thread server chết: Future nào chưa có kết quả thì báo lỗi
+            for item in items:
+                if not item[4].done():
+                    item[4].set_exception(e)
+
+
+class Stream:
+    """Trạng thái riêng của một luồng: tracker, bộ tiền xử lý và bộ đếm."""
+
+    def __init__(self, name, server, conf=0.25, classes=None, preprocessor=None, tracker="bytetrack.yaml", counter=None, profiler=None, line=None):
+        self.name = name
+        self.line = line
+        self.profiler = profiler
+        self.server = server
+        self.conf = conf
+        self.classes = classes
+        self.preprocessor = preprocessor
+        self.tracker = make_tracker(tracker)
+        self.counter = counter
+        self.frames = 0
+        self.started_at = self.last_at = time.perf_counter()
+
+    def track(self, frame):
+        """Detect qua server dùng chung, ghép ID bằng tracker riêng của stream -> Tracks."""
+        pre = self.preprocessor
+        image = pre.crop(frame) if pre is not None else frame
+        imgsz = pre.imgsz if pre is not None else 640
+        t0 = time.perf_counter()
+        det = self.server.submit(image, imgsz, self.conf, self.classes, self.line).result()
+        t1 = time.perf_counter()
+        out = self.tracker.update(det, image)
+        if self.profiler is not None:
+            # "detect" gồm cả thời gian chờ trong lô của server
+            self.profiler.add("detect", t1 - t0)
+            self.profiler.add("track", time.perf_counter() - t1)
+        self.frames += 1
+        self.last_at = time.perf_counter()
+        tracks = tracks_from_array(out)
+        return pre.map_tracks(tracks) if pre is not None else tracks
+
+    def snapshot(self):
+        elapsed = self.last_at - self.started_at
+        state = {"frames": self.frames, "fps": round(self.frames / elapsed, 2) if elapsed > 0 else 0.0}
+        if self.counter is not None:
+            state["count"] = self.counter.count
+        return state
+
+
+def _is_live(source):
+    return isinstance(source, int) or str(source).startswith(("rtsp://", "rtmp://", "http://", "https://"))
+
+
+class StreamManager:
+    """
+    Chạy nhiều nguồn video cùng lúc trên một InferenceServer.
+
+    Mỗi nguồn có một thread đọc + xử lý riêng; nguồn live (RTSP, webcam) chỉ giữ
+    frame mới nhất, nguồn file được đọc tuần tự không bỏ frame.
+    """
+
+    def __init__(self, server, line_ratio=0.6, **stream_kwargs):
+        self.server = server
+        self.line_ratio = line_ratio
+        self.stream_kwargs = stream_kwargs
+        self.streams = {}
+        self.latest = {}  # tên stream -> (idx, frame, tracks) mới nhất, dùng để hiển thị
+        self._threads = []
+        self._stop = threading.Event()
+
+    def add(self, name, source):
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise IOError(f"Không mở được nguồn: {source}")
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        line_y = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) * self.line_ratio)
+        stream = Stream(name, self.server, counter=LineCounter([(0, line_y), (width, line_y)]), **self.stream_kwargs)
+        self.streams[name] = stream
+        t = threading.Thread(target=self._run, args=(stream, cap, _is_live(source)), daemon=True)
+        self._threads.append(t)
+        return stream
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+        return self
+
+    def _run(self, stream, cap, live):
+        idx = 0
+        try:
+            while not self._stop.is_set():
+                if live:
+                    # Bỏ các frame cũ trong buffer của driver, chỉ xử lý frame mới nhất
+                    cap.grab()
+                    success, frame = cap.retrieve()
+                else:
+                    success, frame = cap.read()
+                if not success:
+                    break
+                tracks = stream.track(frame)
+                stream.counter.update(tracks.xyxy, tracks.ids, idx)
+                self.latest[stream.name] = (idx, frame, tracks)
+                idx += 1
+        finally:
+            cap.release()
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=2.0)
+
+    def snapshot(self):
+        return {
+            "streams": {name: s.snapshot() for name, s in self.streams.items()},
+            "mean_batch": round(self.server.mean_batch, 2),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy nhiều luồng video trên một model dùng chung")
+    parser.add_argument("sources", nargs="+", help="File video, URL RTSP hoặc chỉ số webcam")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--classes", type=int, nargs="*", default=[2, 5, 7])
+    parser.add_argument("--interval", type=float, default=2.0, help="Số giây giữa 2 lần in số đếm")
+    args = parser.parse_args()
+
+    from vision.backends import load_model
+    from vision.preprocess import Preprocessor
+    from vision.warmup import warm_up
+
+    model, _ = load_model(args.model, args.backend, args.imgsz, batch=len(args.sources))
+    # Warm-up trước khi mở luồng: luồng RTSP không bị dồn frame trong lúc chờ lần predict đầu
+    warm_up(model, args.imgsz, batch=len(args.sources))
+    server = InferenceServer(model, max_batch=len(args.sources))
+    manager = StreamManager(server, conf=args.conf, classes=args.classes or None, preprocessor=Preprocessor(args.imgsz))
+    for i, source in enumerate(args.sources):
+        manager.add(f"cam{i}", int(source) if source.isdigit() else source)
+    manager.start()
+    try:
+        while manager.running:
+            time.sleep(args.interval)
+            print(manager.snapshot())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.stop()
+        server.close()
+    print(manager.snapshot())
@@ -0,0 +1,213 @@
+"""
+Chạy detector thưa hơn (mỗi k frame hoặc theo mức độ chuyển động) và lấp các
+frame bị bỏ qua bằng box suy ra từ vận tốc của track.
+
+- Chế độ live: ngoại suy (extrapolate) từ 2 lần detect gần nhất, không có độ trễ.
+- Chế độ offline: nội suy (interpolate) tuyến tính giữa 2 lần detect, trễ tối đa
+  `max_stride` frame nhưng quỹ đạo mượt và chính xác hơn.
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from vision.tracking import Tracks, empty_tracks
+
+
+def _small_gray(frame, scale):
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+class StrideScheduler:
+    """
+    Quyết định frame nào cần chạy detector.
+
+    - `adaptive=False`: chạy đúng mỗi `stride` frame.
+    - `adaptive=True`: so sánh ảnh xám thu nhỏ với frame detect gần nhất; nếu tỉ lệ
+      pixel thay đổi vượt `motion_threshold` thì detect ngay, nếu không thì bỏ qua
+      nhưng không quá `max_stride` frame liên tiếp.
+    """
+
+    def __init__(self, stride=1, adaptive=False, max_stride=4, motion_threshold=0.02, diff_level=25, scale=0.125):
+        self.stride = max(1, stride)
+        self.adaptive = adaptive
+        self.max_stride = max(1, max_stride)
+        self.motion_threshold = motion_threshold
+        self.diff_level = diff_level
+        self.scale = scale
+        self.last_motion = 0.0
+        self._since = None
+        self._ref = None
+
+    def should_detect(self, frame):
+        if self._since is None:
+            decision = True
+        elif not self.adaptive:
+            decision = self._since + 1 >= self.stride
+        else:
+            small = _small_gray(frame, self.scale)
+            self.last_motion = float(np.count_nonzero(cv2.absdiff(small, self._ref) > self.diff_level)) / small.size
+            decision = self.last_motion > self.motion_threshold or self._since + 1 >= self.max_stride
+
+        if decision:
+            self._since = 0
+            if self.adaptive:
+                self._ref = _small_gray(frame, self.scale)
+        else:
+            self._since += 1
+        return decision
+
+
+def _match(ids_a, ids_b):
+    """Chỉ số của các ID chung giữa 2 lần detect."""
+    _, ia, ib = np.intersect1d(ids_a, ids_b, assume_unique=True, return_indices=True)
+    return ia, ib
+
+
+class StridedTracker:
+    """
+    Bọc một hàm tracking `track_fn(frame) -> Tracks` để chỉ gọi nó trên các frame
+    được StrideScheduler chọn; các frame còn lại nhận box suy ra từ vận tốc.
+    """
+
+    def __init__(self, track_fn, scheduler):
+        self.track_fn = track_fn
+        self.scheduler = scheduler
+        self.detections = 0
+        self.frames = 0
+        self._last = empty_tracks()
+        self._last_idx = 0
+        self._vel = np.zeros((0, 4), np.float32)
+
+    @property
+    def detect_ratio(self):
+        return self.detections / self.frames if self.frames else 0.0
+
+    def _detect(self, frame, idx):
+        tracks = self.track_fn(frame)
+        vel = np.zeros((len(tracks.ids), 4), np.float32)
+        if len(self._last.ids) and idx > self._last_idx:
+            ia, ib = _match(self._last.ids, tracks.ids)
+            vel[ib] = (tracks.xyxy[ib] - self._last.xyxy[ia]) / (idx - self._last_idx)
+        self._last, self._last_idx, self._vel = tracks, idx, vel
+        self.detections += 1
+        return tracks
+
+    def _extrapolate(self, idx):
+        xyxy = self._last.xyxy + self._vel * (idx - self._last_idx)
+        return Tracks(xyxy.astype(np.float32), self._last.ids, self._last.cls, self._last.conf)
+
+    def step(self, frame, idx):
+        """Chế độ live: trả về (tracks, detected) cho frame hiện tại, không trễ."""
+        self.frames += 1
+        if self.scheduler.should_detect(frame):
+            return self._detect(frame, idx), True
+        return self._extrapolate(idx), False
+
+    def iter_interpolated(self, frames_iter):
+        """
+        Chế độ offline: duyệt (idx, frame), trả về (idx, frame, tracks, detected).
+
+        Các frame bị bỏ qua được giữ lại cho đến lần detect kế tiếp rồi nội suy
+        tuyến tính box của các track xuất hiện ở cả 2 lần detect; track chỉ có ở
+        lần trước thì ngoại suy như chế độ live.
+        """
+        pending = []
+        for idx, frame in frames_iter:
+            self.frames += 1
+            if not self.scheduler.should_detect(frame):
+                pending.append((idx, frame))
+                continue
+
+            prev, prev_idx = self._last, self._last_idx
+            prev_vel = self._vel
+            tracks = self._detect(frame, idx)
+            ia, ib = _match(prev.ids, tracks.ids)
+            only_prev = np.setdiff1d(np.arange(len(prev.ids)), ia, assume_unique=True)
+            for p_idx, p_frame in pending:
+                t = (p_idx - prev_idx) / (idx - prev_idx)
+                both = prev.xyxy[ia] + (tracks.xyxy[ib] - prev.xyxy[ia]) * t
+                gone = prev.xyxy[only_prev] + prev_vel[only_prev] * (p_idx - prev_idx)
+                keep = np.concatenate([ia, only_prev])
+                yield p_idx, p_frame, Tracks(
+                    np.concatenate([both, gone]).astype(np.float32),
+                    prev.ids[keep], prev.cls[keep], prev.conf[keep],
+                ), False
+            pending = []
+            yield idx, frame, tracks, True
+
+        # Hết video: các frame còn lại chỉ có thể ngoại suy
+        for p_idx, p_frame in pending:
+            yield p_idx, p_frame, self._extrapolate(p_idx), False
+
+
+def compare_counts(model_path, video, strides=(1, 2, 3, 4), adaptive=True, classes=None, conf=0.5, line_ratio=0.6):
+    """
+    Đếm xe trên cùng video với nhiều stride (và chế độ adaptive), so sánh
+    frame/s và sai số số đếm so với chạy đủ mọi frame (stride=1).
+    """
+    from ultralytics import YOLO
+
+    from vision.counter import LineCounter
+    from vision.tracking import tracks_from_result
+
+    configs = [{"stride": s} for s in strides]
+    if adaptive:
+        configs.append({"adaptive": True})
+
+    reports = []
+    for config in configs:
+        model = YOLO(model_path)
+        cap = cv2.VideoCapture(video)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        line_y = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) * line_ratio)
+        counter = LineCounter([(0, line_y), (width, line_y)])
+
+        def track(frame):
+            results = model.track(frame, persist=True, conf=conf, classes=classes, tracker="bytetrack.yaml", verbose=False)
+            return tracks_from_result(results[0])
+
+        def frames():
+            idx = 0
+            while True:
+                success, frame = cap.read()
+                if not success:
+                    return
+                yield idx, frame
+                idx += 1
+
+        strided = StridedTracker(track, StrideScheduler(**config))
+        t0 = time.perf_counter()
+        for idx, _, tracks, _ in strided.iter_interpolated(frames()):
+            counter.update(tracks.xyxy, tracks.ids, idx)
+        elapsed = time.perf_counter() - t0
+        cap.release()
+
+        reports.append({
+            **config,
+            "frames": strided.frames,
+            "detect_ratio": round(strided.detect_ratio, 3),
+            "fps": round(strided.frames / elapsed, 2) if elapsed > 0 else 0.0,
+            "count": counter.count,
+        })
+
+    base = reports[0]
+    for r in reports:
+        r["speedup"] = round(r["fps"] / base["fps"], 2) if base["fps"] else 0.0
+        r["count_error"] = r["count"] - base["count"]
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh frame/s và sai số đếm khi bỏ qua frame")
+    parser.add_argument("video", help="vd: video/count-car1.mp4")
+    parser.add_argument("--model", default="yolov8m.pt")
+    parser.add_argument("--strides", type=int, nargs="+", default=[1, 2, 3, 4])
+    parser.add_argument("--no-adaptive", action="store_true")
+    parser.add_argument("--classes", type=int, nargs="*", default=[2, 5, 7])
+    args = parser.parse_args()
+
+    for report in compare_counts(args.model, args.video, args.strides, not args.no_adaptive, classes=args.classes or None):
+        print(report)
@@ -0,0 +1,175 @@
+"""
+Cache kết quả tracking (box, ID, class, conf) theo từng video.
+
+Dời vạch đếm, đổi `min_hits`, đổi hệ số hiệu chỉnh tốc độ... không làm thay đổi
+kết quả detect + ByteTrack, nên chỉ cần chạy model MỘT lần rồi đếm lại từ cache.
+
+- Khóa cache: hash nội dung video + model + cấu hình tracking (imgsz, conf,
+  classes, ROI, tracker, stride...). Đổi một trong các thông số đó -> cache mới.
+- Lưu dạng cột: mỗi cột là một file nhị phân thô, đọc lại bằng `np.memmap`
+  (không phải load cả video vào RAM). `meta.json` ghi dtype / shape / số frame.
+- Ghi vào thư mục tạm rồi đổi tên khi xong: lần chạy bị ngắt giữa chừng không
+  để lại cache dở dang.
+
+Ví dụ:
+    key = cache_key(video, "yolov8m.pt", imgsz=640, conf=0.5, classes=[2, 5, 7])
+    cache = open_cache(key)
+    if cache is None:
+        with TrackCacheWriter(key, video=video) as writer:
+            for idx, frame, tracks in tracker.iter_video(video):
+                writer.add(idx, tracks)
+    for idx, tracks in open_cache(key):
+        ...
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from vision.tracking import Tracks, empty_tracks
+
+CACHE_DIR = os.environ.get(
+    "VISION_TRACK_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "vision", "tracks")
+)
+
+# Tên cột -> (shape mỗi dòng, dtype lưu trên đĩa)
+COLUMNS = {
+    "frame": ((), np.int32),
+    "xyxy": ((4,), np.float32),
+    "ids": ((), np.int64),
+    "cls": ((), np.int16),
+    "conf": ((), np.float16),
+}
+
+
+def video_digest(path, sample=4 << 20):
+    """
+    Hash nhanh cho video lớn: kích thước + 3 đoạn `sample` byte ở đầu / giữa / cuối.
+    Đủ để phân biệt các file khác nhau mà không phải đọc hết nhiều GB.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in (0, max(0, size // 2 - sample // 2), max(0, size - sample)):
+            f.seek(offset)
+            h.update(f.read(sample))
+    return h.hexdigest()[:16]
+
+
+def cache_key(video_path, model, **config):
+    """Khóa cache từ video + model + cấu hình tracking (mọi giá trị phải serialize được ra JSON)."""
+    payload = json.dumps({"model": os.path.basename(str(model)), **config}, sort_keys=True, default=str)
+    config_digest = hashlib.sha1(payload.encode()).hexdigest()[:12]
+    return f"{video_digest(video_path)}-{config_digest}"
+
+
+def cache_path(key, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, key)
+
+
+class TrackCacheWriter:
+    """Ghi Tracks từng frame vào cache; dùng với `with` để tự hủy khi có lỗi."""
+
+    def __init__(self, key, cache_dir=None, **meta):
+        self.path = cache_path(key, cache_dir)
+        self.meta = {"key": key, **meta}
+        self.frames = 0
+        self.rows = 0
+        self.aborted = False
+        self._tmp = f"{self.path}.part-{os.getpid()}-{id(self)}"
+        os.makedirs(self._tmp, exist_ok=True)
+        self._files = {name: open(os.path.join(self._tmp, name + ".bin"), "wb") for name in COLUMNS}
+
+    def add(self, idx, tracks):
+        n = len(tracks.ids)
+        self.frames = max(self.frames, idx + 1)
+        if n == 0:
+            return
+        columns = {"frame": np.full(n, idx), "xyxy": tracks.xyxy, "ids": tracks.ids, "cls": tracks.cls, "conf": tracks.conf}
+        for name, (_, dtype) in COLUMNS.items():
+            self._files[name].write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        self.rows += n
+
+    def close(self, **meta):
+        """Hoàn tất: ghi meta.json rồi chuyển thư mục tạm thành cache chính thức."""
+        for f in self._files.values():
+            f.close()
+        self.meta.update(meta)
+        self.meta.update({
+            "frames": self.frames,
+            "rows": self.rows,
+            "columns": {name: {"shape": list(shape), "dtype": np.dtype(dtype).str} for name, (shape, dtype) in COLUMNS.items()},
+        })
+        with open(os.path.join(self._tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        try:
+            os.replace(self._tmp, self.path)
+        except OSError:
+            # Process khác đã ghi xong cùng khóa trước -> bỏ bản của mình
+            shutil.rmtree(self._tmp, ignore_errors=True)
+        return self.path
+
+    def abort(self):
+        """Bỏ cache đang ghi (vd người dùng dừng giữa chừng, chưa đủ mọi frame)."""
+        self.aborted = True
+        for f in self._files.values():
+            f.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None and not self.aborted:
+            self.close()
+        elif not self.aborted:
+            self.abort()
+
+
+class TrackCache:
+    """Đọc cache đã ghi: `cache[idx]` -> Tracks của frame idx, duyệt bằng `for idx, tracks in cache`."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        rows = self.meta["rows"]
+        self.columns = {}
+        for name, spec in self.meta["columns"].items():
+            shape = (rows, *spec["shape"])
+            if rows == 0:
+                self.columns[name] = np.zeros(shape, spec["dtype"])
+            else:
+                self.columns[name] = np.memmap(os.path.join(path, name + ".bin"), dtype=spec["dtype"], mode="r", shape=shape)
+        # Dòng của frame i nằm trong [offsets[i], offsets[i + 1])
+        self.offsets = np.searchsorted(self.columns["frame"], np.arange(self.meta["frames"] + 1))
+
+    def __len__(self):
+        return self.meta["frames"]
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < len(self):
+            return empty_tracks()
+        a, b = self.offsets[idx], self.offsets[idx + 1]
+        if a == b:
+            return empty_tracks()
+        c = self.columns
+        return Tracks(
+            np.asarray(c["xyxy"][a:b], np.float32),
+            np.asarray(c["ids"][a:b], np.int64),
+            np.asarray(c["cls"][a:b], np.int64),
+            np.asarray(c["conf"][a:b], np.float32),
+        )
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield idx, self[idx]
+
+
+def open_cache(key, cache_dir=None):
+    """Trả về TrackCache nếu đã có cache hoàn chỉnh cho khóa này, ngược lại None."""
+    path = cache_path(key, cache_dir)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    return TrackCache(path)
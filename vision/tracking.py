@@ -0,0 +1,228 @@
+import argparse
+import inspect
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Kết quả tracking của một frame (mảng NumPy, N = số đối tượng)
+# xyxy: (N, 4) float32 | ids: (N,) int | cls: (N,) int | conf: (N,) float32
+Tracks = namedtuple("Tracks", ["xyxy", "ids", "cls", "conf"])
+
+
+def empty_tracks():
+    return Tracks(
+        np.zeros((0, 4), np.float32),
+        np.zeros(0, np.int64),
+        np.zeros(0, np.int64),
+        np.zeros(0, np.float32),
+    )
+
+
+def select_tracks(tracks, classes=None, conf=0.0):
+    """Giữ các track thuộc `classes` (None = mọi class) và có score >= `conf`."""
+    keep = tracks.conf >= conf
+    if classes is not None:
+        keep &= np.isin(tracks.cls, classes)
+    if keep.all():
+        return tracks
+    return Tracks(tracks.xyxy[keep], tracks.ids[keep], tracks.cls[keep], tracks.conf[keep])
+
+
+def box_iou(a, b):
+    """Ma trận IoU (N, M) giữa 2 tập box xyxy."""
+    a = np.asarray(a, np.float32).reshape(-1, 4)
+    b = np.asarray(b, np.float32).reshape(-1, 4)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def tracks_from_result(result):
+    """Chuyển `results[0]` của `model.track(...)` thành Tracks."""
+    boxes = result.boxes
+    if boxes is None or boxes.id is None:
+        return empty_tracks()
+    return Tracks(
+        boxes.xyxy.cpu().numpy().astype(np.float32),
+        boxes.id.cpu().numpy().astype(np.int64),
+        boxes.cls.cpu().numpy().astype(np.int64),
+        boxes.conf.cpu().numpy().astype(np.float32),
+    )
+
+
+def tracks_from_array(tracks):
+    """Chuyển kết quả `tracker.update` (cột: x1, y1, x2, y2, track_id, score, cls, idx) thành Tracks."""
+    if len(tracks) == 0:
+        return empty_tracks()
+    return Tracks(
+        tracks[:, :4].astype(np.float32),
+        tracks[:, 4].astype(np.int64),
+        tracks[:, 6].astype(np.int64),
+        tracks[:, 5].astype(np.float32),
+    )
+
+
+def make_tracker(tracker="bytetrack.yaml", frame_rate=30):
+    """Tạo tracker giống hệt cách `model.track` tạo (cùng file cấu hình, cùng frame_rate)."""
+    from ultralytics.trackers.track import TRACKER_MAP
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+
+    try:
+        from ultralytics.utils import YAML
+
+        yaml_load = YAML.load
+    except ImportError:  # ultralytics bản cũ
+        from ultralytics.utils import yaml_load
+
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker)))
+    if cfg.tracker_type not in TRACKER_MAP:
+        raise ValueError(f"Tracker không hỗ trợ: '{cfg.tracker_type}'")
+    tracker_cls = TRACKER_MAP[cfg.tracker_type]
+    # ultralytics bản mới bỏ tham số frame_rate (track_buffer tính thẳng theo frame)
+    if "frame_rate" in inspect.signature(tracker_cls.__init__).parameters:
+        return tracker_cls(args=cfg, frame_rate=frame_rate)
+    return tracker_cls(args=cfg)
+
+
+class BatchTracker:
+    """
+    Detect theo lô N frame trong MỘT lần gọi model, sau đó chạy ByteTrack
+    tuần tự trên từng frame của lô.
+
+    Việc ghép ID vẫn diễn ra theo đúng thứ tự frame nên ID và số đếm giống
+    với cách gọi `model.track(frame, persist=True)` từng frame một.
+
+    Lưu ý: `model` không được dùng chung với `model.track(...)`, vì ultralytics
+    gắn callback tracker vào model và `model.predict` sau đó cũng bị tracking theo.
+    """
+
+    def __init__(self, model, batch_size=8, tracker="bytetrack.yaml", frame_rate=30, preprocessor=None, **predict_kwargs):
+        """preprocessor: vision.preprocess.Preprocessor (imgsz + ROI), None = cả frame."""
+        self.model = model
+        self.preprocessor = preprocessor
+        self.batch_size = batch_size
+        self.tracker_cfg = tracker
+        self.frame_rate = frame_rate
+        # `model.track` mặc định conf=0.1 nếu không truyền vào
+        predict_kwargs.setdefault("conf", 0.1)
+        predict_kwargs.setdefault("verbose", False)
+        self.predict_kwargs = predict_kwargs
+        self.tracker = make_tracker(tracker, frame_rate)
+
+    def reset(self):
+        self.tracker = make_tracker(self.tracker_cfg, self.frame_rate)
+
+    def update(self, result):
+        """Ghép ID cho kết quả detect của một frame."""
+        det = result.boxes.cpu().numpy()
+        return tracks_from_array(self.tracker.update(det, result.orig_img))
+
+    def process(self, frames):
+        """Detect cả lô `frames` một lần, trả về danh sách Tracks theo thứ tự frame."""
+        if not frames:
+            return []
+        pre = self.preprocessor
+        if pre is None:
+            results = self.model.predict(list(frames), **self.predict_kwargs)
+            return [self.update(r) for r in results]
+        results = self.model.predict([pre.crop(f) for f in frames], imgsz=pre.imgsz, **self.predict_kwargs)
+        return [pre.map_tracks(self.update(r)) for r in results]
+
+    def iter_batches(self, source):
+        """Duyệt toàn bộ video theo lô, trả về (idx của frame đầu lô, frames, kết quả từng frame)."""
+        cap = cv2.VideoCapture(source) if isinstance(source, str) else source
+        idx = 0
+        try:
+            while True:
+                frames = []
+                while len(frames) < self.batch_size:
+                    success, frame = cap.read()
+                    if not success:
+                        break
+                    frames.append(frame)
+                if not frames:
+                    break
+                yield idx, frames, self.process(frames)
+                idx += len(frames)
+        finally:
+            cap.release()
+
+    def iter_video(self, source):
+        """Duyệt toàn bộ video, trả về (idx, frame, tracks) cho từng frame."""
+        for start, frames, results in self.iter_batches(source):
+            for i, (frame, tracks) in enumerate(zip(frames, results)):
+                yield start + i, frame, tracks
+
+
+def iter_video_per_frame(model, source, tracker="bytetrack.yaml", **track_kwargs):
+    """Cách làm cũ: gọi `model.track(frame, persist=True)` cho từng frame (dùng làm baseline)."""
+    cap = cv2.VideoCapture(source) if isinstance(source, str) else source
+    track_kwargs.setdefault("verbose", False)
+    idx = 0
+    try:
+        while True:
+            success, frame = cap.read()
+            if not success:
+                break
+            results = model.track(frame, persist=True, tracker=tracker, **track_kwargs)
+            yield idx, frame, tracks_from_result(results[0])
+            idx += 1
+    finally:
+        cap.release()
+
+
+def compare_throughput(model_path, video, batch_size=8, max_frames=None, **kwargs):
+    """
+    Chạy cùng một video theo 2 cách (từng frame / theo lô) và so sánh
+    tốc độ (frame/s) cũng như độ khớp của ID.
+    """
+    from ultralytics import YOLO
+
+    def run(frames_iter):
+        ids_per_frame = []
+        t0 = time.perf_counter()
+        for idx, _, tracks in frames_iter:
+            ids_per_frame.append(tuple(sorted(tracks.ids.tolist())))
+            if max_frames and idx + 1 >= max_frames:
+                break
+        return ids_per_frame, time.perf_counter() - t0
+
+    # Mỗi cách dùng một model riêng để trạng thái tracker không lẫn vào nhau
+    base_ids, base_time = run(iter_video_per_frame(YOLO(model_path), video, **kwargs))
+    batch_ids, batch_time = run(BatchTracker(YOLO(model_path), batch_size=batch_size, **kwargs).iter_video(video))
+
+    n = min(len(base_ids), len(batch_ids))
+    same = sum(a == b for a, b in zip(base_ids[:n], batch_ids[:n]))
+    return {
+        "frames": n,
+        "batch_size": batch_size,
+        "per_frame_fps": round(len(base_ids) / base_time, 2) if base_time else 0.0,
+        "batched_fps": round(len(batch_ids) / batch_time, 2) if batch_time else 0.0,
+        "unique_ids_per_frame": len({i for f in base_ids for i in f}),
+        "unique_ids_batched": len({i for f in batch_ids for i in f}),
+        "frames_with_same_ids": same,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh tốc độ tracking từng frame và theo lô")
+    parser.add_argument("video", nargs="+", help="Đường dẫn video, vd: video/count-car1.mp4")
+    parser.add_argument("--model", default="yolov8m.pt")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--classes", type=int, nargs="*", default=None)
+    parser.add_argument("--max-frames", type=int, default=None)
+    args = parser.parse_args()
+
+    for path in args.video:
+        report = compare_throughput(
+            args.model, path, batch_size=args.batch, max_frames=args.max_frames,
+            conf=args.conf, classes=args.classes or None,
+        )
+        print(path, report)
@@ -0,0 +1,159 @@
+"""
+Kho trạng thái theo track ID có giới hạn bộ nhớ, dùng cho luồng video chạy 24/7.
+
+Mỗi track chiếm một "slot" trong các mảng cấp phát sẵn (kích thước cố định):
+- quỹ đạo gần nhất lưu trong ring buffer (capacity, history, 2),
+- các cột dữ liệu tùy ý (đã đếm chưa, vị trí trước, tốc độ...),
+- track không xuất hiện quá `max_idle` frame sẽ bị giải phóng; khi đầy,
+  track lâu chưa thấy nhất bị thay thế (giới hạn cứng `capacity`).
+"""
+import numpy as np
+
+
+class TrackStore:
+    def __init__(self, capacity=1024, history=0, max_idle=150, with_time=False, **fields):
+        """
+        fields: tên cột -> (shape phụ, dtype), vd `prev=((2,), np.float32)`.
+        history: số điểm quỹ đạo giữ lại cho mỗi track (0 = không lưu quỹ đạo).
+        with_time: lưu thêm thời điểm (giây) cho mỗi điểm quỹ đạo.
+        """
+        self.capacity = capacity
+        self.history = history
+        self.max_idle = max_idle
+        self.frame = 0
+        self.evicted = 0
+
+        self.ids = np.full(capacity, -1, np.int64)  # slot -> track ID (-1 = trống)
+        self.last_seen = np.zeros(capacity, np.int64)
+        self.fields = {name: np.zeros((capacity,) + tuple(shape), dtype) for name, (shape, dtype) in fields.items()}
+
+        self.trail = np.zeros((capacity, history, 2), np.float32)
+        self.trail_t = np.zeros((capacity, history), np.float64) if with_time else None
+        self.trail_len = np.zeros(capacity, np.int32)
+        self.trail_head = np.zeros(capacity, np.int32)  # vị trí sẽ ghi tiếp theo
+
+        # Chỉ mục ID đã sắp xếp -> tra cứu cả frame bằng np.searchsorted
+        self._index_ids = np.zeros(0, np.int64)
+        self._index_slots = np.zeros(0, np.intp)
+
+    def __len__(self):
+        return len(self._index_ids)
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    # --- Chỉ mục ---
+    def _reindex(self):
+        active = np.flatnonzero(self.ids >= 0)
+        order = np.argsort(self.ids[active], kind="stable")
+        self._index_slots = active[order]
+        self._index_ids = self.ids[self._index_slots]
+
+    def lookup(self, ids):
+        """Trả về (slots, known) cho các ID; slot của ID chưa có là -1."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        pos = np.searchsorted(self._index_ids, ids)
+        known = np.zeros(len(ids), bool)
+        inside = pos < len(self._index_ids)
+        known[inside] = self._index_ids[pos[inside]] == ids[inside]
+        slots = np.full(len(ids), -1, np.intp)
+        slots[known] = self._index_slots[pos[known]]
+        return slots, known
+
+    # --- Giải phóng ---
+    def _release(self, slots):
+        if len(slots) == 0:
+            return
+        self.ids[slots] = -1
+        self.trail_len[slots] = 0
+        self.trail_head[slots] = 0
+        for col in self.fields.values():
+            col[slots] = 0
+        self.evicted += len(slots)
+
+    def evict_idle(self):
+        """Giải phóng các track không xuất hiện quá `max_idle` frame."""
+        idle = np.flatnonzero((self.ids >= 0) & (self.frame - self.last_seen > self.max_idle))
+        if len(idle):
+            self._release(idle)
+            self._reindex()
+        return len(idle)
+
+    # --- Cập nhật theo frame ---
+    def touch(self, ids, frame=None):
+        """
+        Đánh dấu các ID xuất hiện ở frame hiện tại, cấp slot cho ID mới.
+
+        Trả về (slots, is_new). Slot mới luôn được reset về 0.
+        Nếu `frame` không truyền vào thì bộ đếm frame nội bộ tự tăng 1.
+        """
+        self.frame = self.frame + 1 if frame is None else frame
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        slots, known = self.lookup(ids)
+        self.last_seen[slots[known]] = self.frame
+
+        new_ids = ids[~known]
+        if len(new_ids):
+            self.evict_idle()
+            free = np.flatnonzero(self.ids < 0)
+            if len(free) < len(new_ids):
+                # Đầy: thay thế các track lâu chưa thấy nhất (trừ track của frame này)
+                busy = np.flatnonzero(self.ids >= 0)
+                busy = busy[self.last_seen[busy] < self.frame]
+                need = len(new_ids) - len(free)
+                victims = busy[np.argsort(self.last_seen[busy], kind="stable")[:need]]
+                self._release(victims)
+                free = np.flatnonzero(self.ids < 0)
+            # Trường hợp 1 frame có nhiều ID hơn capacity: bỏ bớt ID mới
+            take = min(len(free), len(new_ids))
+            new_slots = free[:take]
+            self.ids[new_slots] = new_ids[:take]
+            self.last_seen[new_slots] = self.frame
+            self._reindex()
+            slots[np.flatnonzero(~known)[:take]] = new_slots
+        return slots, ~known
+
+    def append(self, slots, points, t=None):
+        """Ghi thêm một điểm quỹ đạo cho mỗi slot (ring buffer, ghi đè điểm cũ nhất)."""
+        if self.history == 0:
+            return
+        slots = np.asarray(slots, dtype=np.intp)
+        ok = slots >= 0
+        slots = slots[ok]
+        head = self.trail_head[slots]
+        self.trail[slots, head] = np.asarray(points, np.float32).reshape(-1, 2)[ok]
+        if self.trail_t is not None and t is not None:
+            self.trail_t[slots, head] = np.broadcast_to(np.asarray(t, np.float64), ok.shape)[ok]
+        self.trail_head[slots] = (head + 1) % self.history
+        self.trail_len[slots] = np.minimum(self.trail_len[slots] + 1, self.history)
+
+    def trails(self, slots):
+        """
+        Quỹ đạo theo thứ tự thời gian cho nhiều slot cùng lúc.
+
+        Trả về (points, lengths): points có shape (N, history, 2), các điểm hợp lệ
+        của slot i là points[i, history - lengths[i]:].
+        """
+        slots = np.asarray(slots, dtype=np.intp)
+        order = (self.trail_head[slots, None] + np.arange(self.history)) % self.history
+        return self.trail[slots[:, None], order], self.trail_len[slots]
+
+    def trail_times(self, slots):
+        slots = np.asarray(slots, dtype=np.intp)
+        order = (self.trail_head[slots, None] + np.arange(self.history)) % self.history
+        return self.trail_t[slots[:, None], order]
+
+    # --- Thống kê ---
+    def nbytes(self):
+        arrays = [self.ids, self.last_seen, self.trail, self.trail_len, self.trail_head, *self.fields.values()]
+        if self.trail_t is not None:
+            arrays.append(self.trail_t)
+        return int(sum(a.nbytes for a in arrays))
+
+    def stats(self):
+        return {
+            "active_tracks": len(self),
+            "capacity": self.capacity,
+            "evicted_total": self.evicted,
+            "memory_kb": round(self.nbytes() / 1024, 1),
+        }
@@ -0,0 +1,103 @@
+"""
+Lưu video upload ra đĩa theo từng chunk thay vì `tfile.write(uploaded_file.read())`.
+
+- Không tạo thêm bản sao toàn bộ file trong RAM (đọc / ghi mỗi lần `chunk_size` byte).
+- File được đặt tên theo hash nội dung: upload lại cùng một video thì dùng lại file cũ.
+- Thư mục upload có giới hạn dung lượng; vượt quá thì xóa file ít dùng nhất (LRU
+  theo mtime, mỗi lần dùng lại file sẽ được "touch").
+
+Cấu hình bằng biến môi trường `VISION_UPLOAD_DIR`, `VISION_UPLOAD_BUDGET_MB`.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+UPLOAD_DIR = os.environ.get("VISION_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "vision-uploads"))
+BUDGET_BYTES = int(os.environ.get("VISION_UPLOAD_BUDGET_MB", "4096")) * (1 << 20)
+CHUNK_SIZE = 8 << 20
+PART_MAX_AGE = 24 * 3600  # file .part bỏ dở (process bị kill giữa chừng) quá lâu thì dọn
+
+# file_id của Streamlit -> đường dẫn đã lưu, để các lần rerun không phải băm lại
+_saved = {}
+
+
+def _chunks(f, chunk_size):
+    f.seek(0)
+    return iter(lambda: f.read(chunk_size), b"")
+
+
+def _digest(f, chunk_size):
+    h = hashlib.sha1()
+    for chunk in _chunks(f, chunk_size):
+        h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def save_upload(uploaded_file, upload_dir=None, budget_bytes=None, chunk_size=CHUNK_SIZE):
+    """
+    Lưu file upload (UploadedFile của Streamlit hoặc file object nhị phân bất kỳ),
+    trả về đường dẫn trên đĩa. Gọi lại với cùng nội dung chỉ tốn một lần băm.
+    """
+    upload_dir = upload_dir or UPLOAD_DIR
+    budget_bytes = BUDGET_BYTES if budget_bytes is None else budget_bytes
+
+    file_id = getattr(uploaded_file, "file_id", None)
+    path = _saved.get(file_id)
+    if path is None or not os.path.exists(path):
+        ext = os.path.splitext(getattr(uploaded_file, "name", "") or "")[1].lower()
+        path = os.path.join(upload_dir, _digest(uploaded_file, chunk_size) + ext)
+        if not os.path.exists(path):
+            os.makedirs(upload_dir, exist_ok=True)
+            fd, part = tempfile.mkstemp(dir=upload_dir, suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    for chunk in _chunks(uploaded_file, chunk_size):
+                        out.write(chunk)
+                os.replace(part, path)
+            except BaseException:
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+        if file_id is not None:
+            _saved[file_id] = path
+
+    os.utime(path)  # đánh dấu vừa dùng cho LRU
+    cleanup(upload_dir, budget_bytes, keep=path)
+    return path
+
+
+def cleanup(upload_dir=None, budget_bytes=None, keep=None):
+    """Xóa file cũ nhất cho tới khi tổng dung lượng <= budget. Trả về số byte đã xóa."""
+    upload_dir = upload_dir or UPLOAD_DIR
+    budget_bytes = BUDGET_BYTES if budget_bytes is None else budget_bytes
+    if not os.path.isdir(upload_dir):
+        return 0
+
+    now = time.time()
+    files = []
+    for entry in os.scandir(upload_dir):
+        if not entry.is_file():
+            continue
+        st = entry.stat()
+        if entry.name.endswith(".part"):
+            if now - st.st_mtime > PART_MAX_AGE:
+                os.remove(entry.path)
+            continue
+        files.append((st.st_mtime, st.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    freed = 0
+    for _, size, path in sorted(files):
+        if total <= budget_bytes:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            # Trên Linux, VideoCapture đang mở file vẫn đọc tiếp được sau khi xóa
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        freed += size
+    return freed
@@ -0,0 +1,259 @@
+"""
+Khởi động nhanh: không để lần chạy đầu tiên gánh import + load model + warm-up.
+
+- Thư viện nặng (torch, ultralytics, mediapipe) chỉ được import khi cần;
+  `import_times` đo thời gian import của từng thư viện.
+- `warm_up`: chạy vài lần predict trên ảnh đen đúng `imgsz` / `batch` -> lần gọi
+  đầu (tạo predictor, fuse layer, cấp phát bộ nhớ, session ONNX) không rơi vào
+  frame thật đầu tiên.
+- `Preloader`: load + warm-up model trên thread nền ngay khi app khởi động
+  (trong lúc người dùng còn chọn file), app chỉ chờ khi thật sự cần model.
+- Chạy trước trong bước build / entrypoint của container (tải trọng số, export
+  ONNX / OpenVINO vào cache) và in thời gian cold start:
+    python -m vision.warmup --models yolov8n.pt yolov8m.pt --imgsz 640 --video video/count-car1.mp4
+"""
+import argparse
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from vision.backends import BACKENDS
+
+HEAVY_MODULES = ("cv2", "torch", "ultralytics", "mediapipe")
+
+
+def import_times(modules=HEAVY_MODULES):
+    """
+    Import từng module, trả về {tên: giây}. Module chưa cài -> None, đã import
+    từ trước -> 0.0 (chỉ process mới đo được thời gian thật).
+    """
+    times = {}
+    for name in modules:
+        if name in sys.modules:
+            times[name] = 0.0
+            continue
+        if importlib.util.find_spec(name) is None:
+            times[name] = None
+            continue
+        t0 = time.perf_counter()
+        importlib.import_module(name)
+        times[name] = round(time.perf_counter() - t0, 3)
+    return times
+
+
+def warm_up(model, imgsz=640, batch=1, runs=2):
+    """
+    Gọi `model.predict` `runs` lần trên `batch` ảnh đen imgsz x imgsz, trả về
+    thời gian từng lần (ms): lần đầu là chi phí cold start, lần cuối ~ lúc đã ấm.
+    CascadeModel: warm-up cả model nhỏ lẫn model lớn (model lớn chỉ chạy khi có
+    frame bị đẩy lên, nếu không sẽ gánh cold start giữa video).
+    """
+    from vision.cascade import CascadeModel
+
+    models = (model.small, model.large) if isinstance(model, CascadeModel) else (model,)
+    frames = [np.zeros((imgsz, imgsz, 3), np.uint8)] * batch
+    latencies = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        for m in models:
+            m.predict(frames if batch > 1 else frames[0], imgsz=imgsz, verbose=False)
+        latencies.append(round((time.perf_counter() - t0) * 1000, 1))
+    return latencies
+
+
+def warm_tracker(tracker="bytetrack.yaml"):
+    """Import module tracker của ultralytics + đọc file cấu hình một lần (ms)."""
+    from vision.tracking import make_tracker
+
+    t0 = time.perf_counter()
+    make_tracker(tracker)
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+class Lease:
+    """Giá trị một phiên đang dùng (`value`); `release` hoặc hết khối `with` thì trả lại."""
+
+    def __init__(self, preloader, job, value):
+        self.value = value
+        self._preloader = preloader
+        self._job = job
+
+    def release(self):
+        if self._job is not None:
+            job, self._job = self._job, None
+            self._preloader._release(job)
+
+    def __enter__(self):
+        return self.value
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Preloader:
+    """
+    Chạy các hàm load (model, server, phiên MediaPipe...) trên MỘT thread nền,
+    mỗi `key` một lần. `preload` không chặn; `get` chờ kết quả (nếu đã load xong
+    thì trả về ngay). Load lỗi thì `get` báo lỗi và lần gọi sau được thử lại.
+
+    Với Streamlit: bọc `Preloader()` bằng `st.cache_resource` để dùng chung cho
+    cả process, gọi `preload` ở đầu script và `get` khi bấm Start.
+    `max_entries`: chỉ giữ N key gần nhất (đổi slider nhiều lần không giữ mãi model cũ).
+    `on_evict`: gọi với giá trị của key bị bỏ (vd đóng phiên MediaPipe), khi load
+    xong và khi không còn phiên nào đang `use` nó (giá trị dùng chung cả process).
+    """
+
+    def __init__(self, modules=HEAVY_MODULES, max_entries=None, on_evict=None):
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self.imports = {}
+        self.timings = {}
+        self._jobs = {}
+        self._users = {}  # job -> số phiên đang `use`
+        self._retired = set()  # job đã bị bỏ khỏi `_jobs` nhưng còn phiên đang dùng
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preload")
+        if modules:
+            # Import thư viện nặng trước tiên, trang web vẫn hiển thị ngay
+            self._executor.submit(self._import, modules)
+
+    def _import(self, modules):
+        self.imports.update(import_times(modules))
+
+    def _run(self, key, load, args, kwargs):
+        t0 = time.perf_counter()
+        try:
+            return load(*args, **kwargs)
+        finally:
+            self.timings[key] = round(time.perf_counter() - t0, 3)
+
+    def _evicted(self, job):
+        if self.on_evict is not None and not job.cancelled() and job.exception() is None:
+            self.on_evict(job.result())
+
+    def preload(self, key, load, *args, **kwargs):
+        """Bắt đầu load nền (nếu `key` chưa có), trả về Future."""
+        evicted = []
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                job = self._jobs[key] = self._executor.submit(self._run, key, load, args, kwargs)
+                while self.max_entries and len(self._jobs) > self.max_entries:
+                    # Bỏ key cũ nhất (dict giữ thứ tự thêm vào)
+                    old = next(iter(self._jobs))
+                    old_job = self._jobs.pop(old)
+                    self.timings.pop(old, None)
+                    if self._users.get(old_job):
+                        self._retired.add(old_job)  # dọn khi phiên cuối cùng trả lại, xem `use`
+                    else:
+                        evicted.append(old_job)
+        for old_job in evicted:
+            # Chưa load xong thì dọn ngay khi xong (callback chạy trên thread nền)
+            old_job.add_done_callback(self._evicted)
+        return job
+
+    def get(self, key, load, *args, **kwargs):
+        return self._result(key, self.preload(key, load, *args, **kwargs))
+
+    def use(self, key, load, *args, **kwargs):
+        """
+        Như `get`, nhưng trả về Lease giữ giá trị tới khi `release` / hết khối
+        `with`: phiên khác có đổi cấu hình (bỏ key này) thì `on_evict` cũng chỉ
+        chạy sau khi phiên cuối cùng trả lại.
+        """
+        with self._lock:
+            job = self.preload(key, load, *args, **kwargs)
+            self._users[job] = self._users.get(job, 0) + 1
+        try:
+            value = self._result(key, job)
+        except BaseException:
+            self._release(job)
+            raise
+        return Lease(self, job, value)
+
+    def _release(self, job):
+        with self._lock:
+            users = self._users.pop(job) - 1
+            if users:
+                self._users[job] = users
+                retired = False
+            else:
+                retired = job in self._retired
+                self._retired.discard(job)
+        if retired:
+            self._evicted(job)
+
+    def _result(self, key, job):
+        try:
+            return job.result()
+        except Exception:
+            with self._lock:
+                if self._jobs.get(key) is job:
+                    del self._jobs[key]
+            raise
+
+    def stats(self):
+        """Thời gian import + thời gian load (gồm warm-up) của từng key."""
+        with self._lock:
+            jobs = dict(self._jobs)
+        models = {}
+        for key, job in jobs.items():
+            name = "/".join(str(k) for k in key) if isinstance(key, tuple) else str(key)
+            if not job.done():
+                models[name] = "loading"
+            elif job.exception() is not None:
+                models[name] = f"error: {job.exception()}"
+            else:
+                models[name] = self.timings.get(key)
+        return {"imports_s": dict(self.imports), "load_s": models}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def cold_start(weights, backend="pytorch", imgsz=640, batch=1, video=None, conf=0.25, classes=None):
+    """
+    Đo cold start trong process hiện tại: load model, warm-up (lần đầu vs lúc ấm)
+    và time-to-first-frame (đọc frame đầu của `video` -> detect -> tracker) khi đã warm-up.
+    """
+    from vision.backends import load_model
+
+    t0 = time.perf_counter()
+    model, actual = load_model(weights, backend, imgsz, batch=batch)
+    report = {"model": weights, "backend": actual, "load_s": round(time.perf_counter() - t0, 3)}
+    latencies = warm_up(model, imgsz, batch)
+    report.update(first_ms=latencies[0], warm_ms=latencies[-1], tracker_ms=warm_tracker())
+    if video is not None:
+        from vision.decode import VideoReader
+        from vision.tracking import make_tracker
+
+        t0 = time.perf_counter()
+        reader = VideoReader(video)
+        ok, frame = reader.read()
+        if ok:
+            tracker = make_tracker()
+            det = model.predict(frame, imgsz=imgsz, conf=conf, classes=classes, verbose=False)[0].boxes.cpu().numpy()
+            tracker.update(det, frame)
+            report["first_frame_s"] = round(time.perf_counter() - t0, 3)
+        reader.release()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tải / export / warm-up model trước và đo thời gian cold start")
+    parser.add_argument("--models", nargs="+", default=["yolov8n.pt"])
+    parser.add_argument("--backend", default="pytorch", choices=BACKENDS)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--video", default=None, help="Đo thêm time-to-first-frame trên frame đầu của video")
+    args = parser.parse_args()
+
+    # Đo import trước tiên: process mới nên đây là thời gian thật
+    print({"imports_s": import_times()})
+    for weights in args.models:
+        print(cold_start(weights, args.backend, args.imgsz, args.batch, args.video))